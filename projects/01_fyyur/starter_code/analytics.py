@@ -0,0 +1,197 @@
+#----------------------------------------------------------------------------#
+# Booking analytics rollups.
+#----------------------------------------------------------------------------#
+
+# Shows per month by area and by genre, and the booked time of every venue
+# per month, are kept in rollup tables so reports never aggregate the shows
+# table. Triggers on shows (statement level, through transition tables, so
+# COPY and bulk deletes pay once per statement) and on the venue and artist
+# columns the rollups use record the months that changed in
+# rollup_dirty_months. `flask fyyur rollups` claims those months and
+# recomputes only them, each month a pruned scan of its own partition, in a
+# single transaction: readers keep seeing the previous figures until it
+# commits. Months of archived partitions keep their rollups.
+
+from datetime import datetime
+from sqlalchemy import text, func
+
+from partitions import add_months, month_start
+
+DIRTY_MONTHS = 'rollup_dirty_months'
+
+# longest report, in months
+REPORT_MAX_MONTHS = 120
+
+ROLLUP_MARK_FUNCTION = f'''
+CREATE OR REPLACE FUNCTION fyyur_mark_rollup_months() RETURNS trigger AS $$
+BEGIN
+  INSERT INTO {DIRTY_MONTHS} (month)
+  SELECT DISTINCT date_trunc('month', start_date) FROM changed_rows
+  ON CONFLICT DO NOTHING;
+  RETURN NULL;
+END
+$$ LANGUAGE plpgsql
+'''
+
+ROLLUP_SHOW_TRIGGERS = [
+  f'''CREATE TRIGGER shows_rollup_{name} AFTER {operation} ON shows
+      REFERENCING {rows} TABLE AS changed_rows
+      FOR EACH STATEMENT EXECUTE PROCEDURE fyyur_mark_rollup_months()'''
+  for name, operation, rows in (('insert', 'INSERT', 'NEW'), ('delete', 'DELETE', 'OLD'),
+                                ('update_old', 'UPDATE', 'OLD'), ('update_new', 'UPDATE', 'NEW'))
+]
+
+# an edit of the columns the rollups group by marks every month of the
+# entity's shows
+ROLLUP_ENTITY_FUNCTION = f'''
+CREATE OR REPLACE FUNCTION fyyur_mark_entity_months() RETURNS trigger AS $$
+BEGIN
+  EXECUTE
+    'INSERT INTO {DIRTY_MONTHS} (month) '
+    'SELECT DISTINCT date_trunc(''month'', start_date) FROM shows '
+    'WHERE ' || quote_ident(TG_ARGV[0]) || ' = $1 '
+    'ON CONFLICT DO NOTHING' USING NEW.id;
+  RETURN NULL;
+END
+$$ LANGUAGE plpgsql
+'''
+
+ROLLUP_ENTITY_TRIGGERS = {
+  'venues': '''CREATE TRIGGER venues_rollup_update AFTER UPDATE OF name, city, state ON venues
+      FOR EACH ROW WHEN (OLD.name IS DISTINCT FROM NEW.name OR OLD.city IS DISTINCT FROM NEW.city
+                         OR OLD.state IS DISTINCT FROM NEW.state)
+      EXECUTE PROCEDURE fyyur_mark_entity_months('venue_id')''',
+  'artists': '''CREATE TRIGGER artists_rollup_update AFTER UPDATE OF genres ON artists
+      FOR EACH ROW WHEN (OLD.genres IS DISTINCT FROM NEW.genres)
+      EXECUTE PROCEDURE fyyur_mark_entity_months('artist_id')'''
+}
+
+MONTH_SHOWS = '''
+  FROM shows JOIN venues ON venues.id = shows.venue_id
+  WHERE shows.start_date >= :month AND shows.start_date < :next
+'''
+BOOKED_MINUTES = 'sum(extract(epoch FROM shows.end_date - shows.start_date) / 60)'
+
+ROLLUP_QUERIES = {
+  'rollup_area_months': f'''
+    INSERT INTO rollup_area_months (month, state, city, show_count, venue_count, booked_minutes)
+    SELECT :month, venues.state, venues.city, count(*), count(DISTINCT shows.venue_id),
+           {BOOKED_MINUTES}
+    {MONTH_SHOWS}
+    GROUP BY venues.state, venues.city
+  ''',
+  # genres are the artist's, a show counts once for each of them
+  'rollup_genre_months': f'''
+    INSERT INTO rollup_genre_months (month, state, city, genre, show_count)
+    SELECT :month, venues.state, venues.city, genre, count(*)
+    FROM shows JOIN venues ON venues.id = shows.venue_id
+    JOIN artists ON artists.id = shows.artist_id
+    CROSS JOIN LATERAL (SELECT DISTINCT unnest(artists.genres) AS genre) AS genres
+    WHERE shows.start_date >= :month AND shows.start_date < :next
+    GROUP BY venues.state, venues.city, genre
+  ''',
+  'rollup_venue_months': f'''
+    INSERT INTO rollup_venue_months (month, venue_id, venue_name, city, state, show_count,
+                                     booked_minutes)
+    SELECT :month, venues.id, venues.name, venues.city, venues.state, count(*), {BOOKED_MINUTES}
+    {MONTH_SHOWS}
+    GROUP BY venues.id
+  '''
+}
+
+'''
+mark_all_months(session)
+    marks every month that has shows, for a full rebuild; archived
+    months are left as they are
+'''
+def mark_all_months(session):
+  session.execute(text(f'''
+    INSERT INTO {DIRTY_MONTHS} (month)
+    SELECT DISTINCT date_trunc('month', start_date) FROM shows
+    ON CONFLICT DO NOTHING
+  '''))
+
+'''
+refresh_rollups(session)
+    recomputes the rollups of the dirty months in one transaction and
+    returns those months; a failed refresh leaves them dirty
+'''
+def refresh_rollups(session):
+  months = sorted(session.execute(text(
+      f'DELETE FROM {DIRTY_MONTHS} RETURNING month')).scalars())
+  for month in months:
+    bounds = {'month': month, 'next': add_months(month, 1)}
+    for table, query in ROLLUP_QUERIES.items():
+      session.execute(text(f'DELETE FROM {table} WHERE month = :month'), bounds)
+      session.execute(text(query), bounds)
+  return months
+
+def month_minutes(month):
+  return (add_months(month, 1) - month).total_seconds() / 60
+
+'''
+analytics_report(session, models, first, last, filters, top)
+    the figures of the months from `first` to `last`, read from the
+    rollups only; filters holds the state and city to narrow them to
+'''
+def analytics_report(session, models, first, last, filters, top=20):
+  AreaRollup, GenreRollup, VenueRollup = models
+
+  def narrow(query, model):
+    query = query.filter(model.month >= first, model.month <= last)
+    if filters['state']:
+      query = query.filter(model.state == filters['state'])
+    if filters['city']:
+      query = query.filter(model.city == filters['city'])
+    return query
+
+  months = narrow(session.query(
+      AreaRollup.month, func.sum(AreaRollup.show_count).label('shows'),
+      func.sum(AreaRollup.venue_count).label('venues')), AreaRollup).group_by(
+      AreaRollup.month).order_by(AreaRollup.month)
+  areas = narrow(session.query(
+      AreaRollup.state, AreaRollup.city, func.sum(AreaRollup.show_count).label('shows')),
+      AreaRollup).group_by(AreaRollup.state, AreaRollup.city).order_by(
+      func.sum(AreaRollup.show_count).desc(), AreaRollup.state, AreaRollup.city).limit(top)
+  genres = narrow(session.query(
+      GenreRollup.genre, func.sum(GenreRollup.show_count).label('shows')),
+      GenreRollup).group_by(GenreRollup.genre).order_by(
+      func.sum(GenreRollup.show_count).desc(), GenreRollup.genre).limit(top)
+  minutes = sum(month_minutes(month) for month in month_range(first, last))
+  venues = narrow(session.query(
+      VenueRollup.venue_id, func.max(VenueRollup.venue_name).label('name'),
+      func.sum(VenueRollup.show_count).label('shows'),
+      func.sum(VenueRollup.booked_minutes).label('booked_minutes')), VenueRollup).group_by(
+      VenueRollup.venue_id).order_by(
+      func.sum(VenueRollup.booked_minutes).desc(), VenueRollup.venue_id).limit(top)
+
+  return {
+    'months': [{'month': row.month.strftime('%Y-%m'), 'shows': int(row.shows),
+                'venues': int(row.venues)} for row in months],
+    'areas': [{'state': row.state, 'city': row.city, 'shows': int(row.shows)} for row in areas],
+    'genres': [{'genre': row.genre, 'shows': int(row.shows)} for row in genres],
+    'venues': [{'id': row.venue_id, 'name': row.name, 'shows': int(row.shows),
+                'utilization': round(float(row.booked_minutes) / minutes, 4)} for row in venues]
+  }
+
+def month_range(first, last):
+  month = first
+  while month <= last:
+    yield month
+    month = add_months(month, 1)
+
+'''
+report_months(args, now, default)
+    the first and last month of ?from=YYYY-MM and ?to=YYYY-MM, the
+    `default` months up to the current one otherwise; raises ValueError
+    on bad months and on ranges over REPORT_MAX_MONTHS
+'''
+def report_months(args, now, default=12):
+  last = datetime.strptime(args['to'], '%Y-%m') if args.get('to') else month_start(now)
+  first = datetime.strptime(args['from'], '%Y-%m') if args.get('from') else add_months(last, 1 - default)
+  months = (last.year - first.year) * 12 + last.month - first.month + 1
+  if not 0 < months <= REPORT_MAX_MONTHS:
+    raise ValueError('invalid range')
+  # the report reads up to the end of `last`, which must be a valid date
+  add_months(last, 1)
+  return first, last
@@ -2,29 +2,72 @@
 # Imports
 #----------------------------------------------------------------------------#
 
+import os
+import sys
 import json
+import click
 import dateutil.parser
-import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for, abort
+from flask import Flask, Blueprint, current_app, render_template, stream_template, stream_with_context, request, Response, flash, redirect, url_for, abort, session, jsonify
+from flask.cli import AppGroup
 from flask_moment import Moment
 from flask_migrate import Migrate
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy.orm import load_only
-from sqlalchemy import func
+from sqlalchemy.orm import load_only, contains_eager
+from sqlalchemy import func, event, DDL
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from portable import StringArray
 import logging
 from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
-from datetime import datetime
+from search import search, SEARCH_VECTOR_FUNCTION, SEARCH_VECTOR_TRIGGER
+from counters import count_show, roll_over, recount, verify_counters
+from pagination import keyset_page
+from cache import FragmentCache, SharedCache
+from profiling import RequestProfiler, setup_queue_logging
+from formatting import format_datetime
+from browsing import browse_filters, apply_filters, facet_key, genre_facets, facet_list
+from routing import RoutingSession, replica_reads, primary_reads, init_routing
+from deletion import delete_entities
+from recommendations import Recommender, RECOMMENDATIONS
+from listings import calendar_range, calendar_query, calendar_days, ical_feed
+from autocomplete import Autocomplete, AUTOCOMPLETE_RESULTS, AUTOCOMPLETE_MAX_RESULTS
+from booking import (BOOKING_CONSTRAINTS, booking_constraints, show_end_date,
+                     check_availability, booking_conflicts)
+from partitions import (DEFAULT_PARTITION, DEFAULT_PARTITION_DDL, PARTITIONS_AHEAD,
+                        ensure_partitions, archive_partitions, add_months, month_start)
+from assets import StaticAssets, build_assets, DIST_FOLDER
+from compression import ResponseCompression
+from changes import ChangeFeed
+from conditional import ChangeVersions, wants_json, JSON_MIMETYPE
+from analytics import (ROLLUP_MARK_FUNCTION, ROLLUP_SHOW_TRIGGERS, ROLLUP_ENTITY_FUNCTION,
+                       ROLLUP_ENTITY_TRIGGERS, mark_all_months, refresh_rollups,
+                       analytics_report, report_months)
+from importer import (BATCH_SIZE, Checkpoint, read_records, form_validator,
+                      reference_resolver, import_records)
+from datetime import datetime, date, timezone
+from itertools import groupby
+from werkzeug.datastructures import MultiDict
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
 
-app = Flask(__name__)
-moment = Moment(app)
-app.config.from_object('config')
-db = SQLAlchemy(app)
-migrate = Migrate(app, db)
+# Apps are built by create_app() below, which sets up these extensions
+# with the app's config. The caches, table versions, change feed and
+# recommender hold the state of the process: the last app built is the one
+# they serve.
+
+views = Blueprint('main', __name__)
+moment = Moment()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+migrate = Migrate()
+static_assets = StaticAssets()
+fragment_cache = FragmentCache()
+# table versions behind the ETags, shared by the workers when the cache is
+change_versions = ChangeVersions(salt=lambda: static_assets.version)
+profiler = RequestProfiler()
+compression = ResponseCompression()
 
 #----------------------------------------------------------------------------#
 # Models.
@@ -39,13 +82,23 @@ class Venue(db.Model):
     state = db.Column(db.String(120), nullable=False)
     address = db.Column(db.String(120), nullable=True)
     phone = db.Column(db.String(120), nullable=True)
-    genres = db.Column(db.ARRAY(db.String(120)), nullable=False, default=[])
+    genres = db.Column(StringArray(120), nullable=False, default=[])
     image_link = db.Column(db.String(500), nullable=True)
     facebook_link = db.Column(db.String(120), nullable=True)
     website = db.Column(db.String(120), nullable=True)
     seeking_talent = db.Column(db.Boolean, nullable=False, default=False)
     seeking_description = db.Column(db.String(120), nullable=True)
-    shows = db.relationship('Show', backref='venue', lazy=True)
+    search_vector = db.Column(db.Text().with_variant(TSVECTOR(), 'postgresql'), nullable=True)
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    next_show_date = db.Column(db.DateTime, nullable=True)
+    shows = db.relationship('Show', backref='venue', lazy=True, passive_deletes=True)
+
+    __table_args__ = (
+        db.Index('ix_venues_search_vector', 'search_vector', postgresql_using='gin'),
+        db.Index('ix_venues_area_name_id', 'state', 'city', 'name', 'id'),
+        db.Index('ix_venues_genres', 'genres', postgresql_using='gin'),
+    )
 
 class Artist(db.Model):
     __tablename__ = 'artists'
@@ -55,42 +108,266 @@ class Artist(db.Model):
     city = db.Column(db.String(120), nullable=False)
     state = db.Column(db.String(120), nullable=False)
     phone = db.Column(db.String(120), nullable=True)
-    genres = db.Column(db.ARRAY(db.String(120)), nullable=False, default=[])
+    genres = db.Column(StringArray(120), nullable=False, default=[])
     image_link = db.Column(db.String(500), nullable=True)
     facebook_link = db.Column(db.String(120), nullable=True)
     seeking_venue = db.Column(db.Boolean, nullable=False, default=False)
     seeking_description = db.Column(db.String(120), nullable=True)
-    shows = db.relationship('Show', backref='artist', lazy=True)
+    search_vector = db.Column(db.Text().with_variant(TSVECTOR(), 'postgresql'), nullable=True)
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    next_show_date = db.Column(db.DateTime, nullable=True)
+    shows = db.relationship('Show', backref='artist', lazy=True, passive_deletes=True)
+
+    __table_args__ = (
+        db.Index('ix_artists_search_vector', 'search_vector', postgresql_using='gin'),
+        db.Index('ix_artists_name_id', 'name', 'id'),
+        db.Index('ix_artists_genres', 'genres', postgresql_using='gin'),
+        db.Index('ix_artists_state_city', 'state', 'city'),
+    )
+
+def default_end_date(context):
+    return show_end_date(context.get_current_parameters()['start_date'])
 
 class Show(db.Model):
     __tablename__ = 'shows'
 
-    id = db.Column(db.Integer, primary_key=True)
-    start_date = db.Column(db.DateTime, nullable=False)
+    # the partition key has to be part of the table's primary key
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    start_date = db.Column(db.DateTime, primary_key=True, nullable=False)
+    end_date = db.Column(db.DateTime, nullable=False, default=default_end_date)
     venue_id = db.Column(db.Integer, db.ForeignKey(
-        'venues.id'), nullable=False)
+        'venues.id', ondelete='CASCADE'), nullable=False)
     artist_id = db.Column(db.Integer, db.ForeignKey(
-        'artists.id'), nullable=False)
+        'artists.id', ondelete='CASCADE'), nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_shows_start_date_id', 'start_date', 'id'),
+        db.Index('ix_shows_venue_id_start_date', 'venue_id', 'start_date'),
+        db.Index('ix_shows_artist_id_start_date', 'artist_id', 'start_date'),
+        {'postgresql_partition_by': 'RANGE (start_date)'}
+    )
+    __mapper_args__ = {'primary_key': [id]}
+
+# analytics rollups, rebuilt month by month by `flask fyyur rollups`
+
+class AreaRollup(db.Model):
+    __tablename__ = 'rollup_area_months'
+
+    month = db.Column(db.DateTime, primary_key=True)
+    state = db.Column(db.String(120), primary_key=True)
+    city = db.Column(db.String(120), primary_key=True)
+    show_count = db.Column(db.Integer, nullable=False)
+    venue_count = db.Column(db.Integer, nullable=False)
+    booked_minutes = db.Column(db.Float, nullable=False)
+
+class GenreRollup(db.Model):
+    __tablename__ = 'rollup_genre_months'
+
+    month = db.Column(db.DateTime, primary_key=True)
+    state = db.Column(db.String(120), primary_key=True)
+    city = db.Column(db.String(120), primary_key=True)
+    genre = db.Column(db.String(120), primary_key=True)
+    show_count = db.Column(db.Integer, nullable=False)
+
+class VenueRollup(db.Model):
+    __tablename__ = 'rollup_venue_months'
+
+    # no foreign key: deleted venues stay in the figures of their months
+    # until those are refreshed
+    month = db.Column(db.DateTime, primary_key=True)
+    venue_id = db.Column(db.Integer, primary_key=True)
+    venue_name = db.Column(db.String(), nullable=False)
+    city = db.Column(db.String(120), nullable=False)
+    state = db.Column(db.String(120), nullable=False)
+    show_count = db.Column(db.Integer, nullable=False)
+    booked_minutes = db.Column(db.Float, nullable=False)
+
+class RollupDirtyMonth(db.Model):
+    __tablename__ = 'rollup_dirty_months'
+
+    month = db.Column(db.DateTime, primary_key=True)
+
+# DDL run after create_all, on postgres only: other databases get the
+# tables without triggers, partitions or exclusion constraints
+def postgres_ddl(table, ddl):
+    event.listen(table, 'after_create', DDL(ddl).execute_if(dialect='postgresql'))
+
+# keep search vectors in sync when the tables are created outside of migrations
+for table in (Venue.__table__, Artist.__table__):
+    postgres_ddl(table, SEARCH_VECTOR_FUNCTION)
+    postgres_ddl(table, SEARCH_VECTOR_TRIGGER.format(table=table.name))
+# monthly partitions are added by `flask fyyur partitions`
+postgres_ddl(Show.__table__, DEFAULT_PARTITION_DDL)
+for ddl in booking_constraints(DEFAULT_PARTITION):
+    postgres_ddl(Show.__table__, ddl)
+# changes to shows, and to the venue and artist columns the rollups group
+# by, mark their months for the next rollup refresh
+postgres_ddl(Show.__table__, ROLLUP_MARK_FUNCTION)
+for ddl in ROLLUP_SHOW_TRIGGERS:
+    postgres_ddl(Show.__table__, ddl)
+for table in (Venue.__table__, Artist.__table__):
+    postgres_ddl(table, ROLLUP_ENTITY_FUNCTION)
+    postgres_ddl(table, ROLLUP_ENTITY_TRIGGERS[table.name])
 
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format)
+views.add_app_template_filter(format_datetime, 'datetime')
+
+'''
+url_for_page(**args)
+    url of the current page with its query string updated by `args`,
+    used to keep the list filters across pages
+'''
+def url_for_page(**args):
+  params = request.args.to_dict(flat=False)
+  params.pop('after', None)
+  params.pop('before', None)
+  params.update(args)
+  return url_for(request.endpoint, **params)
+
+views.add_app_template_global(url_for_page)
+
+#----------------------------------------------------------------------------#
+# Cache invalidation.
+#----------------------------------------------------------------------------#
+
+# Writes publish what they changed on the change feed, in their own
+# transaction. Once it commits the change is applied here and, through the
+# feed's listener thread, in every other worker.
+
+def apply_change(tables, venue_ids, artist_ids, remote):
+  # a shared cache was already updated by the worker that made the change
+  if not (remote and isinstance(fragment_cache.backend, SharedCache)):
+    if venue_ids is None or artist_ids is None:
+      fragment_cache.clear()
+    else:
+      fragment_cache.invalidate('venue', *venue_ids)
+      fragment_cache.invalidate('artist', *artist_ids)
+    change_versions.touch(*tables)
+  if venue_ids is None or artist_ids is None:
+    recommender.expire()
+    name_index.expire()
+  else:
+    recommender.refresh('venue', *venue_ids)
+    recommender.refresh('artist', *artist_ids)
+    name_index.refresh('venue', *venue_ids)
+    name_index.refresh('artist', *artist_ids)
+
+change_feed = ChangeFeed(None, apply_change)
+
+@views.before_app_request
+def start_change_feed():
+  # once per worker process
+  change_feed.start()
+
+# artist pages show the venues they play at and venue pages the artists
+# playing there, so an edit reaches the pages on the other side of its shows
+
+def invalidate_venue(venue_id):
+  artist_ids = [show.artist_id for show in db.session.query(
+      Show.artist_id).filter(Show.venue_id == venue_id).distinct()]
+  change_feed.publish(db.session, ['venues'], [venue_id], artist_ids)
+
+def invalidate_artist(artist_id):
+  venue_ids = [show.venue_id for show in db.session.query(
+      Show.venue_id).filter(Show.artist_id == artist_id).distinct()]
+  change_feed.publish(db.session, ['artists'], venue_ids, [artist_id])
+
+# deleting venues takes their shows away from the artists that played
+# there, and the other way round
+
+def deleted_venues(session, venue_ids, artist_ids):
+  recount(session, Artist, Show, Show.artist_id, datetime.now(), artist_ids)
+  change_feed.publish(session, ['venues', 'artists', 'shows'], venue_ids, artist_ids)
+
+def deleted_artists(session, artist_ids, venue_ids):
+  recount(session, Venue, Show, Show.venue_id, datetime.now(), venue_ids)
+  change_feed.publish(session, ['venues', 'artists', 'shows'], venue_ids, artist_ids)
+
+def archived_shows(session, venue_ids, artist_ids):
+  now = datetime.now()
+  recount(session, Venue, Show, Show.venue_id, now, venue_ids)
+  recount(session, Artist, Show, Show.artist_id, now, artist_ids)
+  change_feed.publish(session, ['venues', 'artists', 'shows'], venue_ids, artist_ids)
+
+#----------------------------------------------------------------------------#
+# Recommendations.
+#----------------------------------------------------------------------------#
+
+recommender = Recommender(Venue, Artist, Show)
+
+#----------------------------------------------------------------------------#
+# Autocomplete.
+#----------------------------------------------------------------------------#
+
+name_index = Autocomplete(Venue, Artist)
+
+#----------------------------------------------------------------------------#
+# Streaming.
+#----------------------------------------------------------------------------#
+
+# rows fetched from a server-side cursor per batch when a list is streamed
+STREAM_BATCH_SIZE = 500
+# size of the chunks sent to the client while a template is streamed
+STREAM_CHUNK_SIZE = 16 * 1024
 
-app.jinja_env.filters['datetime'] = format_datetime
+'''
+stream_page(template_name, **context)
+    renders a template into a streamed response; jinja yields a piece per
+    template event so they are grouped into chunks before being sent, but
+    the layout head goes out on its own so the browser fetches the
+    stylesheets while the rows are rendered
+'''
+def stream_page(template_name, **context):
+  # the request context is bound here, the pieces are produced on iteration
+  pieces = stream_template(template_name, **context)
+
+  def chunks():
+    buffer = []
+    size = 0
+    head = True
+    for piece in pieces:
+      buffer.append(piece)
+      size += len(piece)
+      if size >= STREAM_CHUNK_SIZE or (head and '</head>' in piece):
+        head = False
+        yield ''.join(buffer)
+        buffer = []
+        size = 0
+    if buffer:
+      yield ''.join(buffer)
+  return Response(chunks(), mimetype='text/html')
+
+'''
+stream_json(key, items)
+    streams {"success": true, key: [items]} without holding the list
+'''
+def stream_json(key, items):
+  def chunks():
+    yield '{"success": true, "%s": [' % key
+    buffer = []
+    size = 0
+    for index, item in enumerate(items):
+      piece = (',' if index else '') + json.dumps(item)
+      buffer.append(piece)
+      size += len(piece)
+      if size >= STREAM_CHUNK_SIZE:
+        yield ''.join(buffer)
+        buffer = []
+        size = 0
+    buffer.append(']}')
+    yield ''.join(buffer)
+  # the rows are fetched on iteration, after the view has returned
+  return Response(stream_with_context(chunks()), mimetype='application/json')
 
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
 
-@app.route('/')
+@views.route('/')
 def index():
   return render_template('pages/home.html')
 
@@ -101,69 +378,84 @@ def index():
 #  Venues list
 #  ----------------------------------------------------------------
 
-@app.route('/venues')
-def venues():
+'''
+browse_facets(model, filters)
+    genre facets of a filter set, counted once per change of the table and
+    kept in the fragment cache
+'''
+def browse_facets(model, filters):
+  table = model.__tablename__
+  key = facet_key(filters)
+  version = f"{fragment_cache.version(f'{table}-facets', key)}.{change_versions.get(table)[0]}"
+  facets = fragment_cache.get(f'{table}-facets', key, version)
+  if facets is not None:
+    return json.loads(facets)
+  # cached counts from a lagging replica would outlive the lag
+  primary_reads()
+  facets = genre_facets(db.session, model, filters)
+  fragment_cache.set(f'{table}-facets', key, json.dumps(facets), version)
+  return facets
+
+def venue_areas(after=None, before=None, filters=None):
   areasData = [] # empty array to store all the data we need
-  # query to retreive all the areas in the system
-  areas = Venue.query.with_entities(Venue.state, Venue.city, func.count(
-      Venue.id)).group_by(Venue.state, Venue.city).all()
-
-  for area in areas:
-    venuesData = [] # empty array to store areas data
-    # query to retreive venue data in each area
-    venues = Venue.query.filter_by(state=area.state, city=area.city).all()
-
-    for venue in venues:
-      # query to get upcoming shows for the venue
-      upcoming_shows = Show.query.filter_by(id=venue.id).filter(
-          Show.start_date > datetime.now()).all()
-      # append venue data to the array
-      venuesData.append({
-        "id": venue.id,
-        "name": venue.name,
-        "num_upcoming_shows": len(upcoming_shows)
-      })
-
+  filters = filters or browse_filters(MultiDict())
+  # single query to retreive a page of venues with their upcoming shows
+  # count, ordered by area so the rows can be grouped in one pass
+  query = apply_filters(db.session.query(
+      Venue.id, Venue.name, Venue.city, Venue.state,
+      Venue.upcoming_shows_count.label('num_upcoming_shows')), Venue, filters)
+  venues, prev_cursor, next_cursor = keyset_page(
+      query, [Venue.state, Venue.city, Venue.name, Venue.id], after, before)
+
+  for (state, city), rows in groupby(venues, key=lambda venue: (venue.state, venue.city)):
     # append area data to the array
     areasData.append({
-      "city": area.city,
-      "state": area.state,
-      "venues": venuesData
+      "city": city,
+      "state": state,
+      "venues": [{
+        "id": venue.id,
+        "name": venue.name,
+        "num_upcoming_shows": venue.num_upcoming_shows
+      } for venue in rows]
     })
 
-  return render_template('pages/venues.html', areas=areasData)
+  facets = facet_list(browse_facets(Venue, filters), filters)
+  return areasData, prev_cursor, next_cursor, facets
+
+@views.route('/venues')
+@replica_reads
+@change_versions.conditional('venues')
+def venues():
+  filters = browse_filters(request.args)
+  try:
+    areas, prev_cursor, next_cursor, facets = venue_areas(
+        request.args.get('after'), request.args.get('before'), filters)
+  except ValueError:
+    abort(400)
+  if wants_json():
+    return jsonify({
+      'success': True,
+      'areas': areas,
+      'facets': [{'genre': genre, 'count': count} for genre, count in facets],
+      'prev_cursor': prev_cursor,
+      'next_cursor': next_cursor
+    })
+  return render_template('pages/venues.html', areas=areas, filters=filters, facets=facets,
+                         prev_cursor=prev_cursor, next_cursor=next_cursor)
 
 #  Search Venue
 #  ----------------------------------------------------------------
 
-@app.route('/venues/search', methods=['POST'])
+@views.route('/venues/search', methods=['POST'])
+@replica_reads
 def search_venues():
   error = False
   try:
-    responseData = {}  # empty object to store all the data we need
     # get input from search bar
     search_term = request.form.get('search_term', '')
-    # query to search for the input
-    venues = Venue.query.filter(
-        Venue.name.ilike(f'%{search_term}%')).all()
-
-    venuesData = []  # empty array to store venues data
-
-    for venue in venues:
-      body = {} # body item of one venue
-      # query to get upcoming shows for the venue
-      upcoming_shows = Show.query.filter_by(id=venue.id).filter(
-          Show.start_date > datetime.now()).all()
-      # assign values to body
-      body['id'] = venue.id
-      body['name'] = venue.name
-      body['num_upcoming_shows'] = len(upcoming_shows)
-      # append venue data to the array
-      venuesData.append(body)
-
-    # append response data to the object
-    responseData['count'] = len(venues)
-    responseData['data'] = venuesData
+    # ranked search with the upcoming shows count of each venue
+    responseData = search(db.session, Venue, search_term,
+                          page=request.form.get('page', 1, type=int))
   except:
     error = True
   if error:
@@ -175,46 +467,57 @@ def search_venues():
 #  Show Venue
 #  ----------------------------------------------------------------
 
-@app.route('/venues/<int:venue_id>')
+@views.route('/venues/<int:venue_id>')
+@replica_reads
+@change_versions.conditional('venues', 'artists', 'shows')
 def show_venue(venue_id):
+  # serve the rendered page from the cache, unless it has flashed
+  # messages to display or JSON is asked for
+  as_json = wants_json()
+  cacheable = '_flashes' not in session and not as_json
+  if cacheable:
+    version = fragment_cache.version('venue', venue_id)
+    html = fragment_cache.get('venue', venue_id, version)
+    if html is not None:
+      return html
+    # a page rendered from a lagging replica would be cached past the lag
+    primary_reads()
+
   error = False
   try:
     venueData = {}  # empty object to store all the data we need
-    # query to get specific venue
-    venue = Venue.query.get(venue_id)
+    # single query to get the venue with all its shows and their artists
+    venue = Venue.query.outerjoin(Venue.shows).outerjoin(Show.artist).options(
+        load_only(Venue.id, Venue.name, Venue.city, Venue.state, Venue.address,
+                  Venue.phone, Venue.image_link, Venue.facebook_link, Venue.genres,
+                  Venue.website, Venue.seeking_talent, Venue.seeking_description),
+        contains_eager(Venue.shows).load_only(Show.id, Show.start_date, Show.artist_id),
+        contains_eager(Venue.shows).contains_eager(Show.artist).load_only(
+            Artist.id, Artist.name, Artist.image_link)
+    ).filter(Venue.id == venue_id).order_by(Show.start_date).all()
     if not venue:
+      if as_json:
+        return not_found_error(None)
       # render 404 if not found
       return render_template('errors/404.html')
+    venue = venue[0]
 
     upcomingData = [] # empty array to store shows data
-    # query to get upcoming shows for this venue
-    upcomingShows = Show.query.join(Artist).filter(
-        Show.venue_id == venue_id).filter(Show.start_date > datetime.now()).all()
-
-    for show in upcomingShows:
-      body = {}  # body item of one show
-      # assign values to body
-      body['artist_id'] = show.artist_id
-      body['artist_name'] = show.artist.name
-      body['artist_image_link'] = show.artist.image_link
-      body['start_date'] = show.start_date.strftime('%Y-%m-%d %H:%M:%S')
-      # append show data to the array
-      upcomingData.append(body)
-
     pastData = []  # empty array to store shows data
-    # query to get past shows for this venue
-    pastShows = Show.query.join(Artist).filter(
-        Show.venue_id == venue_id).filter(Show.start_date < datetime.now()).all()
+    now = datetime.now()
 
-    for show in pastShows:
+    for show in venue.shows:
       body = {}  # body item of one show
       # assign values to body
       body['artist_id'] = show.artist_id
       body['artist_name'] = show.artist.name
       body['artist_image_link'] = show.artist.image_link
       body['start_date'] = show.start_date.strftime('%Y-%m-%d %H:%M:%S')
-      # append show data to the array
-      pastData.append(body)
+      # append show data to the upcoming or past array
+      if show.start_date > now:
+        upcomingData.append(body)
+      else:
+        pastData.append(body)
 
     # assign venue data values
     venueData['id'] = venue.id
@@ -238,18 +541,23 @@ def show_venue(venue_id):
   if error:
     # render 500 if there is a server error
     return render_template('errors/500.html')
+  elif as_json:
+    return jsonify({'success': True, 'venue': venueData})
   else:
-    return render_template('pages/show_venue.html', venue=venueData)
+    html = render_template('pages/show_venue.html', venue=venueData)
+    if cacheable:
+      fragment_cache.set('venue', venue_id, html, version)
+    return html
 
 #  Create Venue
 #  ----------------------------------------------------------------
 
-@app.route('/venues/create', methods=['GET'])
+@views.route('/venues/create', methods=['GET'])
 def create_venue_form():
   form = VenueForm()
   return render_template('forms/new_venue.html', form=form)
 
-@app.route('/venues/create', methods=['POST'])
+@views.route('/venues/create', methods=['POST'])
 def create_venue_submission():
   error = False
   try:
@@ -270,6 +578,8 @@ def create_venue_submission():
     )
 
     db.session.add(venue)
+    db.session.flush()
+    change_feed.publish(db.session, ['venues'], [venue.id])
     db.session.commit()
   except:
     error = True
@@ -287,16 +597,16 @@ def create_venue_submission():
 #  Delete Venue
 #  ----------------------------------------------------------------
 
-@app.route('/venues/<venue_id>/delete', methods=['POST'])
+@views.route('/venues/<int:venue_id>/delete', methods=['POST'])
 def delete_venue(venue_id):
   error = False
+  name = str(venue_id)
   try:
-    # query to get specific venue
-    venue = Venue.query.get(venue_id)
-    name = venue.name
-
-    db.session.delete(venue)
-    db.session.commit()
+    # query to get the name, the venue and its shows are deleted server-side
+    name = db.session.query(Venue.name).filter(Venue.id == venue_id).scalar() or name
+    if not delete_entities(db.session, Venue, Show.venue_id, Show.artist_id, [venue_id],
+                           after_batch=deleted_venues):
+      error = True
   except:
     error = True
     db.session.rollback()
@@ -309,10 +619,33 @@ def delete_venue(venue_id):
     flash('Venue ' + name + ' was successfully deleted!')
   return render_template('pages/home.html')
 
+@views.route('/venues/delete', methods=['POST'])
+def delete_venues():
+  # body: {"ids": [1, 2, ...]}
+  body = request.get_json(silent=True) or {}
+  try:
+    ids = [int(venue_id) for venue_id in body['ids']]
+  except (KeyError, TypeError, ValueError):
+    abort(400)
+
+  try:
+    deleted = delete_entities(db.session, Venue, Show.venue_id, Show.artist_id, ids,
+                              after_batch=deleted_venues)
+  except:
+    db.session.rollback()
+    current_app.logger.exception('bulk delete of venues failed')
+    abort(422)
+  finally:
+    db.session.close()
+  return jsonify({
+    'success': True,
+    'deleted': deleted
+  })
+
 #  Edit Venue
 #  ----------------------------------------------------------------
 
-@app.route('/venues/<int:venue_id>/edit', methods=['GET'])
+@views.route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
   error = False
   try:
@@ -345,7 +678,7 @@ def edit_venue(venue_id):
   else:
     return render_template('forms/edit_venue.html', form=form, venue=venueData)
 
-@app.route('/venues/<int:venue_id>/edit', methods=['POST'])
+@views.route('/venues/<int:venue_id>/edit', methods=['POST'])
 def edit_venue_submission(venue_id):
   error = False
   try:
@@ -365,6 +698,7 @@ def edit_venue_submission(venue_id):
     venue.seeking_talent = True if 'seeking_talent' in request.form else False
     venue.seeking_description = request.form.get('seeking_description', '')
 
+    invalidate_venue(venue_id)
     db.session.commit()
   except:
     error = True
@@ -377,7 +711,23 @@ def edit_venue_submission(venue_id):
           name + ' could not be Edited.')
   else:
     flash('Venue ' + name + ' was successfully Edited!')
-  return redirect(url_for('show_venue', venue_id=venue_id))
+  return redirect(url_for('main.show_venue', venue_id=venue_id))
+
+#  Recommended Artists
+#  ----------------------------------------------------------------
+
+@views.route('/venues/<int:venue_id>/recommendations')
+@replica_reads
+def venue_recommendations(venue_id):
+  recommended = recommender.recommend(db.session, 'venue', venue_id,
+                                      request.args.get('k', RECOMMENDATIONS, type=int))
+  if recommended is None:
+    abort(404)
+  return jsonify({
+    'success': True,
+    'venue_id': venue_id,
+    'artists': [{'id': id, 'name': name, 'score': score} for id, name, score in recommended]
+  })
 
 #  ----------------------------------------------------------------
 #  Artists
@@ -386,54 +736,56 @@ def edit_venue_submission(venue_id):
 #  Artists list
 #  ----------------------------------------------------------------
 
-@app.route('/artists')
+@views.route('/artists')
+@replica_reads
+@change_versions.conditional('artists')
 def artists():
-  data = []  # empty array to store all the data we need
-  # query to retreive all artists
-  artists = Artist.query.all()
+  filters = browse_filters(request.args)
+  # query to retreive the artists
+  query = apply_filters(db.session.query(Artist.id, Artist.name), Artist, filters)
+
+  if request.args.get('all'):
+    # stream every artist, rows are fetched while the page is sent
+    artists = query.order_by(Artist.name, Artist.id).yield_per(STREAM_BATCH_SIZE)
+    data = ({'id': artist.id, 'name': artist.name} for artist in artists)
+    if wants_json():
+      return stream_json('artists', data)
+    return stream_page('pages/artists.html', artists=data, filters=filters)
 
-  for artist in artists:
-    body = {}  # empty object to store artist data
-    # append venue data to the array
-    body['id'] = artist.id
-    body['name'] = artist.name
-
-    # append artist data to the array
-    data.append(body)
-
-  return render_template('pages/artists.html', artists=data)
+  try:
+    artists, prev_cursor, next_cursor = keyset_page(
+        query, [Artist.name, Artist.id],
+        request.args.get('after'), request.args.get('before'))
+  except ValueError:
+    abort(400)
+
+  data = [{'id': artist.id, 'name': artist.name} for artist in artists]
+  facets = facet_list(browse_facets(Artist, filters), filters)
+
+  if wants_json():
+    return jsonify({
+      'success': True,
+      'artists': data,
+      'facets': [{'genre': genre, 'count': count} for genre, count in facets],
+      'prev_cursor': prev_cursor,
+      'next_cursor': next_cursor
+    })
+  return render_template('pages/artists.html', artists=data, filters=filters, facets=facets,
+                         prev_cursor=prev_cursor, next_cursor=next_cursor)
 
 #  Search Artists
 #  ----------------------------------------------------------------
 
-@app.route('/artists/search', methods=['POST'])
+@views.route('/artists/search', methods=['POST'])
+@replica_reads
 def search_artists():
   error = False
   try:
-    responseData = {}  # empty object to store all the data we need
     # get input from search bar
     search_term = request.form.get('search_term', '')
-    # query to search for the input
-    artists = Artist.query.filter(
-        Artist.name.ilike(f'%{search_term}%')).all()
-
-    artistsData = []  # empty array to store artists data
-
-    for artist in artists:
-      body = {}  # body item of one artist
-      # query to get upcoming shows for the artist
-      upcoming_shows = Show.query.filter_by(id=artist.id).filter(
-          Show.start_date > datetime.now()).all()
-      # assign values to body
-      body['id'] = artist.id
-      body['name'] = artist.name
-      body['num_upcoming_shows'] = len(upcoming_shows)
-      # append artist data to the array
-      artistsData.append(body)
-
-    # append response data to the object
-    responseData['count'] = len(artists)
-    responseData['data'] = artistsData
+    # ranked search with the upcoming shows count of each artist
+    responseData = search(db.session, Artist, search_term,
+                          page=request.form.get('page', 1, type=int))
   except:
     error = True
   if error:
@@ -445,46 +797,57 @@ def search_artists():
 #  Show Artist
 #  ----------------------------------------------------------------
 
-@app.route('/artists/<int:artist_id>')
+@views.route('/artists/<int:artist_id>')
+@replica_reads
+@change_versions.conditional('venues', 'artists', 'shows')
 def show_artist(artist_id):
+  # serve the rendered page from the cache, unless it has flashed
+  # messages to display or JSON is asked for
+  as_json = wants_json()
+  cacheable = '_flashes' not in session and not as_json
+  if cacheable:
+    version = fragment_cache.version('artist', artist_id)
+    html = fragment_cache.get('artist', artist_id, version)
+    if html is not None:
+      return html
+    # a page rendered from a lagging replica would be cached past the lag
+    primary_reads()
+
   error = False
   try:
     artistData = {}  # empty object to store all the data we need
-    # query to get specific artist
-    artist = Artist.query.get(artist_id)
+    # single query to get the artist with all its shows and their venues
+    artist = Artist.query.outerjoin(Artist.shows).outerjoin(Show.venue).options(
+        load_only(Artist.id, Artist.name, Artist.city, Artist.state, Artist.phone,
+                  Artist.genres, Artist.image_link, Artist.facebook_link,
+                  Artist.seeking_venue, Artist.seeking_description),
+        contains_eager(Artist.shows).load_only(Show.id, Show.start_date, Show.venue_id),
+        contains_eager(Artist.shows).contains_eager(Show.venue).load_only(
+            Venue.id, Venue.name, Venue.image_link)
+    ).filter(Artist.id == artist_id).order_by(Show.start_date).all()
     if not artist:
+      if as_json:
+        return not_found_error(None)
       # render 404 if not found
       return render_template('errors/404.html')
+    artist = artist[0]
 
     upcomingData = []  # empty array to store shows data
-    # query to get upcoming shows for this artist
-    upcomingShows = Show.query.join(Venue).filter(
-        Show.artist_id == artist_id).filter(Show.start_date > datetime.now()).all()
-
-    for show in upcomingShows:
-      body = {}  # body item of one show
-      # assign values to body
-      body['venue_id'] = show.venue_id
-      body['venue_name'] = show.venue.name
-      body['venue_image_link'] = show.venue.image_link
-      body['start_date'] = show.start_date.strftime('%Y-%m-%d %H:%M:%S')
-      # append show data to the array
-      upcomingData.append(body)
-
     pastData = []  # empty array to store shows data
-    # query to get past shows for this artist
-    pastShows = Show.query.join(Venue).filter(
-        Show.artist_id == artist_id).filter(Show.start_date < datetime.now()).all()
+    now = datetime.now()
 
-    for show in pastShows:
+    for show in artist.shows:
       body = {}  # body item of one show
       # assign values to body
       body['venue_id'] = show.venue_id
       body['venue_name'] = show.venue.name
       body['venue_image_link'] = show.venue.image_link
       body['start_date'] = show.start_date.strftime('%Y-%m-%d %H:%M:%S')
-      # append show data to the array
-      pastData.append(body)
+      # append show data to the upcoming or past array
+      if show.start_date > now:
+        upcomingData.append(body)
+      else:
+        pastData.append(body)
 
     # assign artist data values
     artistData['id'] = artist.id
@@ -506,18 +869,23 @@ def show_artist(artist_id):
   if error:
     # render 500 if there is a server error
     return render_template('errors/500.html')
+  elif as_json:
+    return jsonify({'success': True, 'artist': artistData})
   else:
-    return render_template('pages/show_artist.html', artist=artistData)
+    html = render_template('pages/show_artist.html', artist=artistData)
+    if cacheable:
+      fragment_cache.set('artist', artist_id, html, version)
+    return html
 
 #  Create Artist
 #  ----------------------------------------------------------------
 
-@app.route('/artists/create', methods=['GET'])
+@views.route('/artists/create', methods=['GET'])
 def create_artist_form():
   form = ArtistForm()
   return render_template('forms/new_artist.html', form=form)
 
-@app.route('/artists/create', methods=['POST'])
+@views.route('/artists/create', methods=['POST'])
 def create_artist_submission():
   error = False
   try:
@@ -536,6 +904,8 @@ def create_artist_submission():
     )
 
     db.session.add(artist)
+    db.session.flush()
+    change_feed.publish(db.session, ['artists'], artist_ids=[artist.id])
     db.session.commit()
   except:
     error = True
@@ -553,16 +923,16 @@ def create_artist_submission():
 #  Delete Artist
 #  ----------------------------------------------------------------
 
-@app.route('/artists/<artist_id>/delete', methods=['POST'])
+@views.route('/artists/<int:artist_id>/delete', methods=['POST'])
 def delete_artist(artist_id):
   error = False
+  name = str(artist_id)
   try:
-    # query to get specific artist
-    artist = Artist.query.get(artist_id)
-    name = artist.name
-
-    db.session.delete(artist)
-    db.session.commit()
+    # query to get the name, the artist and its shows are deleted server-side
+    name = db.session.query(Artist.name).filter(Artist.id == artist_id).scalar() or name
+    if not delete_entities(db.session, Artist, Show.artist_id, Show.venue_id, [artist_id],
+                           after_batch=deleted_artists):
+      error = True
   except:
     error = True
     db.session.rollback()
@@ -575,10 +945,33 @@ def delete_artist(artist_id):
     flash('Artist ' + name + ' was successfully deleted!')
   return render_template('pages/home.html')
 
+@views.route('/artists/delete', methods=['POST'])
+def delete_artists():
+  # body: {"ids": [1, 2, ...]}
+  body = request.get_json(silent=True) or {}
+  try:
+    ids = [int(artist_id) for artist_id in body['ids']]
+  except (KeyError, TypeError, ValueError):
+    abort(400)
+
+  try:
+    deleted = delete_entities(db.session, Artist, Show.artist_id, Show.venue_id, ids,
+                              after_batch=deleted_artists)
+  except:
+    db.session.rollback()
+    current_app.logger.exception('bulk delete of artists failed')
+    abort(422)
+  finally:
+    db.session.close()
+  return jsonify({
+    'success': True,
+    'deleted': deleted
+  })
+
 #  Edit Artist
 #  ----------------------------------------------------------------
 
-@app.route('/artists/<int:artist_id>/edit', methods=['GET'])
+@views.route('/artists/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
   error = False
   try:
@@ -609,7 +1002,7 @@ def edit_artist(artist_id):
   else:
     return render_template('forms/edit_artist.html', form=form, artist=artist)
 
-@app.route('/artists/<int:artist_id>/edit', methods=['POST'])
+@views.route('/artists/<int:artist_id>/edit', methods=['POST'])
 def edit_artist_submission(artist_id):
   error = False
   try:
@@ -627,6 +1020,7 @@ def edit_artist_submission(artist_id):
     artist.seeking_venue = True if 'seeking_venue' in request.form else False
     artist.seeking_description = request.form.get('seeking_description', '')
 
+    invalidate_artist(artist_id)
     db.session.commit()
   except:
     error = True
@@ -639,7 +1033,23 @@ def edit_artist_submission(artist_id):
           name + ' could not be Edited.')
   else:
     flash('Artist ' + name + ' was successfully Edited!')
-  return redirect(url_for('show_artist', artist_id=artist_id))
+  return redirect(url_for('main.show_artist', artist_id=artist_id))
+
+#  Recommended Venues
+#  ----------------------------------------------------------------
+
+@views.route('/artists/<int:artist_id>/recommendations')
+@replica_reads
+def artist_recommendations(artist_id):
+  recommended = recommender.recommend(db.session, 'artist', artist_id,
+                                      request.args.get('k', RECOMMENDATIONS, type=int))
+  if recommended is None:
+    abort(404)
+  return jsonify({
+    'success': True,
+    'artist_id': artist_id,
+    'venues': [{'id': id, 'name': name, 'score': score} for id, name, score in recommended]
+  })
 
 #  ----------------------------------------------------------------
 #  Shows
@@ -648,49 +1058,104 @@ def edit_artist_submission(artist_id):
 #  Shows list
 #  ----------------------------------------------------------------
 
-@app.route('/shows')
+def show_body(show):
+  body = {}  # empty object to store show data
+  body['artist_id'] = show.artist_id
+  body['artist_name'] = show.artist_name
+  body['artist_image_link'] = show.artist_image_link
+  body['venue_id'] = show.venue_id
+  body['venue_name'] = show.venue_name
+  body['start_date'] = show.start_date.strftime('%Y-%m-%d %H:%M:%S')
+  return body
+
+@views.route('/shows')
+@replica_reads
+@change_versions.conditional('venues', 'artists', 'shows')
 def shows():
-  data = []  # empty array to store all the data we need
-  # query to retreive all shows
-  shows = Show.query.join(Venue).join(Artist).all()
+  # query to retreive the shows with their artist and venue
+  query = db.session.query(
+      Show.id, Show.start_date, Show.artist_id, Show.venue_id,
+      Artist.name.label('artist_name'), Artist.image_link.label('artist_image_link'),
+      Venue.name.label('venue_name')
+  ).join(Venue, Show.venue_id == Venue.id).join(Artist, Show.artist_id == Artist.id)
+
+  if request.args.get('all'):
+    # stream every show, rows are fetched while the page is sent
+    shows = query.order_by(Show.start_date, Show.id).yield_per(STREAM_BATCH_SIZE)
+    if wants_json():
+      return stream_json('shows', (show_body(show) for show in shows))
+    return stream_page('pages/shows.html', shows=(show_body(show) for show in shows))
 
-  for show in shows:
-    body = {}  # empty object to store show data
-    # append venue data to the array
-    body['artist_id'] = show.artist_id
-    body['artist_name'] = show.artist.name
-    body['artist_image_link'] = show.artist.image_link
-    body['venue_id'] = show.venue_id
-    body['venue_name'] = show.venue.name
-    body['start_date'] = show.start_date.strftime('%Y-%m-%d %H:%M:%S')
-
-    # append artist data to the array
-    data.append(body)
-
-  return render_template('pages/shows.html', shows=data)
+  try:
+    shows, prev_cursor, next_cursor = keyset_page(
+        query, [Show.start_date, Show.id],
+        request.args.get('after'), request.args.get('before'))
+  except ValueError:
+    abort(400)
+
+  data = [show_body(show) for show in shows]
+
+  if wants_json():
+    return jsonify({
+      'success': True,
+      'shows': data,
+      'prev_cursor': prev_cursor,
+      'next_cursor': next_cursor
+    })
+  return render_template('pages/shows.html', shows=data,
+                         prev_cursor=prev_cursor, next_cursor=next_cursor)
 
 #  Create Shows
 #  ----------------------------------------------------------------
 
-@app.route('/shows/create')
+@views.route('/shows/create')
 def create_shows():
   # renders form. do not touch.
   form = ShowForm()
   return render_template('forms/new_show.html', form=form)
 
-@app.route('/shows/create', methods=['POST'])
+@views.route('/shows/create', methods=['POST'])
 def create_show_submission():
   error = False
+  booked = False
+  try:
+    start_date = dateutil.parser.parse(request.form.get('start_date', ''))
+    end_date = show_end_date(start_date, request.form.get('duration', type=int))
+  except (ValueError, OverflowError):
+    flash('Error occurred: a show needs a start date and a positive duration.')
+    return render_template('pages/home.html'), 400
   try:
     # get values from form and create record on db
     show = Show(
         venue_id=request.form.get('venue_id', ''),
         artist_id=request.form.get('artist_id', ''),
-        start_date=request.form.get('start_date', '')
+        start_date=start_date,
+        end_date=end_date
     )
 
-    db.session.add(show)
-    db.session.commit()
+    # the partitions only reject overlaps within a month, so probe first
+    venue_available, artist_available = check_availability(db.session, [{
+      'venue_id': int(show.venue_id),
+      'artist_id': int(show.artist_id),
+      'start_date': show.start_date,
+      'end_date': show.end_date
+    }])[0]
+    if not (venue_available and artist_available):
+      error = booked = True
+    else:
+      db.session.add(show)
+      # update the venue and artist show counters in the same transaction
+      now = datetime.now()
+      count_show(db.session, Venue, show.venue_id, show.start_date, now)
+      count_show(db.session, Artist, show.artist_id, show.start_date, now)
+      change_feed.publish(db.session, ['venues', 'artists', 'shows'],
+                          [show.venue_id], [show.artist_id])
+      db.session.commit()
+  except IntegrityError as e:
+    error = True
+    # the booking constraints reject overlapping shows
+    booked = any(name in str(e.orig) for name in BOOKING_CONSTRAINTS.values())
+    db.session.rollback()
   except:
     error = True
     # rollback in case of error happen
@@ -698,34 +1163,378 @@ def create_show_submission():
     print(sys.exc_info())
   finally:
     db.session.close()
-  if error:
+  if booked:
+    flash('Error occurred: the venue or the artist is already booked at that time.')
+  elif error:
     flash('Error occurred: show could not be inserted.')
   else:
     flash('Show was successfully listed!')
   return render_template('pages/home.html')
 
+#  Check availability
+#  ----------------------------------------------------------------
+
+@views.route('/shows/availability', methods=['POST'])
+@replica_reads
+def shows_availability():
+  # probes: [{venue_id, artist_id, start_date, end_date or duration}, ...]
+  body = request.get_json(silent=True) or {}
+  probes = []
+  try:
+    for probe in body.get('probes', []):
+      start_date = dateutil.parser.parse(probe['start_date'])
+      probes.append({
+        'venue_id': int(probe['venue_id']) if probe.get('venue_id') is not None else None,
+        'artist_id': int(probe['artist_id']) if probe.get('artist_id') is not None else None,
+        'start_date': start_date,
+        'end_date': show_end_date(start_date, probe.get('duration'),
+                                  dateutil.parser.parse(probe['end_date'])
+                                  if probe.get('end_date') else None)
+      })
+  except (KeyError, TypeError, ValueError, OverflowError):
+    abort(400)
+
+  results = check_availability(db.session, probes)
+  return jsonify({
+    'success': True,
+    'availability': [{
+      'venue_available': venue_available,
+      'artist_available': artist_available
+    } for venue_available, artist_available in results]
+  })
+
+#  ----------------------------------------------------------------
+#  Calendar
+#  ----------------------------------------------------------------
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+ICAL_MIMETYPE = 'text/calendar'
+
+@views.route('/calendar')
+@replica_reads
+@change_versions.conditional('venues', 'artists', 'shows',
+                             variants=(JSON_MIMETYPE, NDJSON_MIMETYPE), daily=True)
+def calendar():
+  # ?start=&end= (dates, end included), ?city=, ?state=, ?genre=, ?match=
+  try:
+    start, end = calendar_range(request.args, change_versions.today())
+  except ValueError:
+    abort(400)
+  rows = calendar_query(db.session, (Venue, Artist, Show), start, end,
+                        browse_filters(request.args)).yield_per(STREAM_BATCH_SIZE)
+
+  best = request.accept_mimetypes.best_match([JSON_MIMETYPE, NDJSON_MIMETYPE])
+  if request.args.get('format') == 'ndjson' or best == NDJSON_MIMETYPE:
+    # one line per day
+    lines = (json.dumps(day) + '\n' for day in calendar_days(rows))
+    return Response(stream_with_context(lines), mimetype=NDJSON_MIMETYPE)
+  return stream_json('days', calendar_days(rows))
+
+# the feeds list the shows from midnight on, the same all day long
+def feed_start():
+  return datetime.combine(change_versions.today(), datetime.min.time())
+
+'''
+ical_response(name, rows)
+    streams the iCalendar feed of the show rows
+'''
+def ical_response(name, rows):
+  feed = ical_feed(name, rows, request.host, datetime.now(timezone.utc))
+  return Response(stream_with_context(feed), mimetype=ICAL_MIMETYPE)
+
+@views.route('/venues/<int:venue_id>/calendar.ics')
+@replica_reads
+@change_versions.conditional('venues', 'artists', 'shows', variants=(ICAL_MIMETYPE,),
+                             daily=True)
+def venue_calendar(venue_id):
+  name = db.session.query(Venue.name).filter(Venue.id == venue_id).scalar()
+  if name is None:
+    abort(404)
+  rows = calendar_query(db.session, (Venue, Artist, Show), feed_start()).filter(
+      Show.venue_id == venue_id).yield_per(STREAM_BATCH_SIZE)
+  return ical_response(name, rows)
+
+@views.route('/artists/<int:artist_id>/calendar.ics')
+@replica_reads
+@change_versions.conditional('venues', 'artists', 'shows', variants=(ICAL_MIMETYPE,),
+                             daily=True)
+def artist_calendar(artist_id):
+  name = db.session.query(Artist.name).filter(Artist.id == artist_id).scalar()
+  if name is None:
+    abort(404)
+  rows = calendar_query(db.session, (Venue, Artist, Show), feed_start()).filter(
+      Show.artist_id == artist_id).yield_per(STREAM_BATCH_SIZE)
+  return ical_response(name, rows)
+
+#  ----------------------------------------------------------------
+#  Autocomplete
+#  ----------------------------------------------------------------
+
+@views.route('/autocomplete')
+@replica_reads
+def autocomplete():
+  limit = request.args.get('limit', AUTOCOMPLETE_RESULTS, type=int)
+  if not 0 < limit <= AUTOCOMPLETE_MAX_RESULTS:
+    abort(400)
+  q = request.args.get('q', '')
+  suggestions = name_index.suggest(db.session, q, limit)
+  return jsonify({
+    'success': True,
+    'q': q,
+    'venues': [{'id': id, 'name': name} for id, name in suggestions['venue']],
+    'artists': [{'id': id, 'name': name} for id, name in suggestions['artist']]
+  })
+
+#  ----------------------------------------------------------------
+#  Analytics
+#  ----------------------------------------------------------------
+
+@views.route('/analytics')
+@replica_reads
+@change_versions.conditional('rollups', daily=True)
+def analytics():
+  # ?from=YYYY-MM&to=YYYY-MM, ?state=, ?city=; read from the rollups only
+  try:
+    first, last = report_months(request.args, datetime.now())
+  except ValueError:
+    abort(400)
+  filters = {'state': request.args.get('state', ''), 'city': request.args.get('city', '')}
+  report = analytics_report(db.session, (AreaRollup, GenreRollup, VenueRollup),
+                            first, last, filters)
+  if wants_json():
+    return jsonify(dict(report, success=True, first=first.strftime('%Y-%m'),
+                        last=last.strftime('%Y-%m')))
+  return render_template('pages/analytics.html', report=report, filters=filters,
+                         first=first, last=last)
+
+#  ----------------------------------------------------------------
+#  Cache stats
+#  ----------------------------------------------------------------
+
+@views.route('/cache/stats')
+def cache_stats():
+  return jsonify(fragment_cache.stats())
+
+@views.route('/compression/stats')
+def compression_stats():
+  return jsonify(compression.stats())
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+fyyur_cli = AppGroup('fyyur', help='Fyyur maintenance commands.')
+
+@fyyur_cli.command('rollover')
+def rollover_command():
+  """Move shows that have started from upcoming to past counters."""
+  now = datetime.now()
+  venues = roll_over(db.session, Venue, Show, Show.venue_id, now)
+  artists = roll_over(db.session, Artist, Show, Show.artist_id, now)
+  change_feed.publish(db.session, ['venues', 'artists'])
+  db.session.commit()
+  click.echo(f'Rolled over {venues} venues and {artists} artists.')
+
+@fyyur_cli.command('verify-counters')
+def verify_counters_command():
+  """Rebuild the show counters from scratch and report any drift."""
+  now = datetime.now()
+  drifted = 0
+  for model, key in ((Venue, Show.venue_id), (Artist, Show.artist_id)):
+    for entity_id, stored, expected in verify_counters(db.session, model, Show, key, now):
+      drifted += 1
+      click.echo(f'{model.__tablename__} {entity_id}: stored {stored}, expected {expected}')
+  change_feed.publish(db.session, ['venues', 'artists'])
+  db.session.commit()
+  click.echo(f'{drifted} rows drifted, counters rebuilt.')
+
+VENUE_FIELDS = ['name', 'city', 'state', 'address', 'phone', 'image_link', 'facebook_link',
+                'genres', 'website', 'seeking_talent', 'seeking_description']
+ARTIST_FIELDS = ['name', 'city', 'state', 'phone', 'image_link', 'facebook_link',
+                 'genres', 'seeking_venue', 'seeking_description']
+SHOW_FIELDS = ['venue_id', 'artist_id', 'start_date', 'end_date']
+
+'''
+show_validator()
+    validates a show record with the show form; its end comes from
+    `end_date` or `duration`, checked like the web form's
+'''
+def show_validator():
+  validate_form = form_validator(ShowForm, SHOW_FIELDS + ['duration', 'venue_name', 'artist_name'])
+
+  def validate(record):
+    row = validate_form(record)
+    try:
+      end_date = dateutil.parser.parse(row['end_date']) if row.get('end_date') else None
+    except OverflowError:
+      raise ValueError(f'invalid end_date {row["end_date"]}')
+    row['end_date'] = show_end_date(row['start_date'], row.pop('duration'), end_date)
+    return row
+  return validate
+
+'''
+count_imported_shows(session, rows)
+    brings the counters and cached pages of the venues and artists of a
+    batch of imported shows up to date
+'''
+def count_imported_shows(session, rows):
+  now = datetime.now()
+  venue_ids = {row['venue_id'] for row in rows}
+  artist_ids = {row['artist_id'] for row in rows}
+  recount(session, Venue, Show, Show.venue_id, now, venue_ids)
+  recount(session, Artist, Show, Show.artist_id, now, artist_ids)
+  change_feed.publish(session, ['venues', 'artists', 'shows'], venue_ids, artist_ids)
+
+@fyyur_cli.command('import')
+@click.argument('kind', type=click.Choice(['venues', 'artists', 'shows']))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--batch-size', default=BATCH_SIZE, show_default=True,
+              help='Records inserted per transaction.')
+@click.option('--checkpoint', 'checkpoint_path', default=None,
+              help='Checkpoint file, defaults to PATH.checkpoint.')
+@click.option('--restart', is_flag=True, help='Ignore the checkpoint and start over.')
+def import_command(kind, path, batch_size, checkpoint_path, restart):
+  """Bulk load venues, artists or shows from a CSV or NDJSON file.
+
+  Shows reference their venue and artist by venue_id/artist_id or by
+  venue_name/artist_name, and end at end_date or after duration minutes.
+  """
+  checkpoint = Checkpoint(checkpoint_path or path + '.checkpoint')
+  if restart:
+    checkpoint.clear()
+
+  if kind == 'venues':
+    options = dict(table=Venue.__table__, columns=VENUE_FIELDS,
+                   validate=form_validator(VenueForm, VENUE_FIELDS))
+  elif kind == 'artists':
+    options = dict(table=Artist.__table__, columns=ARTIST_FIELDS,
+                   validate=form_validator(ArtistForm, ARTIST_FIELDS))
+  else:
+    resolve_venues = reference_resolver(Venue, 'venue_id', 'venue_name')
+    resolve_artists = reference_resolver(Artist, 'artist_id', 'artist_name')
+
+    def resolve(session, rows):
+      resolve_venues(session, rows)
+      resolve_artists(session, [row for row in rows if 'error' not in row])
+      # a single double booking would fail the insert of the whole batch
+      shows = [row for row in rows if 'error' not in row]
+      for row, conflict in zip(shows, booking_conflicts(session, shows)):
+        if conflict:
+          row['error'] = conflict
+
+    options = dict(table=Show.__table__, columns=SHOW_FIELDS,
+                   validate=show_validator(),
+                   resolve=resolve, after_batch=count_imported_shows)
+
+  loaded, rejected = import_records(
+      db.session, read_records(path), batch_size=batch_size,
+      checkpoint=checkpoint, report=click.echo, **options)
+  change_feed.publish(db.session, [kind])
+  db.session.commit()
+  click.echo(f'Imported {loaded} {kind}, rejected {rejected}.')
+
+@fyyur_cli.command('partitions')
+@click.option('--ahead', default=PARTITIONS_AHEAD, show_default=True,
+              help='Months of partitions to create after the current one.')
+@click.option('--archive-after', 'keep', type=int, default=None,
+              help='Detach the partitions of months older than this many months.')
+@click.option('--drop', is_flag=True,
+              help='Drop detached partitions instead of moving them to the archive schema.')
+def partitions_command(ahead, keep, drop):
+  """Create upcoming monthly show partitions and archive old ones.
+
+  Rows of the default partition get a partition of their month too.
+  """
+  now = datetime.now()
+  for name in ensure_partitions(db.session, now, ahead):
+    click.echo(f'Created {name}.')
+  if keep is not None:
+    before = add_months(month_start(now), -keep)
+    for name in archive_partitions(db.session, before, drop, after_detach=archived_shows):
+      click.echo(f'{"Dropped" if drop else "Archived"} {name}.')
+
+@fyyur_cli.command('rollups')
+@click.option('--full', is_flag=True, help='Recompute every month that has shows.')
+def rollups_command(full):
+  """Refresh the analytics rollups of the months whose shows changed.
+
+  Readers see the previous figures until the refresh commits.
+  """
+  if full:
+    mark_all_months(db.session)
+  months = refresh_rollups(db.session)
+  if months:
+    change_feed.publish(db.session, ['rollups'])
+  db.session.commit()
+  click.echo(f'Refreshed {len(months)} months.')
+
+@fyyur_cli.command('assets')
+def assets_command():
+  """Build minified, fingerprinted and precompressed static assets.
+
+  Pages link to the built files once static/dist/manifest.json exists.
+  """
+  build_assets(current_app.static_folder, report=click.echo)
+  static_assets.load(os.path.join(current_app.static_folder, DIST_FOLDER))
+
 #----------------------------------------------------------------------------#
 # Errors Handler.
 #----------------------------------------------------------------------------#
 
-@app.errorhandler(404)
+@views.app_errorhandler(404)
 def not_found_error(error):
+    if wants_json():
+        return jsonify({'success': False, 'error': 404, 'message': 'resource not found'}), 404
     return render_template('errors/404.html'), 404
 
-@app.errorhandler(500)
+@views.app_errorhandler(500)
 def server_error(error):
+    if wants_json():
+        return jsonify({'success': False, 'error': 500, 'message': 'internal server error'}), 500
     return render_template('errors/500.html'), 500
 
 
-if not app.debug:
+#----------------------------------------------------------------------------#
+# App factory.
+#----------------------------------------------------------------------------#
+
+'''
+create_app(config)
+    builds a Fyyur app from config.py, with `config` overriding its
+    settings, e.g. {'SQLALCHEMY_DATABASE_URI': 'sqlite://'} in the tests
+'''
+def create_app(config=None):
+  app = Flask(__name__)
+  app.config.from_object('config')
+  app.config.update(config or {})
+  moment.init_app(app)
+  db.init_app(app)
+  init_routing(app)
+  migrate.init_app(app, db)
+  static_assets.init_app(app)
+  fragment_cache.init_app(app)
+  change_versions.set_backend(
+      fragment_cache.backend if isinstance(fragment_cache.backend, SharedCache) else None)
+  change_feed.init_app(app)
+  recommender.init_app(app)
+  if app.config.get('COMPRESS_RESPONSES'):
+    compression.init_app(app)
+  if app.config.get('PROFILE_REQUESTS'):
+    profiler.init_app(app)
+  app.register_blueprint(views)
+  app.cli.add_command(fyyur_cli)
+
+  if not app.debug:
     file_handler = FileHandler('error.log')
     file_handler.setFormatter(
         Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
     )
     app.logger.setLevel(logging.INFO)
     file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
+    # the file is written from a background thread, not the request thread
+    setup_queue_logging(app.logger, file_handler)
     app.logger.info('errors')
+  return app
 
 #----------------------------------------------------------------------------#
 # Launch.
@@ -733,11 +1542,11 @@ if not app.debug:
 
 # Default port:
 if __name__ == '__main__':
-    app.run()
+    create_app().run()
 
 # Or specify port manually:
 '''
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port)
+    create_app().run(host='0.0.0.0', port=port)
 '''
@@ -0,0 +1,170 @@
+#----------------------------------------------------------------------------#
+# Fingerprinted, precompressed static assets.
+#----------------------------------------------------------------------------#
+
+# `flask fyyur assets` copies the static folder to static/dist, minifying
+# CSS and JS, putting a hash of the content in every file name and writing
+# .gz and .br variants next to the compressible ones. manifest.json maps
+# the original names to the built ones, and once it exists
+# url_for('static', filename=...) points at the built file. Built files
+# never change under the same name, so they are served with a one year
+# immutable Cache-Control and the smallest encoding the browser accepts.
+
+import os
+import re
+import gzip
+import json
+import hashlib
+import mimetypes
+import posixpath
+from flask import request, send_from_directory, abort
+
+DIST_FOLDER = 'dist'
+MANIFEST = 'manifest.json'
+CACHE_MAX_AGE = 365 * 24 * 60 * 60
+
+# already compressed formats aren't worth a variant
+COMPRESSIBLE = {'.css', '.js', '.map', '.svg', '.ttf', '.otf', '.eot', '.json', '.txt', '.html'}
+
+# variants in order of preference, by Content-Encoding
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+CSS_URL = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+
+def minify_css(css):
+  css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+  css = re.sub(r'\s+', ' ', css)
+  css = re.sub(r'\s*([{};,>])\s*', r'\1', css)
+  # only after a colon, `a :hover` and `a:hover` are different selectors
+  css = re.sub(r':\s+', ':', css)
+  return css.replace(';}', '}').strip()
+
+def minify_js(js):
+  # whitespace only, anything more needs a real parser
+  return '\n'.join(line.strip() for line in js.splitlines() if line.strip())
+
+def fingerprint(path, content):
+  root, ext = posixpath.splitext(path)
+  return f'{root}.{hashlib.sha256(content).hexdigest()[:12]}{ext}'
+
+'''
+rewrite_css_urls(css, path, manifest)
+    points the url()s of a stylesheet at the built names of the files they
+    reference, the query string and fragment are kept
+'''
+def rewrite_css_urls(css, path, manifest):
+  def rewrite(match):
+    quote, url = match.groups()
+    target, suffix = re.match(r'([^?#]*)(.*)', url).groups()
+    if '://' in target or target.startswith(('data:', '/')):
+      return match.group(0)
+    source = posixpath.normpath(posixpath.join(posixpath.dirname(path), target))
+    if source not in manifest:
+      return match.group(0)
+    built = posixpath.relpath(manifest[source], posixpath.dirname(path))
+    return f'url({quote}{built}{suffix}{quote})'
+  return CSS_URL.sub(rewrite, css)
+
+def write_variants(path, content, brotli=None):
+  with gzip.open(path + '.gz', 'wb', compresslevel=9) as f:
+    f.write(content)
+  if brotli is not None:
+    with open(path + '.br', 'wb') as f:
+      f.write(brotli.compress(content))
+
+'''
+build_assets(static_folder, report)
+    builds static/dist and its manifest, returns the manifest; brotli
+    variants need the brotli package, gzip ones are always written
+'''
+def build_assets(static_folder, report=print):
+  try:
+    import brotli
+  except ImportError:
+    brotli = None
+    report('brotli is not installed, only gzip variants are written')
+
+  dist = os.path.join(static_folder, DIST_FOLDER)
+  sources = []
+  for folder, dirs, files in os.walk(static_folder):
+    if os.path.abspath(folder) == os.path.abspath(static_folder) and DIST_FOLDER in dirs:
+      dirs.remove(DIST_FOLDER)
+    for name in files:
+      sources.append(os.path.relpath(os.path.join(folder, name), static_folder).replace(os.sep, '/'))
+  # stylesheets last, their url()s need the built names of what they use
+  sources.sort(key=lambda path: (path.endswith('.css'), path))
+
+  manifest = {}
+  for path in sources:
+    with open(os.path.join(static_folder, path), 'rb') as f:
+      content = f.read()
+    if path.endswith('.css'):
+      css = content.decode('utf-8')
+      if not path.endswith('.min.css'):
+        css = minify_css(css)
+      content = rewrite_css_urls(css, path, manifest).encode('utf-8')
+    elif path.endswith('.js') and not path.endswith('.min.js'):
+      content = minify_js(content.decode('utf-8')).encode('utf-8')
+    manifest[path] = fingerprint(path, content)
+
+    target = os.path.join(dist, manifest[path])
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with open(target, 'wb') as f:
+      f.write(content)
+    if posixpath.splitext(path)[1] in COMPRESSIBLE:
+      write_variants(target, content, brotli)
+
+  with open(os.path.join(dist, MANIFEST), 'w') as f:
+    json.dump(manifest, f, indent=2, sort_keys=True)
+  report(f'{len(manifest)} assets built in {dist}')
+  return manifest
+
+class StaticAssets(object):
+  """Serves the built assets and points url_for('static') at them"""
+
+  def __init__(self, app=None):
+    self.manifest = {}
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    self.load(os.path.join(app.static_folder, DIST_FOLDER))
+    app.url_defaults(self.built_name)
+    app.add_url_rule(f'{app.static_url_path}/{DIST_FOLDER}/<path:filename>',
+                     endpoint='dist', view_func=self.send)
+
+  def load(self, folder):
+    self.folder = folder
+    try:
+      with open(os.path.join(folder, MANIFEST)) as f:
+        self.manifest = json.load(f)
+    except FileNotFoundError:
+      self.manifest = {}
+    # changes with every build, pages link to the new names
+    self.version = hashlib.sha256(
+        json.dumps(self.manifest, sort_keys=True).encode()).hexdigest()[:12] if self.manifest else ''
+
+  def built_name(self, endpoint, values):
+    if endpoint == 'static' and values.get('filename') in self.manifest:
+      values['filename'] = f'{DIST_FOLDER}/{self.manifest[values["filename"]]}'
+
+  def send(self, filename):
+    if filename == MANIFEST:
+      abort(404)
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    encoding = None
+    for name, suffix in ENCODINGS:
+      if request.accept_encodings[name] and os.path.isfile(
+          os.path.join(self.folder, filename + suffix)):
+        encoding = name
+        filename += suffix
+        break
+
+    response = send_from_directory(self.folder, filename, mimetype=mimetype,
+                                   max_age=CACHE_MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    response.vary.add('Accept-Encoding')
+    if encoding:
+      response.content_encoding = encoding
+    return response
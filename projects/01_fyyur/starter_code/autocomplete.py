@@ -0,0 +1,160 @@
+#----------------------------------------------------------------------------#
+# Typeahead suggestions for venue and artist names.
+#----------------------------------------------------------------------------#
+
+# Names are kept in memory in sorted arrays searched with bisect: one of
+# whole names, and one of the name from each later word on, so "hop" finds
+# "The Musical Hop" after the names starting with "hop". A lookup is a
+# binary search and a short scan, no query. The index is loaded on first
+# use; changed venues and artists are marked and their rows reloaded
+# before the next lookup, and deleted ones drop out of the arrays.
+
+import re
+import threading
+import unicodedata
+from bisect import bisect_left
+
+AUTOCOMPLETE_RESULTS = 8
+AUTOCOMPLETE_MAX_RESULTS = 50
+
+def normalize(text):
+  text = unicodedata.normalize('NFKD', text or '')
+  text = ''.join(char for char in text if not unicodedata.combining(char))
+  return ' '.join(re.findall(r'\w+', text.casefold()))
+
+def word_keys(key):
+  # the name from its second word on, then from its third...
+  starts = [match.start() for match in re.finditer(r' ', key)]
+  return [key[start + 1:] for start in starts]
+
+class SortedKeys(object):
+  """Sorted array of (key, id) pairs held in two parallel lists"""
+
+  def __init__(self):
+    self.keys = []
+    self.ids = []
+
+  def position(self, key, entity_id):
+    index = bisect_left(self.keys, key)
+    while index < len(self.keys) and self.keys[index] == key and self.ids[index] < entity_id:
+      index += 1
+    return index
+
+  def add(self, key, entity_id):
+    index = self.position(key, entity_id)
+    self.keys.insert(index, key)
+    self.ids.insert(index, entity_id)
+
+  def remove(self, key, entity_id):
+    index = self.position(key, entity_id)
+    if index < len(self.keys) and self.keys[index] == key and self.ids[index] == entity_id:
+      del self.keys[index]
+      del self.ids[index]
+
+  def prefixed(self, prefix):
+    index = bisect_left(self.keys, prefix)
+    while index < len(self.keys) and self.keys[index].startswith(prefix):
+      yield self.ids[index]
+      index += 1
+
+class PrefixIndex(object):
+  """Names of one kind of entity, searchable by prefix"""
+
+  def __init__(self):
+    self.names = {}
+    self.whole = SortedKeys()
+    self.words = SortedKeys()
+
+  def add(self, entity_id, name):
+    self.remove(entity_id)
+    key = normalize(name)
+    self.names[entity_id] = name
+    self.whole.add(key, entity_id)
+    for word_key in word_keys(key):
+      self.words.add(word_key, entity_id)
+
+  def remove(self, entity_id):
+    name = self.names.pop(entity_id, None)
+    if name is None:
+      return
+    key = normalize(name)
+    self.whole.remove(key, entity_id)
+    for word_key in word_keys(key):
+      self.words.remove(word_key, entity_id)
+
+  def load(self, rows):
+    # bulk load, sorting once instead of inserting one by one
+    whole = []
+    words = []
+    for entity_id, name in rows:
+      key = normalize(name)
+      self.names[entity_id] = name
+      whole.append((key, entity_id))
+      words.extend((word_key, entity_id) for word_key in word_keys(key))
+    for keys, pairs in ((self.whole, whole), (self.words, words)):
+      pairs.sort()
+      keys.keys = [key for key, entity_id in pairs]
+      keys.ids = [entity_id for key, entity_id in pairs]
+
+  def lookup(self, prefix, limit):
+    found = []
+    for keys in (self.whole, self.words):
+      for entity_id in keys.prefixed(prefix):
+        if len(found) == limit:
+          return found
+        if entity_id not in found:
+          found.append(entity_id)
+    return found
+
+class Autocomplete(object):
+  """Venue and artist name suggestions served from memory"""
+
+  def __init__(self, venue_model, artist_model):
+    self.models = {'venue': venue_model, 'artist': artist_model}
+    self.lock = threading.Lock()
+    self.clear()
+
+  def clear(self):
+    self.loaded = False
+    self.pending = {'venue': set(), 'artist': set()}
+    self.indexes = {'venue': PrefixIndex(), 'artist': PrefixIndex()}
+
+  def refresh(self, kind, *ids):
+    with self.lock:
+      self.pending[kind].update(int(entity_id) for entity_id in ids)
+
+  def expire(self):
+    with self.lock:
+      self.loaded = False
+
+  def update(self, session):
+    for kind, model in self.models.items():
+      if not self.loaded:
+        self.indexes[kind] = PrefixIndex()
+        self.indexes[kind].load(session.query(model.id, model.name).yield_per(10000))
+        self.pending[kind].clear()
+      elif self.pending[kind]:
+        ids = self.pending[kind]
+        rows = dict(session.query(model.id, model.name).filter(model.id.in_(ids)))
+        for entity_id in ids:
+          if entity_id in rows:
+            self.indexes[kind].add(entity_id, rows[entity_id])
+          else:
+            self.indexes[kind].remove(entity_id)
+        ids.clear()
+    self.loaded = True
+
+  '''
+  suggest(session, prefix, limit)
+      up to `limit` venues and artists whose name, or a word of it, starts
+      with `prefix`, as {'venue': [(id, name)], 'artist': [(id, name)]}
+  '''
+  def suggest(self, session, prefix, limit=AUTOCOMPLETE_RESULTS):
+    prefix = normalize(prefix)
+    with self.lock:
+      self.update(session)
+      if not prefix:
+        return {kind: [] for kind in self.indexes}
+      return {kind: [(entity_id, index.names[entity_id])
+                     for entity_id in index.lookup(prefix, limit)]
+              for kind, index in self.indexes.items()}
@@ -0,0 +1,43 @@
+#----------------------------------------------------------------------------#
+# Micro-benchmark of the `datetime` Jinja filter.
+#
+#   $ python -m benchmarks.datetime_filter
+#----------------------------------------------------------------------------#
+
+import timeit
+from datetime import datetime
+import dateutil.parser
+import babel.dates
+
+from formatting import format_datetime, DATETIME_FORMAT
+
+CALLS = 20000
+
+# the filter as it was, parsing and compiling the pattern on every call
+def legacy_format_datetime(value, format='medium'):
+  date = dateutil.parser.parse(value)
+  if format == 'full':
+      format="EEEE MMMM, d, y 'at' h:mma"
+  elif format == 'medium':
+      format="EE MM, dd, y h:mma"
+  return babel.dates.format_datetime(date, format)
+
+def main():
+  value = datetime(2035, 4, 1, 20, 0)
+  string = value.strftime(DATETIME_FORMAT)
+  assert format_datetime(string, 'full') == legacy_format_datetime(string, 'full')
+  assert format_datetime(value, 'full') == legacy_format_datetime(string, 'full')
+
+  cases = [
+    ('legacy, string', lambda: legacy_format_datetime(string, 'full')),
+    ('string', lambda: format_datetime(string, 'full')),
+    ('datetime', lambda: format_datetime(value, 'full'))
+  ]
+  baseline = None
+  for name, call in cases:
+    per_call = min(timeit.repeat(call, number=CALLS, repeat=3)) / CALLS * 1e6
+    baseline = baseline or per_call
+    print(f'{name:<16} {per_call:8.2f} us/call  {baseline / per_call:5.1f}x')
+
+if __name__ == '__main__':
+  main()
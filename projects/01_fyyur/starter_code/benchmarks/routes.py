@@ -0,0 +1,250 @@
+#----------------------------------------------------------------------------#
+# Load benchmark of every route.
+#
+#   $ python -m benchmarks.synthetic --scale 100k
+#   $ python -m benchmarks.routes --requests 50 --output bench.json
+#----------------------------------------------------------------------------#
+
+# Every route of app.py is driven through the Flask test client against the
+# configured database. Each request goes to a different venue, artist or
+# page so detail pages are measured cold, then a second pass under
+# tracemalloc records the peak memory of a request. The JSON report holds
+# p50/p95/p99 latency, SQL statements per request and peak memory per
+# route, and can be diffed between commits.
+
+import sys
+import json
+import logging
+import argparse
+import platform
+import subprocess
+import tracemalloc
+from time import perf_counter
+from datetime import datetime, timedelta
+from statistics import quantiles, mean
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+'''
+route_cases(ids, index)
+    the requests of every route, as endpoint -> (method, url, body) for
+    the index-th request; writes go to records created by the benchmark
+'''
+def route_cases(ids, index):
+  venue_id = ids['venues'][index % len(ids['venues'])]
+  artist_id = ids['artists'][index % len(ids['artists'])]
+  start = datetime(2200, 1, 1) + timedelta(hours=3 * index)
+  venue_form = {'name': f'Benchmark venue {index}', 'city': 'Benchmark', 'state': 'CA',
+                'address': '1 Main St', 'phone': '555-555-5555', 'genres': ['Jazz'],
+                'facebook_link': 'https://www.facebook.com/benchmark'}
+  artist_form = {'name': f'Benchmark artist {index}', 'city': 'Benchmark', 'state': 'CA',
+                 'phone': '555-555-5555', 'genres': ['Jazz'],
+                 'facebook_link': 'https://www.facebook.com/benchmark'}
+  return {
+    'index': ('GET', '/', None),
+    'venues': ('GET', '/venues', None),
+    'search_venues': ('POST', '/venues/search', {'search_term': 'the'}),
+    'show_venue': ('GET', f'/venues/{venue_id}', None),
+    'create_venue_form': ('GET', '/venues/create', None),
+    'create_venue_submission': ('POST', '/venues/create', venue_form),
+    'edit_venue': ('GET', f'/venues/{venue_id}/edit', None),
+    'edit_venue_submission': ('POST', f'/venues/{ids["bench_venue"]}/edit', venue_form),
+    'delete_venue': ('POST', f'/venues/{ids["deletable_venues"][index]}/delete', None),
+    'delete_venues': ('POST', '/venues/delete', {'ids': ids['bulk_venues'][2 * index:2 * index + 2]}),
+    'venue_recommendations': ('GET', f'/venues/{venue_id}/recommendations', None),
+    'artists': ('GET', '/artists', None),
+    'search_artists': ('POST', '/artists/search', {'search_term': 'band'}),
+    'show_artist': ('GET', f'/artists/{artist_id}', None),
+    'create_artist_form': ('GET', '/artists/create', None),
+    'create_artist_submission': ('POST', '/artists/create', artist_form),
+    'edit_artist': ('GET', f'/artists/{artist_id}/edit', None),
+    'edit_artist_submission': ('POST', f'/artists/{ids["bench_artist"]}/edit', artist_form),
+    'delete_artist': ('POST', f'/artists/{ids["deletable_artists"][index]}/delete', None),
+    'delete_artists': ('POST', '/artists/delete', {'ids': ids['bulk_artists'][2 * index:2 * index + 2]}),
+    'artist_recommendations': ('GET', f'/artists/{artist_id}/recommendations', None),
+    'shows': ('GET', '/shows', None),
+    'create_shows': ('GET', '/shows/create', None),
+    'create_show_submission': ('POST', '/shows/create', {
+      'venue_id': ids['bench_venue'], 'artist_id': ids['bench_artist'],
+      'start_date': start.strftime('%Y-%m-%d %H:%M:%S'), 'duration': 60}),
+    'shows_availability': ('POST', '/shows/availability', {'probes': [
+      {'venue_id': venue_id, 'artist_id': artist_id,
+       'start_date': (start + timedelta(days=day)).isoformat()} for day in range(20)]}),
+    'calendar': ('GET', f'/calendar?start={(datetime.now() + timedelta(days=index % 30)).date()}', None),
+    'venue_calendar': ('GET', f'/venues/{venue_id}/calendar.ics', None),
+    'artist_calendar': ('GET', f'/artists/{artist_id}/calendar.ics', None),
+    'autocomplete': ('GET', f'/autocomplete?q={"the blue golden red"[:3 + index % 8]}', None),
+    'analytics': ('GET', f'/analytics?state={"CA NY TX".split()[index % 3]}', None),
+    'cache_stats': ('GET', '/cache/stats', None),
+    'compression_stats': ('GET', '/compression/stats', None),
+    'dist': ('GET', ids['asset'], None)
+  }
+
+# endpoints taking a JSON body instead of a form
+JSON_ROUTES = ('/shows/availability', '/venues/delete', '/artists/delete')
+
+def send(client, method, url, body):
+  if method == 'GET':
+    response = client.get(url, headers={'Accept-Encoding': 'gzip, br'})
+  elif url in JSON_ROUTES:
+    response = client.post(url, json=body)
+  else:
+    response = client.post(url, data=body)
+  # read streamed bodies to the end
+  response.get_data()
+  response.close()
+  return response.status_code
+
+def percentile(points, samples):
+  if len(samples) < 2:
+    return {point: samples[0] if samples else None for point in points}
+  cuts = quantiles(samples, n=100, method='inclusive')
+  return {point: cuts[point - 1] for point in points}
+
+'''
+benchmark_ids(db, models, requests)
+    ids to request: sample venues and artists, plus benchmark records that
+    the write routes may edit and delete
+'''
+def benchmark_ids(db, models, requests):
+  Venue, Artist, Show = models
+  venues = [row.id for row in db.session.query(Venue.id).order_by(Venue.id).limit(requests)]
+  artists = [row.id for row in db.session.query(Artist.id).order_by(Artist.id).limit(requests)]
+  if not venues or not artists:
+    sys.exit('the database is empty, run python -m benchmarks.synthetic first')
+
+  def add(model, count, **values):
+    records = [model(name=f'Benchmark {model.__name__.lower()}', city='Benchmark',
+                     state='CA', genres=['Jazz'], **values) for i in range(count)]
+    db.session.add_all(records)
+    db.session.commit()
+    return [record.id for record in records]
+
+  # one extra request per route warms it up
+  return {
+    'venues': venues,
+    'artists': artists,
+    'bench_venue': add(Venue, 1)[0],
+    'bench_artist': add(Artist, 1)[0],
+    'deletable_venues': add(Venue, 2 * (requests + 1)),
+    'deletable_artists': add(Artist, 2 * (requests + 1)),
+    'bulk_venues': add(Venue, 2 * (requests + 2)),
+    'bulk_artists': add(Artist, 2 * (requests + 2))
+  }
+
+def cleanup(db, models):
+  Venue, Artist, Show = models
+  for model in (Venue, Artist):
+    ids = db.session.query(model.id).filter(model.city == 'Benchmark').scalar_subquery()
+    db.session.query(Show).filter(getattr(Show, model.__tablename__[:-1] + '_id').in_(
+        ids)).delete(synchronize_session=False)
+    db.session.query(model).filter(model.city == 'Benchmark').delete(synchronize_session=False)
+  db.session.commit()
+
+def git_commit():
+  try:
+    return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True,
+                          text=True, check=True).stdout.strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+'''
+run(app, db, models, requests)
+    benchmarks every route and returns the report as a dict
+'''
+def run(app, db, models, requests=50, routes=None):
+  client = app.test_client()
+  ids = benchmark_ids(db, models, requests)
+  # the built stylesheet, or the source one before `flask fyyur assets`
+  with app.test_request_context():
+    ids['asset'] = app.url_for('static', filename='css/main.css')
+  cases = route_cases(ids, 0)
+  # cases are named after the endpoints, without their blueprint
+  endpoints = {rule.endpoint.rpartition('.')[2] for rule in app.url_map.iter_rules()} - {'static'}
+  missing = sorted(endpoints - set(cases))
+  selected = [name for name in cases if not routes or name in routes]
+
+  statements = []
+  def count_statement(*args):
+    statements.append(1)
+  # replicas included
+  event.listen(Engine, 'before_cursor_execute', count_statement)
+
+  report = {}
+  try:
+    for name in selected:
+      latencies = []
+      sql = []
+      statuses = set()
+      send(client, *cases[name])
+      for index in range(1, requests + 1):
+        method, url, body = route_cases(ids, index)[name]
+        del statements[:]
+        started = perf_counter()
+        statuses.add(send(client, method, url, body))
+        latencies.append((perf_counter() - started) * 1000)
+        sql.append(len(statements))
+
+      # memory is measured apart, tracemalloc slows every allocation down
+      method, url, body = route_cases(ids, requests + 1)[name]
+      tracemalloc.start()
+      send(client, method, url, body)
+      peak = tracemalloc.get_traced_memory()[1]
+      tracemalloc.stop()
+
+      latency = percentile((50, 95, 99), latencies)
+      report[name] = {
+        'method': method,
+        'status': sorted(statuses),
+        'requests': requests,
+        'p50_ms': round(latency[50], 3),
+        'p95_ms': round(latency[95], 3),
+        'p99_ms': round(latency[99], 3),
+        'mean_ms': round(mean(latencies), 3),
+        'sql_statements': max(sql),
+        'sql_statements_mean': round(mean(sql), 2),
+        'peak_memory_kb': round(peak / 1024, 1)
+      }
+      print(f'{name:<26} p50 {latency[50]:8.2f}ms  p99 {latency[99]:8.2f}ms  '
+            f'sql {max(sql):3d}  peak {peak / 1024:9.1f}KB', file=sys.stderr)
+  finally:
+    event.remove(Engine, 'before_cursor_execute', count_statement)
+    cleanup(db, models)
+
+  Venue, Artist, Show = models
+  return {
+    'commit': git_commit(),
+    'python': platform.python_version(),
+    'created': datetime.now().isoformat(timespec='seconds'),
+    'rows': {
+      'venues': db.session.query(Venue).count(),
+      'artists': db.session.query(Artist).count(),
+      'shows': db.session.query(Show).count()
+    },
+    'uncovered_routes': missing,
+    'routes': report
+  }
+
+def main():
+  parser = argparse.ArgumentParser(description='Benchmark every route of the app.')
+  parser.add_argument('--requests', type=int, default=50, help='Requests per route.')
+  parser.add_argument('--route', action='append', help='Only benchmark this endpoint.')
+  parser.add_argument('--output', help='Write the JSON report here instead of stdout.')
+  args = parser.parse_args()
+
+  from app import create_app, db, Venue, Artist, Show, fragment_cache
+  app = create_app()
+  # keep the per request log lines out of the timings
+  app.logger.setLevel(logging.ERROR)
+  with app.app_context():
+    fragment_cache.clear()
+    report = run(app, db, (Venue, Artist, Show), args.requests, args.route)
+
+  if args.output:
+    with open(args.output, 'w') as f:
+      json.dump(report, f, indent=2)
+  else:
+    print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,193 @@
+#----------------------------------------------------------------------------#
+# Seeded synthetic data for load testing.
+#
+#   $ python -m benchmarks.synthetic --scale 100k --seed 1
+#----------------------------------------------------------------------------#
+
+# The same scale and seed always produce the same rows. Rows are appended
+# after the current highest ids and loaded with COPY in chunks, so even the
+# 1M show scale stays within a few MB of memory. The schedule never
+# double-books: each venue plays one show per slot, and the artists of a
+# slot are a rotation of distinct artists.
+
+import io
+import csv
+import random
+import argparse
+from datetime import datetime, timedelta
+from sqlalchemy import func, text
+
+from forms import VenueForm
+
+SCALES = {
+  '1k': {'venues': 100, 'artists': 200, 'shows': 1000},
+  '100k': {'venues': 5000, 'artists': 10000, 'shows': 100000},
+  '1m': {'venues': 20000, 'artists': 50000, 'shows': 1000000}
+}
+
+COPY_CHUNK = 50000
+
+# shows are spread over this period around now
+SPAN = timedelta(days=730)
+SHOW_LENGTH = timedelta(hours=2)
+
+GENRES = [genre for genre, label in VenueForm.genres.kwargs['choices']]
+STATES = [state for state, label in VenueForm.state.kwargs['choices']]
+WORDS = ['Blue', 'Red', 'Velvet', 'Golden', 'Silver', 'Electric', 'Midnight', 'Old',
+         'Little', 'Grand', 'Lucky', 'Wild', 'Hidden', 'Rusty', 'Crystal', 'Neon']
+VENUE_NOUNS = ['Hall', 'Room', 'Lounge', 'Club', 'Theatre', 'Cellar', 'Barn', 'Tavern']
+ARTIST_NOUNS = ['Band', 'Trio', 'Collective', 'Orchestra', 'Project', 'Quartet', 'Ensemble']
+
+def cities(rng, count):
+  return [(f'{rng.choice(WORDS)} {rng.choice(["Springs", "Falls", "City", "Harbor", "Hills"])}',
+           rng.choice(STATES)) for i in range(count)]
+
+def venue_rows(rng, first_id, count, areas):
+  for venue_id in range(first_id, first_id + count):
+    city, state = rng.choice(areas)
+    seeking = rng.random() < 0.3
+    yield {
+      'id': venue_id,
+      'name': f'The {rng.choice(WORDS)} {rng.choice(VENUE_NOUNS)} {venue_id}',
+      'city': city,
+      'state': state,
+      'address': f'{rng.randint(1, 9999)} Main St',
+      'phone': f'{rng.randint(200, 999)}-{rng.randint(200, 999)}-{rng.randint(1000, 9999)}',
+      'genres': rng.sample(GENRES, rng.randint(1, 3)),
+      'image_link': None,
+      'facebook_link': f'https://www.facebook.com/venue{venue_id}',
+      'website': f'https://venue{venue_id}.example.com',
+      'seeking_talent': seeking,
+      'seeking_description': 'Looking for local acts' if seeking else None
+    }
+
+def artist_rows(rng, first_id, count, areas):
+  for artist_id in range(first_id, first_id + count):
+    city, state = rng.choice(areas)
+    seeking = rng.random() < 0.5
+    yield {
+      'id': artist_id,
+      'name': f'{rng.choice(WORDS)} {rng.choice(ARTIST_NOUNS)} {artist_id}',
+      'city': city,
+      'state': state,
+      'phone': f'{rng.randint(200, 999)}-{rng.randint(200, 999)}-{rng.randint(1000, 9999)}',
+      'genres': rng.sample(GENRES, rng.randint(1, 3)),
+      'image_link': None,
+      'facebook_link': f'https://www.facebook.com/artist{artist_id}',
+      'seeking_venue': seeking,
+      'seeking_description': 'Touring this year' if seeking else None
+    }
+
+'''
+show_rows(rng, first_id, count, venue_ids, artist_ids, now)
+    one show per venue per slot, slots evenly spaced over SPAN with some
+    jitter; the artists of a slot are distinct so nobody is double-booked
+'''
+def show_rows(rng, first_id, count, venue_ids, artist_ids, now):
+  slots = -(-count // len(venue_ids))
+  spacing = max(SPAN / slots, SHOW_LENGTH + timedelta(minutes=30))
+  jitter_steps = int((spacing - SHOW_LENGTH) / timedelta(minutes=30))
+  start = now - SPAN / 2
+  show_id = first_id
+  for slot in range(slots):
+    offset = rng.randrange(len(artist_ids))
+    slot_start = start + spacing * slot
+    for position, venue_id in enumerate(venue_ids):
+      if show_id == first_id + count:
+        return
+      start_date = slot_start + timedelta(minutes=30 * rng.randint(0, min(jitter_steps, 48)))
+      yield {
+        'id': show_id,
+        'venue_id': venue_id,
+        'artist_id': artist_ids[(position + offset) % len(artist_ids)],
+        'start_date': start_date.replace(second=0, microsecond=0),
+        'end_date': start_date.replace(second=0, microsecond=0) + SHOW_LENGTH
+      }
+      show_id += 1
+
+def copy_value(value):
+  if value is None:
+    return None
+  if isinstance(value, list):
+    # postgres array literal
+    return '{' + ','.join('"%s"' % item.replace('"', '\\"') for item in value) + '}'
+  if isinstance(value, datetime):
+    return value.isoformat(sep=' ')
+  return value
+
+'''
+copy_rows(session, table, rows)
+    loads dict rows into `table` with COPY, COPY_CHUNK rows at a time
+'''
+def copy_rows(session, table, rows):
+  cursor = session.connection().connection.cursor()
+  total = 0
+  columns = None
+  while True:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    count = 0
+    for row in rows:
+      columns = columns or list(row)
+      writer.writerow(['\\N' if copy_value(row[column]) is None else copy_value(row[column])
+                       for column in columns])
+      count += 1
+      if count == COPY_CHUNK:
+        break
+    if not count:
+      break
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+                       buffer)
+    total += count
+    if count < COPY_CHUNK:
+      break
+  cursor.close()
+  # move the id sequence past the copied ids
+  session.execute(text(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                       f"(SELECT coalesce(max(id), 1) FROM {table}))"))
+  return total
+
+'''
+generate(session, models, scale, seed)
+    appends the venues, artists and shows of `scale` (a key of SCALES or
+    a dict of counts) and rebuilds the show counters
+'''
+def generate(session, models, scale='1k', seed=0, now=None, report=print):
+  from counters import verify_counters
+  Venue, Artist, Show = models
+  counts = SCALES[scale] if isinstance(scale, str) else scale
+  rng = random.Random(seed)
+  now = (now or datetime.now()).replace(minute=0, second=0, microsecond=0)
+  areas = cities(rng, max(10, counts['venues'] // 20))
+
+  first = {model: (session.query(func.max(model.id)).scalar() or 0) + 1
+           for model in (Venue, Artist, Show)}
+  venues = copy_rows(session, 'venues', venue_rows(rng, first[Venue], counts['venues'], areas))
+  report(f'{venues} venues')
+  artists = copy_rows(session, 'artists', artist_rows(rng, first[Artist], counts['artists'], areas))
+  report(f'{artists} artists')
+  venue_ids = list(range(first[Venue], first[Venue] + counts['venues']))
+  artist_ids = list(range(first[Artist], first[Artist] + counts['artists']))
+  shows = copy_rows(session, 'shows', show_rows(rng, first[Show], counts['shows'],
+                                                venue_ids, artist_ids, now))
+  report(f'{shows} shows')
+
+  verify_counters(session, Venue, Show, Show.venue_id, datetime.now())
+  verify_counters(session, Artist, Show, Show.artist_id, datetime.now())
+  session.commit()
+  report('counters rebuilt')
+  return venues, artists, shows
+
+def main():
+  parser = argparse.ArgumentParser(description='Fill the database with synthetic data.')
+  parser.add_argument('--scale', choices=sorted(SCALES), default='1k')
+  parser.add_argument('--seed', type=int, default=0)
+  args = parser.parse_args()
+
+  from app import create_app, db, Venue, Artist, Show
+  with create_app().app_context():
+    generate(db.session, (Venue, Artist, Show), args.scale, args.seed)
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,140 @@
+#----------------------------------------------------------------------------#
+# Double-booking detection.
+#----------------------------------------------------------------------------#
+
+# A venue or an artist can't have two shows whose [start_date, end_date)
+# periods overlap. Postgres enforces this with exclusion constraints over a
+# GiST index. The id is compared as a single-value int4range, which GiST
+# supports natively, so the btree_gist extension isn't needed.
+#
+# Exclusion constraints can't be declared on the partitioned `shows` table,
+# so every monthly partition carries its own. Two shows in different
+# partitions can still overlap across a month boundary, which is why new
+# shows are also probed with check_availability before they are inserted.
+# Other databases have neither ranges nor exclusion constraints, there the
+# probes compare the dates directly.
+
+from datetime import timedelta
+from sqlalchemy import (text, select, literal, union_all, exists, or_, table, column,
+                        Integer, DateTime)
+
+from portable import dialect_name
+
+# length of a show when none is given, in minutes
+DEFAULT_SHOW_DURATION = 120
+
+BOOKING_CONSTRAINT = '''
+ALTER TABLE {table} ADD CONSTRAINT ex_{table}_{name} EXCLUDE USING gist (
+  int4range({key}, {key}, '[]') WITH =,
+  tsrange(start_date, end_date) WITH &&
+)
+'''
+
+BOOKING_CONSTRAINTS = {
+  'venue_id': 'venue_booking',
+  'artist_id': 'artist_booking'
+}
+
+def booking_constraints(table):
+  return [BOOKING_CONSTRAINT.format(table=table, name=name, key=key)
+          for key, name in BOOKING_CONSTRAINTS.items()]
+
+# one row per probe, each side checked with an index probe on the
+# constraint's GiST index
+AVAILABILITY_QUERY = text('''
+SELECT probe.venue_id IS NULL OR NOT EXISTS (
+    SELECT 1 FROM shows
+    WHERE int4range(shows.venue_id, shows.venue_id, '[]') = int4range(probe.venue_id, probe.venue_id, '[]')
+      AND tsrange(shows.start_date, shows.end_date) && tsrange(probe.start_date, probe.end_date)
+  ) AS venue_available,
+  probe.artist_id IS NULL OR NOT EXISTS (
+    SELECT 1 FROM shows
+    WHERE int4range(shows.artist_id, shows.artist_id, '[]') = int4range(probe.artist_id, probe.artist_id, '[]')
+      AND tsrange(shows.start_date, shows.end_date) && tsrange(probe.start_date, probe.end_date)
+  ) AS artist_available
+FROM unnest(CAST(:venue_ids AS integer[]), CAST(:artist_ids AS integer[]),
+            CAST(:start_dates AS timestamp[]), CAST(:end_dates AS timestamp[]))
+  WITH ORDINALITY AS probe(venue_id, artist_id, start_date, end_date, position)
+ORDER BY probe.position
+''')
+
+SHOWS = table('shows', column('venue_id'), column('artist_id'),
+              column('start_date'), column('end_date'))
+
+def portable_availability_query(probes):
+  probe = union_all(*(select(
+      literal(probe.get('venue_id'), Integer).label('venue_id'),
+      literal(probe.get('artist_id'), Integer).label('artist_id'),
+      literal(probe['start_date'], DateTime).label('start_date'),
+      literal(probe['end_date'], DateTime).label('end_date'),
+      literal(position, Integer).label('position')) for position, probe in enumerate(probes))).cte('probe')
+
+  def available(key):
+    return or_(probe.c[key].is_(None), ~exists().where(
+        SHOWS.c[key] == probe.c[key],
+        SHOWS.c.start_date < probe.c.end_date, probe.c.start_date < SHOWS.c.end_date))
+
+  return select(available('venue_id').label('venue_available'),
+                available('artist_id').label('artist_available')).order_by(probe.c.position)
+
+'''
+show_end_date(start_date, duration, end_date)
+    the end of a show from its end date or its duration in minutes,
+    DEFAULT_SHOW_DURATION when neither is given; raises ValueError unless
+    the show ends after it starts
+'''
+def show_end_date(start_date, duration=None, end_date=None):
+  if end_date is None:
+    end_date = start_date + timedelta(
+        minutes=DEFAULT_SHOW_DURATION if duration is None else duration)
+  # an empty range would fail tsrange() and the exclusion constraints
+  if end_date <= start_date:
+    raise ValueError('a show must end after it starts')
+  return end_date
+
+'''
+check_availability(session, probes)
+    answers many (venue, artist, start_date, end_date) probes in one query;
+    a probe may leave out the venue or the artist, which is then reported
+    as available
+'''
+def check_availability(session, probes):
+  if not probes:
+    return []
+  if dialect_name(session) != 'postgresql':
+    rows = session.execute(portable_availability_query(probes))
+  else:
+    rows = session.execute(AVAILABILITY_QUERY, {
+      'venue_ids': [probe.get('venue_id') for probe in probes],
+      'artist_ids': [probe.get('artist_id') for probe in probes],
+      'start_dates': [probe['start_date'] for probe in probes],
+      'end_dates': [probe['end_date'] for probe in probes]
+    })
+  return [(bool(row.venue_available), bool(row.artist_available)) for row in rows]
+
+'''
+booking_conflicts(session, shows)
+    why each of a batch of new shows can't be booked, None for those that
+    can; a show may clash with a stored show or with an earlier show of
+    the batch, which is then booked in its place
+'''
+def booking_conflicts(session, shows):
+  booked = {}
+  conflicts = []
+  for show, (venue_available, artist_available) in zip(shows, check_availability(session, shows)):
+    conflict = None
+    if not venue_available:
+      conflict = 'the venue is already booked at that time'
+    elif not artist_available:
+      conflict = 'the artist is already booked at that time'
+    else:
+      for key in ('venue_id', 'artist_id'):
+        if any(start < show['end_date'] and show['start_date'] < end
+               for start, end in booked.get((key, show[key]), [])):
+          conflict = f'the {key[:-3]} has another show of the batch at that time'
+          break
+    if conflict is None:
+      for key in ('venue_id', 'artist_id'):
+        booked.setdefault((key, show[key]), []).append((show['start_date'], show['end_date']))
+    conflicts.append(conflict)
+  return conflicts
@@ -0,0 +1,67 @@
+#----------------------------------------------------------------------------#
+# Genre, city and state filters for the venue and artist lists.
+#----------------------------------------------------------------------------#
+
+# Genre filters use the array operators served by the GIN indexes on
+# `genres`: @> when every genre must match and && when any may. Facet
+# counts per genre depend on the filters alone, not on the page, so they
+# are counted by a query of their own that callers run once per filter set
+# and change of the table, whatever page is asked for.
+
+import json
+from sqlalchemy import func, true
+
+from portable import array_elements
+
+'''
+browse_filters(args)
+    reads the ?genre= (repeatable), ?match=any|all, ?city= and ?state=
+    filters from the query string
+'''
+def browse_filters(args):
+  return {
+    'genres': [genre for genre in args.getlist('genre') if genre],
+    'match': 'all' if args.get('match') == 'all' else 'any',
+    'city': args.get('city', '').strip(),
+    'state': args.get('state', '').strip().upper()
+  }
+
+def apply_filters(query, model, filters):
+  if filters['genres']:
+    if filters['match'] == 'all':
+      query = query.filter(model.genres.has_all(filters['genres']))
+    else:
+      query = query.filter(model.genres.has_any(filters['genres']))
+  if filters['city']:
+    query = query.filter(model.city == filters['city'])
+  if filters['state']:
+    query = query.filter(model.state == filters['state'])
+  return query
+
+'''
+facet_key(filters)
+    the same key for every spelling of a filter set
+'''
+def facet_key(filters):
+  return json.dumps(dict(filters, genres=sorted(set(filters['genres']))), sort_keys=True)
+
+'''
+genre_facets(session, model, filters)
+    genre -> number of filtered entities having it
+'''
+def genre_facets(session, model, filters):
+  genres = array_elements(session, model.genres)
+  return dict(apply_filters(session.query(genres.c.value, func.count())
+                            .select_from(model).join(genres, true()),
+                            model, filters).group_by(genres.c.value).all())
+
+'''
+facet_list(facets, filters)
+    genres with their counts, most common first; selected genres are kept
+    even when nothing matches them
+'''
+def facet_list(facets, filters):
+  facets = dict(facets or {})
+  for genre in filters['genres']:
+    facets.setdefault(genre, 0)
+  return sorted(facets.items(), key=lambda facet: (-facet[1], facet[0]))
@@ -0,0 +1,200 @@
+#----------------------------------------------------------------------------#
+# Rendered fragment cache.
+#----------------------------------------------------------------------------#
+
+# Fragments are stored under "<kind>:<id>:<generation>.<version>".
+# Invalidating an entity bumps its version, clearing the cache bumps the
+# generation, so every stale copy becomes unreachable at once, on any
+# backend, and is left to age out through the LRU or the TTL. Callers read
+# the version before querying and store the fragment under it, so a page
+# rendered from rows that changed meanwhile lands under a dead version.
+# Counters only ever go up, a dead version never comes back.
+
+import time
+import threading
+from collections import OrderedDict
+
+#----------------------------------------------------------------------------#
+# Backends.
+#----------------------------------------------------------------------------#
+
+class LRUCache(object):
+  """In-process least recently used cache with a time to live"""
+
+  def __init__(self, maxsize=1024, ttl=300):
+    self.maxsize = maxsize
+    self.ttl = ttl
+    self.data = OrderedDict()
+    # versions are kept apart, out of reach of the LRU
+    self.counters = {}
+    self.lock = threading.Lock()
+
+  def get(self, key):
+    with self.lock:
+      if key in self.counters:
+        return self.counters[key]
+      item = self.data.get(key)
+      if item is None:
+        return None
+      value, expires = item
+      if expires < time.monotonic():
+        del self.data[key]
+        return None
+      self.data.move_to_end(key)
+      return value
+
+  def set(self, key, value):
+    with self.lock:
+      self.data[key] = (value, time.monotonic() + self.ttl)
+      self.data.move_to_end(key)
+      while len(self.data) > self.maxsize:
+        self.data.popitem(last=False)
+
+  def incr(self, key):
+    with self.lock:
+      # versions never expire, they must outlive the fragments they guard
+      value = self.counters[key] = self.counters.get(key, 0) + 1
+      return value
+
+  def clear(self):
+    with self.lock:
+      self.data.clear()
+
+class SharedCache(object):
+  """Cache shared between workers, backed by a redis style client"""
+
+  def __init__(self, client, ttl=300, prefix='fyyur:'):
+    self.client = client
+    self.ttl = ttl
+    self.prefix = prefix
+
+  def get(self, key):
+    value = self.client.get(self.prefix + key)
+    return value.decode() if isinstance(value, bytes) else value
+
+  def set(self, key, value):
+    self.client.set(self.prefix + key, value, ex=self.ttl)
+
+  def incr(self, key):
+    return self.client.incr(self.prefix + key)
+
+  def clear(self):
+    for key in self.client.scan_iter(self.prefix + '*'):
+      self.client.delete(key)
+
+class LocalClient(object):
+  """Local stand-in for the redis client used by SharedCache"""
+
+  def __init__(self):
+    self.data = {}
+    self.lock = threading.Lock()
+
+  def get(self, key):
+    with self.lock:
+      item = self.data.get(key)
+      if item is None:
+        return None
+      value, expires = item
+      if expires is not None and expires < time.monotonic():
+        del self.data[key]
+        return None
+      return value
+
+  def set(self, key, value, ex=None):
+    with self.lock:
+      self.data[key] = (value, time.monotonic() + ex if ex else None)
+
+  def incr(self, key):
+    with self.lock:
+      value = int(self.data.get(key, (0, None))[0]) + 1
+      self.data[key] = (value, None)
+      return value
+
+  def delete(self, key):
+    with self.lock:
+      self.data.pop(key, None)
+
+  def scan_iter(self, match):
+    with self.lock:
+      return [key for key in self.data if key.startswith(match.rstrip('*'))]
+
+#----------------------------------------------------------------------------#
+# Fragment cache.
+#----------------------------------------------------------------------------#
+
+class FragmentCache(object):
+  """Versioned fragment cache counting its hits and misses"""
+
+  def __init__(self, backend=None):
+    self.backend = backend
+    self.lock = threading.Lock()
+    self.hits = 0
+    self.misses = 0
+
+  def init_app(self, app):
+    self.backend = create_backend(app.config)
+    with self.lock:
+      self.hits = self.misses = 0
+
+  def version(self, kind, entity_id):
+    generation = self.backend.get('generation') or 0
+    return f"{generation}.{self.backend.get(f'{kind}:{entity_id}:version') or 0}"
+
+  def get(self, kind, entity_id, version=None):
+    if version is None:
+      version = self.version(kind, entity_id)
+    value = self.backend.get(f'{kind}:{entity_id}:{version}')
+    with self.lock:
+      if value is None:
+        self.misses += 1
+      else:
+        self.hits += 1
+    return value
+
+  '''
+  set(kind, entity_id, value, version)
+      stores a fragment under the version read before the rows it was
+      rendered from: invalidated in between, it is never served
+  '''
+  def set(self, kind, entity_id, value, version):
+    self.backend.set(f'{kind}:{entity_id}:{version}', value)
+
+  def invalidate(self, kind, *entity_ids):
+    for entity_id in entity_ids:
+      self.backend.incr(f'{kind}:{entity_id}:version')
+
+  '''
+  clear()
+      drops every fragment by moving on to a new generation, the versions
+      are kept so no dead one is ever reached again
+  '''
+  def clear(self):
+    self.backend.incr('generation')
+    with self.lock:
+      self.hits = self.misses = 0
+
+  def stats(self):
+    with self.lock:
+      hits, misses = self.hits, self.misses
+    lookups = hits + misses
+    return {
+      'hits': hits,
+      'misses': misses,
+      'hit_ratio': hits / lookups if lookups else 0.0
+    }
+
+'''
+create_backend(config)
+    builds the cache backend described by the FRAGMENT_CACHE* settings
+'''
+def create_backend(config):
+  backend = config.get('FRAGMENT_CACHE', 'lru')
+  ttl = config.get('FRAGMENT_CACHE_TTL', 300)
+  if backend == 'lru':
+    return LRUCache(config.get('FRAGMENT_CACHE_SIZE', 1024), ttl)
+  if backend == 'local':
+    return SharedCache(LocalClient(), ttl)
+  if backend == 'redis':
+    import redis
+    return SharedCache(redis.Redis.from_url(config['FRAGMENT_CACHE_URL']), ttl)
+  raise ValueError(f'unknown fragment cache backend {backend}')
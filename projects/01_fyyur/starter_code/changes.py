@@ -0,0 +1,260 @@
+#----------------------------------------------------------------------------#
+# Change notifications between workers.
+#----------------------------------------------------------------------------#
+
+# Every worker keeps caches of its own: rendered pages in the lru backend,
+# table versions and the recommendation matrices. The write handlers
+# publish what they changed (tables, venue ids, artist ids) inside their
+# transaction. Once it commits, the worker evicts its own caches right away
+# and the change goes out on a Postgres NOTIFY channel, which only delivers
+# committed notifications; a rolled back change is never seen. A listener
+# thread in every worker receives the changes of the other workers and
+# evicts the same entries. LocalChannel is an in-process stand-in with the
+# same commit semantics.
+
+import os
+import json
+import uuid
+import queue
+import select
+import logging
+import threading
+from sqlalchemy import create_engine, event, func, select as select_statement
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool
+
+CHANNEL = 'fyyur_changes'
+
+# NOTIFY payloads must stay under 8000 bytes, larger changes are sent
+# without their ids and evict everything of their kind
+PAYLOAD_LIMIT = 7900
+
+# seconds to wait before reconnecting a listener that lost its connection
+RECONNECT_DELAY = 5
+
+logger = logging.getLogger(__name__)
+
+class PostgresChannel(object):
+  """NOTIFY/LISTEN channel of the Postgres database at `url`"""
+
+  def __init__(self, url, channel=CHANNEL):
+    self.url = url
+    self.channel = channel
+
+  def send(self, session, payload):
+    session.execute(select_statement(func.pg_notify(self.channel, payload)))
+
+  def subscribe(self):
+    return PostgresSubscription(self.url, self.channel)
+
+  def close(self):
+    # every subscription holds, and closes, a connection of its own
+    pass
+
+class PostgresSubscription(object):
+  """Dedicated connection LISTENing on a channel"""
+
+  def __init__(self, url, channel):
+    # outside of the app's pool, the connection is held for good
+    self.engine = create_engine(url, poolclass=NullPool)
+    self.connection = self.engine.raw_connection()
+    self.connection.dbapi_connection.autocommit = True
+    cursor = self.connection.cursor()
+    cursor.execute(f'LISTEN {channel}')
+    cursor.close()
+
+  def receive(self, timeout):
+    raw = self.connection.dbapi_connection
+    if not raw.notifies and select.select([raw], [], [], timeout)[0]:
+      raw.poll()
+    payloads = [notify.payload for notify in raw.notifies]
+    del raw.notifies[:]
+    return payloads
+
+  def close(self):
+    self.connection.close()
+    self.engine.dispose()
+
+class LocalChannel(object):
+  """In-process stand-in for PostgresChannel, delivering on commit"""
+
+  def __init__(self):
+    self.subscribers = []
+    self.lock = threading.Lock()
+    self.key = f'changes:{id(self)}'
+    event.listen(Session, 'after_commit', self.deliver)
+    event.listen(Session, 'after_rollback', self.discard)
+
+  def send(self, session, payload):
+    session.info.setdefault(self.key, []).append(payload)
+
+  def deliver(self, session):
+    payloads = session.info.pop(self.key, [])
+    with self.lock:
+      for subscriber in self.subscribers:
+        for payload in payloads:
+          subscriber.put(payload)
+
+  def discard(self, session):
+    session.info.pop(self.key, None)
+
+  def subscribe(self):
+    subscription = LocalSubscription(self)
+    with self.lock:
+      self.subscribers.append(subscription.queue)
+    return subscription
+
+  def close(self):
+    if event.contains(Session, 'after_commit', self.deliver):
+      event.remove(Session, 'after_commit', self.deliver)
+      event.remove(Session, 'after_rollback', self.discard)
+
+class LocalSubscription(object):
+
+  def __init__(self, channel):
+    self.channel = channel
+    self.queue = queue.Queue()
+
+  def receive(self, timeout):
+    try:
+      payloads = [self.queue.get(timeout=timeout)]
+    except queue.Empty:
+      return []
+    while not self.queue.empty():
+      payloads.append(self.queue.get_nowait())
+    return payloads
+
+  def close(self):
+    with self.channel.lock:
+      self.channel.subscribers.remove(self.queue)
+
+class ChangeFeed(object):
+  """Publishes changes and applies those of the other workers"""
+
+  def __init__(self, channel, handler):
+    # set up by init_app() when not given
+    self.channel = channel
+    # handler(tables, venue_ids, artist_ids, remote), ids are None when
+    # unknown and remote is False for the changes of this process
+    self.handler = handler
+    self.origin = uuid.uuid4().hex
+    self.key = f'changes:{id(self)}'
+    self.thread = None
+    self.pid = None
+    self.stopping = threading.Event()
+    self.subscribed = threading.Event()
+    # channels built by init_app() are closed with the feed, given ones
+    # belong to the caller
+    self.owns_channel = False
+    event.listen(Session, 'after_commit', self.committed)
+    event.listen(Session, 'after_rollback', self.rolled_back)
+
+  def init_app(self, app):
+    # a listener of a previous app would keep its old channel
+    if self.thread is not None:
+      self.stop()
+    if self.owns_channel:
+      self.channel.close()
+    self.channel = create_channel(app.config)
+    self.owns_channel = True
+
+  '''
+  publish(session, tables, venue_ids, artist_ids)
+      announces a change of the current transaction of `session`, applied
+      here and in the other workers once it commits
+  '''
+  def publish(self, session, tables, venue_ids=(), artist_ids=()):
+    change = {'origin': self.origin, 'tables': list(tables),
+              'venue': sorted(set(map(int, venue_ids))),
+              'artist': sorted(set(map(int, artist_ids)))}
+    session.info.setdefault(self.key, []).append(dict(change))
+    payload = json.dumps(change)
+    if len(payload) > PAYLOAD_LIMIT:
+      change.update(venue=None if change['venue'] else [],
+                    artist=None if change['artist'] else [])
+      payload = json.dumps(change)
+    self.channel.send(session, payload)
+
+  def committed(self, session):
+    for change in session.info.pop(self.key, []):
+      self.handler(change['tables'], change['venue'], change['artist'], False)
+
+  def rolled_back(self, session):
+    session.info.pop(self.key, None)
+
+  def apply(self, payload):
+    change = json.loads(payload)
+    if change['origin'] != self.origin:
+      self.handler(change['tables'], change['venue'], change['artist'], True)
+
+  '''
+  start()
+      starts the listener thread of this process; safe to call on every
+      request, a forked worker gets a thread of its own
+  '''
+  def start(self):
+    if self.pid == os.getpid():
+      return
+    self.pid = os.getpid()
+    self.stopping.clear()
+    self.subscribed.clear()
+    self.thread = threading.Thread(target=self.listen, name='change-feed', daemon=True)
+    self.thread.start()
+
+  def stop(self):
+    self.stopping.set()
+    if self.thread is not None:
+      self.thread.join()
+    self.thread = self.pid = None
+
+  '''
+  close()
+      shuts the feed down for good: stops the listener and removes the
+      session listeners of the feed and of its own channel
+  '''
+  def close(self):
+    self.stop()
+    if event.contains(Session, 'after_commit', self.committed):
+      event.remove(Session, 'after_commit', self.committed)
+      event.remove(Session, 'after_rollback', self.rolled_back)
+    if self.owns_channel:
+      self.channel.close()
+      self.owns_channel = False
+
+  def listen(self):
+    reconnecting = False
+    while not self.stopping.is_set():
+      try:
+        subscription = self.channel.subscribe()
+      except Exception:
+        logger.exception('change feed could not subscribe')
+        reconnecting = True
+        self.stopping.wait(RECONNECT_DELAY)
+        continue
+      try:
+        if reconnecting:
+          # whatever happened while disconnected is unknown
+          self.handler(['venues', 'artists', 'shows'], None, None, True)
+        self.subscribed.set()
+        while not self.stopping.is_set():
+          for payload in subscription.receive(timeout=1):
+            self.apply(payload)
+      except Exception:
+        logger.exception('change feed listener failed')
+        reconnecting = True
+        self.stopping.wait(RECONNECT_DELAY)
+      finally:
+        subscription.close()
+
+'''
+create_channel(config)
+    builds the channel described by the CHANGE_FEED setting, on the app's
+    own database
+'''
+def create_channel(config):
+  channel = config.get('CHANGE_FEED', 'postgres')
+  if channel == 'postgres':
+    return PostgresChannel(config['SQLALCHEMY_DATABASE_URI'])
+  if channel == 'local':
+    return LocalChannel()
+  raise ValueError(f'unknown change feed {channel}')
@@ -0,0 +1,167 @@
+#----------------------------------------------------------------------------#
+# Response compression.
+#----------------------------------------------------------------------------#
+
+# Text responses are compressed with the best encoding the request accepts,
+# brotli before gzip. Whole responses are compressed once, when they are
+# over COMPRESS_MIN_SIZE bytes; streamed ones chunk by chunk as they are
+# produced, each chunk flushed so the client still gets it right away, and
+# never buffered. Responses that already have a Content-Encoding (the
+# precompressed built assets), files sent as they are and formats that are
+# compressed already are left alone. Bytes in and out and the CPU time
+# spent compressing are counted per encoding.
+
+import zlib
+import threading
+from time import thread_time
+from flask import request
+
+try:
+  import brotli
+except ImportError:
+  brotli = None
+
+COMPRESSIBLE_MIMETYPES = {
+  'text/html', 'text/css', 'text/plain', 'text/calendar', 'text/csv', 'text/javascript',
+  'application/json', 'application/x-ndjson', 'application/javascript', 'image/svg+xml'
+}
+
+class GzipCompressor(object):
+  """Incremental gzip stream"""
+
+  def __init__(self, level):
+    self.compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+
+  def compress(self, data):
+    return self.compressor.compress(data)
+
+  def flush(self):
+    return self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+  def finish(self):
+    return self.compressor.flush(zlib.Z_FINISH)
+
+class BrotliCompressor(object):
+  """Incremental brotli stream"""
+
+  def __init__(self, quality):
+    self.compressor = brotli.Compressor(quality=quality)
+
+  def compress(self, data):
+    return self.compressor.process(data)
+
+  def flush(self):
+    return self.compressor.flush()
+
+  def finish(self):
+    return self.compressor.finish()
+
+class ResponseCompression(object):
+  """Compresses the responses of an app and counts what it saved"""
+
+  def __init__(self, app=None):
+    self.lock = threading.Lock()
+    self.clear()
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    self.min_size = app.config.get('COMPRESS_MIN_SIZE', 500)
+    self.gzip_level = app.config.get('COMPRESS_GZIP_LEVEL', 6)
+    # dynamic pages can't afford the slow top qualities
+    self.brotli_quality = app.config.get('COMPRESS_BROTLI_QUALITY', 4)
+    self.encodings = (['br'] if brotli is not None else []) + ['gzip']
+    app.after_request(self.compress)
+
+  def clear(self):
+    with self.lock:
+      self.counts = {}
+
+  def compressor(self, encoding):
+    if encoding == 'br':
+      return BrotliCompressor(self.brotli_quality)
+    return GzipCompressor(self.gzip_level)
+
+  def record(self, encoding, size, compressed_size, cpu_time):
+    with self.lock:
+      counts = self.counts.setdefault(
+          encoding, {'responses': 0, 'bytes_in': 0, 'bytes_out': 0, 'cpu_time': 0.0})
+      counts['responses'] += 1
+      counts['bytes_in'] += size
+      counts['bytes_out'] += compressed_size
+      counts['cpu_time'] += cpu_time
+
+  '''
+  compress(response)
+      after_request hook compressing the response when the request accepts
+      an encoding and the response is worth it
+  '''
+  def compress(self, response):
+    if (response.mimetype not in COMPRESSIBLE_MIMETYPES or response.direct_passthrough
+        or 'Content-Encoding' in response.headers
+        or 'no-transform' in response.headers.get('Cache-Control', '')):
+      return response
+    # the same URL has a variant per encoding from here on
+    response.vary.add('Accept-Encoding')
+    if (request.method == 'HEAD' or response.status_code < 200
+        or response.status_code in (204, 206, 304)):
+      return response
+    encoding = request.accept_encodings.best_match(self.encodings)
+    if encoding is None:
+      return response
+
+    if response.is_streamed:
+      response.response = self.compressed_chunks(response.response, encoding)
+      response.headers.pop('Content-Length', None)
+    else:
+      data = response.get_data()
+      if len(data) < self.min_size:
+        return response
+      started = thread_time()
+      compressor = self.compressor(encoding)
+      compressed = compressor.compress(data) + compressor.finish()
+      self.record(encoding, len(data), len(compressed), thread_time() - started)
+      response.set_data(compressed)
+
+    response.content_encoding = encoding
+    # the compressed bytes aren't those a strong ETag was computed from
+    etag, weak = response.get_etag()
+    if etag and not weak:
+      response.set_etag(etag, weak=True)
+    return response
+
+  def compressed_chunks(self, chunks, encoding):
+    compressor = self.compressor(encoding)
+    size = compressed_size = 0
+    cpu_time = 0.0
+    try:
+      for chunk in chunks:
+        if isinstance(chunk, str):
+          chunk = chunk.encode('utf-8')
+        started = thread_time()
+        compressed = compressor.compress(chunk) + compressor.flush()
+        cpu_time += thread_time() - started
+        size += len(chunk)
+        compressed_size += len(compressed)
+        yield compressed
+      started = thread_time()
+      compressed = compressor.finish()
+      cpu_time += thread_time() - started
+      compressed_size += len(compressed)
+      yield compressed
+      self.record(encoding, size, compressed_size, cpu_time)
+    finally:
+      # closing the streamed chunks tears down their request context
+      if hasattr(chunks, 'close'):
+        chunks.close()
+
+  '''
+  stats()
+      responses, bytes in and out, compression ratio (bytes in per byte
+      out) and CPU seconds spent, per encoding
+  '''
+  def stats(self):
+    with self.lock:
+      return {encoding: dict(counts, ratio=counts['bytes_in'] / counts['bytes_out']
+                             if counts['bytes_out'] else 0.0)
+              for encoding, counts in self.counts.items()}
@@ -0,0 +1,89 @@
+#----------------------------------------------------------------------------#
+# Conditional GET and content negotiation.
+#----------------------------------------------------------------------------#
+
+# Every table has a change version that the write handlers bump. The weak
+# ETag of a read endpoint is derived from the versions of the tables it
+# reads, its URL and the negotiated variant (its mimetype), so a client
+# sending back a matching If-None-Match gets 304 Not Modified before the
+# view runs: no query, no render. Views whose default range starts today
+# also key their ETag on the date, so a new day is never answered with the
+# window of the previous one. Versions live in the shared cache backend
+# when there is one; versions kept in the process are salted with a random
+# epoch, so another worker, or a restart, never answers 304 by mistake.
+
+import uuid
+import hashlib
+import threading
+from datetime import date
+from functools import wraps
+from flask import request, session, make_response
+
+JSON_MIMETYPE = 'application/json'
+HTML_MIMETYPE = 'text/html'
+
+def wants_json():
+  best = request.accept_mimetypes.best_match([HTML_MIMETYPE, JSON_MIMETYPE])
+  return best == JSON_MIMETYPE
+
+class ChangeVersions(object):
+  """Change version of every table, in a shared cache or in this process"""
+
+  def __init__(self, backend=None, salt=lambda: '', today=date.today):
+    self.salt = salt
+    self.today = today
+    self.lock = threading.Lock()
+    self.set_backend(backend)
+
+  def set_backend(self, backend):
+    self.backend = backend
+    self.versions = {}
+    self.epoch = '' if backend is not None else uuid.uuid4().hex
+
+  def get(self, *tables):
+    if self.backend is not None:
+      return [int(self.backend.get(f'table:{table}:version') or 0) for table in tables]
+    with self.lock:
+      return [self.versions.get(table, 0) for table in tables]
+
+  def touch(self, *tables):
+    for table in tables:
+      if self.backend is not None:
+        self.backend.incr(f'table:{table}:version')
+      else:
+        with self.lock:
+          self.versions[table] = self.versions.get(table, 0) + 1
+
+  def etag(self, tables, variant, day=None):
+    # read before the view runs: a write racing the query only costs a miss
+    parts = [self.epoch, self.salt(), request.full_path, variant, day] + self.get(*tables)
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+  '''
+  conditional(*tables, variants, daily)
+      decorator answering 304 to requests whose If-None-Match matches the
+      ETag of the tables read by the view, and tagging its other responses;
+      variants are the mimetypes the view negotiates between, daily views
+      depend on the current date
+  '''
+  def conditional(self, *tables, variants=(HTML_MIMETYPE, JSON_MIMETYPE), daily=False):
+    def decorator(view):
+      @wraps(view)
+      def wrapper(*args, **kwargs):
+        # pages showing flashed messages are one-offs
+        if '_flashes' in session:
+          return view(*args, **kwargs)
+        variant = request.accept_mimetypes.best_match(variants)
+        etag = self.etag(tables, variant, self.today().isoformat() if daily else None)
+        if request.if_none_match.contains_weak(etag):
+          response = make_response('', 304)
+        else:
+          response = make_response(view(*args, **kwargs))
+          if response.status_code != 200:
+            return response
+        response.set_etag(etag, weak=True)
+        response.cache_control.no_cache = True
+        response.vary.add('Accept')
+        return response
+      return wrapper
+    return decorator
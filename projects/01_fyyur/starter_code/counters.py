@@ -0,0 +1,79 @@
+#----------------------------------------------------------------------------#
+# Denormalized show counters for venues and artists.
+#----------------------------------------------------------------------------#
+
+# Venue and Artist carry `upcoming_shows_count`, `past_shows_count` and
+# `next_show_date` so pages never have to count shows. New shows bump the
+# counters in the same transaction (count_show), and a periodic roll-over
+# (roll_over) moves shows that have started from upcoming to past; only
+# entities whose `next_show_date` has passed are touched by it.
+
+from sqlalchemy import func, or_
+
+from portable import least
+
+'''
+expected_counters(session, model, show_model, show_key, now)
+    correlated subqueries computing the counters of `model` from the shows
+'''
+def expected_counters(session, model, show_model, show_key, now):
+  upcoming = session.query(func.count(show_model.id)).filter(
+      show_key == model.id, show_model.start_date > now).scalar_subquery()
+  past = session.query(func.count(show_model.id)).filter(
+      show_key == model.id, show_model.start_date <= now).scalar_subquery()
+  next_show = session.query(func.min(show_model.start_date)).filter(
+      show_key == model.id, show_model.start_date > now).scalar_subquery()
+  return {
+    model.upcoming_shows_count: upcoming,
+    model.past_shows_count: past,
+    model.next_show_date: next_show
+  }
+
+'''
+count_show(session, model, entity_id, start_date, now)
+    adds a new show to the counters of one venue or artist
+'''
+def count_show(session, model, entity_id, start_date, now):
+  if start_date > now:
+    values = {
+      model.upcoming_shows_count: model.upcoming_shows_count + 1,
+      model.next_show_date: least(
+          func.coalesce(model.next_show_date, start_date), start_date)
+    }
+  else:
+    values = {model.past_shows_count: model.past_shows_count + 1}
+  session.query(model).filter(model.id == entity_id).update(
+      values, synchronize_session=False)
+
+'''
+roll_over(session, model, show_model, show_key, now)
+    recounts the entities whose next show has started, returns how many
+'''
+def roll_over(session, model, show_model, show_key, now):
+  return session.query(model).filter(model.next_show_date <= now).update(
+      expected_counters(session, model, show_model, show_key, now),
+      synchronize_session=False)
+
+'''
+recount(session, model, show_model, show_key, now, ids)
+    recounts the given entities, used after shows are loaded in bulk
+'''
+def recount(session, model, show_model, show_key, now, ids):
+  return session.query(model).filter(model.id.in_(ids)).update(
+      expected_counters(session, model, show_model, show_key, now),
+      synchronize_session=False)
+
+'''
+verify_counters(session, model, show_model, show_key, now)
+    rebuilds every counter from scratch, returns the rows that had drifted
+    as (id, stored counters, expected counters)
+'''
+def verify_counters(session, model, show_model, show_key, now):
+  expected = expected_counters(session, model, show_model, show_key, now)
+  columns = list(expected.keys())
+  drift = session.query(model.id, *(columns + list(expected.values()))).filter(or_(
+      *(column.is_distinct_from(value) for column, value in expected.items())
+  )).order_by(model.id).all()
+
+  session.query(model).update(expected, synchronize_session=False)
+  return [(row[0], row[1:len(columns) + 1], row[len(columns) + 1:]) for row in drift]
@@ -0,0 +1,35 @@
+#----------------------------------------------------------------------------#
+# Bulk deletion of venues and artists.
+#----------------------------------------------------------------------------#
+
+# Shows reference their venue and artist with ON DELETE CASCADE, so a
+# venue or artist is removed with a single DELETE and postgres drops its
+# shows itself, none of them are loaded into Python. Many entities are
+# deleted in batches of `batch_size` ids, one transaction per batch.
+
+from sqlalchemy import delete
+
+DELETE_BATCH_SIZE = 500
+
+'''
+delete_entities(session, model, show_key, other_key, ids, ...)
+    deletes the venues or artists with the given ids along with their
+    shows and returns the ids actually deleted; `after_batch` gets the
+    deleted ids and the ids on the other side of their shows, and runs in
+    the transaction of each batch
+'''
+def delete_entities(session, model, show_key, other_key, ids, after_batch=None,
+                    batch_size=DELETE_BATCH_SIZE):
+  ids = sorted({int(entity_id) for entity_id in ids})
+  deleted = []
+  for start in range(0, len(ids), batch_size):
+    batch = ids[start:start + batch_size]
+    # the other side of the shows about to go, their counters change
+    others = [row[0] for row in session.query(other_key).filter(show_key.in_(batch)).distinct()]
+    removed = [row[0] for row in session.execute(
+        delete(model.__table__).where(model.id.in_(batch)).returning(model.id))]
+    if after_batch:
+      after_batch(session, removed, others)
+    session.commit()
+    deleted.extend(removed)
+  return deleted
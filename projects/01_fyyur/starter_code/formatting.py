@@ -0,0 +1,50 @@
+#----------------------------------------------------------------------------#
+# Date formatting.
+#----------------------------------------------------------------------------#
+
+# The `datetime` filter runs once per show on list pages. Values are already
+# datetimes or strings in DATETIME_FORMAT, so they are only handed to
+# dateutil as a last resort, and babel patterns and locales are compiled
+# once per format and locale instead of on every call.
+
+from functools import lru_cache
+from datetime import datetime, timezone
+import dateutil.parser
+import babel.dates
+from babel import Locale
+
+# format of the start dates passed to the templates
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+DATETIME_PATTERNS = {
+  'full': "EEEE MMMM, d, y 'at' h:mma",
+  'medium': "EE MM, dd, y h:mma"
+}
+
+@lru_cache(maxsize=None)
+def compiled_pattern(format):
+  return babel.dates.parse_pattern(DATETIME_PATTERNS.get(format, format))
+
+@lru_cache(maxsize=None)
+def compiled_locale(locale):
+  return Locale.parse(locale or babel.dates.LC_TIME)
+
+'''
+to_datetime(value)
+    turns a filter argument into a datetime, parsing strings in the known
+    format with the C isoformat parser before falling back to dateutil
+'''
+def to_datetime(value):
+  if isinstance(value, datetime):
+    return value
+  try:
+    return datetime.fromisoformat(value)
+  except ValueError:
+    return dateutil.parser.parse(value)
+
+def format_datetime(value, format='medium', locale=None):
+  date = to_datetime(value)
+  if date.tzinfo is None:
+    # babel reads naive datetimes as UTC
+    date = date.replace(tzinfo=timezone.utc)
+  return compiled_pattern(format).apply(date, compiled_locale(locale))
@@ -0,0 +1,185 @@
+#----------------------------------------------------------------------------#
+# Bulk streaming importer.
+#----------------------------------------------------------------------------#
+
+# Records are streamed from CSV or NDJSON files, validated with the web
+# forms and inserted in batches with a single executemany per batch, so
+# memory stays bounded by the batch size whatever the file size. After
+# every committed batch the number of consumed records is written to a
+# checkpoint file, and a rerun resumes from there.
+
+import os
+import csv
+import json
+import time
+from itertools import islice
+from werkzeug.datastructures import MultiDict
+from wtforms.validators import DataRequired
+
+BATCH_SIZE = 1000
+
+'''
+read_records(path)
+    yields the records of a CSV or NDJSON file as dicts, one at a time
+'''
+def read_records(path):
+  with open(path, newline='') as f:
+    if path.endswith('.csv'):
+      for record in csv.DictReader(f):
+        yield record
+    else:
+      for line in f:
+        if line.strip():
+          yield json.loads(line)
+
+'''
+to_formdata(record)
+    turns a record into form data: lists stay multi-valued, CSV genres may
+    be separated by semicolons and false booleans are left out
+'''
+def to_formdata(record):
+  items = []
+  for name, value in record.items():
+    if name == 'genres' and isinstance(value, str):
+      value = [genre.strip() for genre in value.split(';') if genre.strip()]
+    if isinstance(value, list):
+      items.extend((name, item) for item in value)
+    elif value is True:
+      items.append((name, 'y'))
+    # 0 == False, a zero must still reach the form validators
+    elif value is not None and value is not False and value != '':
+      items.append((name, str(value)))
+  return MultiDict(items)
+
+'''
+form_validator(form_class, fields)
+    validates a record with a web form and returns the values of `fields`;
+    optional fields left blank are not checked, raises ValueError
+'''
+def form_validator(form_class, fields):
+  def validate(record):
+    formdata = to_formdata(record)
+    form = form_class(formdata=formdata, meta={'csrf': False})
+    form.validate()
+    errors = {name: error for name, error in form.errors.items()
+              if name in formdata or any(isinstance(validator, DataRequired)
+                                         for validator in form[name].validators)}
+    if errors:
+      raise ValueError(errors)
+    return {field: record.get(field) if field not in form else form[field].data
+            for field in fields}
+  return validate
+
+'''
+reference_resolver(model, key, name_key)
+    resolves a batch of foreign keys given either as ids or as names with
+    one query, rows with unknown references get an error instead
+'''
+def reference_resolver(model, key, name_key):
+  def resolve(session, rows):
+    for row in rows:
+      if row.get(key):
+        try:
+          row[key] = int(row[key])
+        except ValueError:
+          row['error'] = f'invalid {key} {row[key]}'
+    rows = [row for row in rows if 'error' not in row]
+    ids = {row[key] for row in rows if row.get(key)}
+    names = {row[name_key] for row in rows if not row.get(key) and row.get(name_key)}
+    known = set()
+    by_name = {}
+    if ids:
+      known = {entity.id for entity in session.query(model.id).filter(model.id.in_(ids))}
+    if names:
+      # the oldest entity wins when names are shared
+      for entity in session.query(model.id, model.name).filter(
+          model.name.in_(names)).order_by(model.id.desc()):
+        by_name[entity.name] = entity.id
+    for row in rows:
+      if row.get(key):
+        if row[key] not in known:
+          row['error'] = f'unknown {key} {row[key]}'
+      elif row.get(name_key) in by_name:
+        row[key] = by_name[row[name_key]]
+      else:
+        row['error'] = f'unknown {name_key} {row.get(name_key)}'
+  return resolve
+
+class Checkpoint(object):
+  """Number of records of a file already imported"""
+
+  def __init__(self, path):
+    self.path = path
+
+  def load(self):
+    if not self.path or not os.path.exists(self.path):
+      return 0
+    with open(self.path) as f:
+      return json.load(f)['records']
+
+  def save(self, records):
+    if not self.path:
+      return
+    # write then rename so a crash never leaves a torn checkpoint
+    with open(self.path + '.tmp', 'w') as f:
+      json.dump({'records': records}, f)
+    os.replace(self.path + '.tmp', self.path)
+
+  def clear(self):
+    if self.path and os.path.exists(self.path):
+      os.remove(self.path)
+
+'''
+import_records(session, records, table, validate, ...)
+    loads `records` into `table` in batches and returns the loaded and
+    rejected counts; `resolve` fills in the foreign keys of a batch and
+    `after_batch` runs in the transaction of each batch
+'''
+def import_records(session, records, table, validate, columns, resolve=None,
+                   after_batch=None, batch_size=BATCH_SIZE, checkpoint=None, report=print):
+  checkpoint = checkpoint or Checkpoint(None)
+  position = checkpoint.load()
+  records = enumerate(islice(records, position, None), start=position + 1)
+  loaded = rejected = 0
+  started = time.monotonic()
+
+  while True:
+    batch = list(islice(records, batch_size))
+    if not batch:
+      break
+
+    rows = []
+    for number, record in batch:
+      try:
+        row = validate(record)
+      except ValueError as e:
+        rejected += 1
+        report(f'record {number} rejected: {e}')
+        continue
+      row['record'] = number
+      rows.append(row)
+
+    if resolve:
+      resolve(session, rows)
+      for row in rows:
+        if 'error' in row:
+          rejected += 1
+          report(f'record {row["record"]} rejected: {row["error"]}')
+      rows = [row for row in rows if 'error' not in row]
+
+    if rows:
+      session.execute(table.insert(), [{column: row.get(column) for column in columns}
+                                       for row in rows])
+      if after_batch:
+        after_batch(session, rows)
+    session.commit()
+
+    loaded += len(rows)
+    position = batch[-1][0]
+    checkpoint.save(position)
+    elapsed = time.monotonic() - started
+    report(f'{position} records read, {loaded} loaded, {rejected} rejected, '
+           f'{loaded / elapsed if elapsed else 0:.0f} rows/sec')
+
+  checkpoint.clear()
+  return loaded, rejected
@@ -0,0 +1,128 @@
+#----------------------------------------------------------------------------#
+# Show calendar for listings partners.
+#----------------------------------------------------------------------------#
+
+# The calendar is a start_date range scan: the monthly partitions outside
+# the range are pruned and the (start_date, id) index walks the rest in
+# order, so shows come out sorted and are grouped by day while they stream.
+# City and state filter on the venue, genres on the artist. A venue or an
+# artist also gets an iCalendar feed of its shows.
+
+from datetime import datetime, timedelta, date
+from itertools import groupby
+
+from browsing import apply_filters
+
+CALENDAR_DAYS = 7
+CALENDAR_MAX_DAYS = 92
+
+ICAL_LINE_OCTETS = 75
+
+'''
+calendar_range(args, today)
+    the [start, end) datetimes of the ?start= and ?end= dates, end
+    included; a week from today by default; raises ValueError on bad dates
+    and on ranges over CALENDAR_MAX_DAYS
+'''
+def calendar_range(args, today):
+  start = date.fromisoformat(args['start']) if args.get('start') else today
+  end = date.fromisoformat(args['end']) if args.get('end') else start + timedelta(days=CALENDAR_DAYS - 1)
+  if end < start or (end - start).days >= CALENDAR_MAX_DAYS or end == date.max:
+    raise ValueError('invalid range')
+  midnight = datetime.min.time()
+  return datetime.combine(start, midnight), datetime.combine(end + timedelta(days=1), midnight)
+
+'''
+calendar_query(session, models, start, end, filters)
+    the shows starting in [start, end) with their venue and artist, in
+    start order, filtered with browse_filters() filters; no end means
+    every show from start on
+'''
+def calendar_query(session, models, start, end=None, filters=None):
+  Venue, Artist, Show = models
+  query = session.query(
+      Show.id, Show.start_date, Show.end_date, Show.venue_id, Show.artist_id,
+      Venue.name.label('venue_name'), Venue.address, Venue.city, Venue.state,
+      Artist.name.label('artist_name'), Artist.image_link.label('artist_image_link')
+  ).join(Venue, Show.venue_id == Venue.id).join(Artist, Show.artist_id == Artist.id).filter(
+      Show.start_date >= start)
+  if end is not None:
+    query = query.filter(Show.start_date < end)
+  if filters:
+    query = apply_filters(query, Venue, dict(filters, genres=[]))
+    query = apply_filters(query, Artist, dict(filters, city='', state=''))
+  return query.order_by(Show.start_date, Show.id)
+
+def calendar_show(row):
+  return {
+    'id': row.id,
+    'start_date': row.start_date.strftime('%Y-%m-%d %H:%M:%S'),
+    'end_date': row.end_date.strftime('%Y-%m-%d %H:%M:%S'),
+    'venue_id': row.venue_id,
+    'venue_name': row.venue_name,
+    'address': row.address,
+    'city': row.city,
+    'state': row.state,
+    'artist_id': row.artist_id,
+    'artist_name': row.artist_name,
+    'artist_image_link': row.artist_image_link
+  }
+
+'''
+calendar_days(rows)
+    groups start ordered rows into {'date': ..., 'shows': [...]} days,
+    holding one day in memory at a time
+'''
+def calendar_days(rows):
+  for day, shows in groupby(rows, key=lambda row: row.start_date.date()):
+    yield {'date': day.isoformat(), 'shows': [calendar_show(show) for show in shows]}
+
+#----------------------------------------------------------------------------#
+# iCalendar.
+#----------------------------------------------------------------------------#
+
+def ical_text(value):
+  value = value or ''
+  for char in ('\\', ';', ','):
+    value = value.replace(char, '\\' + char)
+  return value.replace('\r\n', '\\n').replace('\n', '\\n')
+
+def ical_line(line):
+  # content lines are folded at 75 octets, continuations start with a space
+  data = line.encode('utf-8')
+  parts = []
+  while len(data) > ICAL_LINE_OCTETS:
+    cut = ICAL_LINE_OCTETS if not parts else ICAL_LINE_OCTETS - 1
+    # never split a multi-byte character
+    while data[cut] & 0xC0 == 0x80:
+      cut -= 1
+    parts.append(data[:cut])
+    data = data[cut:]
+  parts.append(data)
+  return b'\r\n '.join(parts).decode('utf-8') + '\r\n'
+
+def ical_time(value):
+  return value.strftime('%Y%m%dT%H%M%S')
+
+'''
+ical_feed(name, rows, host, now)
+    the lines of a VCALENDAR holding a VEVENT per show row
+'''
+def ical_feed(name, rows, host, now):
+  yield ical_line('BEGIN:VCALENDAR')
+  yield ical_line('VERSION:2.0')
+  yield ical_line('PRODID:-//Fyyur//Shows//EN')
+  yield ical_line(f'X-WR-CALNAME:{ical_text(name)}')
+  stamp = now.strftime('%Y%m%dT%H%M%SZ')
+  for row in rows:
+    location = ', '.join(part for part in (row.venue_name, row.address, row.city, row.state) if part)
+    yield ''.join(ical_line(line) for line in (
+      'BEGIN:VEVENT',
+      f'UID:show-{row.id}@{host}',
+      f'DTSTAMP:{stamp}',
+      f'DTSTART:{ical_time(row.start_date)}',
+      f'DTEND:{ical_time(row.end_date)}',
+      f'SUMMARY:{ical_text(f"{row.artist_name} at {row.venue_name}")}',
+      f'LOCATION:{ical_text(location)}',
+      'END:VEVENT'))
+  yield ical_line('END:VCALENDAR')
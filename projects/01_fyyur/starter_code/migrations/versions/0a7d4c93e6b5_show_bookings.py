@@ -0,0 +1,42 @@
+"""show end dates and double-booking exclusion constraints
+
+Revision ID: 0a7d4c93e6b5
+Revises: f3b6d8e1a920
+Create Date: 2026-10-18 15:12:08.416233
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0a7d4c93e6b5'
+down_revision = 'f3b6d8e1a920'
+branch_labels = None
+depends_on = None
+
+BOOKING_CONSTRAINTS = {
+    'venue_id': 'ex_shows_venue_booking',
+    'artist_id': 'ex_shows_artist_booking'
+}
+
+
+def upgrade():
+    op.add_column('shows', sa.Column('end_date', sa.DateTime(), nullable=True))
+    # existing shows get the default duration of two hours
+    op.execute("UPDATE shows SET end_date = start_date + interval '2 hours'")
+    op.alter_column('shows', 'end_date', nullable=False)
+    # fails if the existing shows already double-book a venue or an artist
+    for key, name in BOOKING_CONSTRAINTS.items():
+        op.execute(f'''
+            ALTER TABLE shows ADD CONSTRAINT {name} EXCLUDE USING gist (
+              int4range({key}, {key}, '[]') WITH =,
+              tsrange(start_date, end_date) WITH &&
+            )
+        ''')
+
+
+def downgrade():
+    for name in BOOKING_CONSTRAINTS.values():
+        op.drop_constraint(name, 'shows')
+    op.drop_column('shows', 'end_date')
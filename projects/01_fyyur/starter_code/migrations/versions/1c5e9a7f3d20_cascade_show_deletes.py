@@ -0,0 +1,29 @@
+"""delete shows with their venue or artist
+
+Revision ID: 1c5e9a7f3d20
+Revises: 0a7d4c93e6b5
+Create Date: 2026-10-18 15:47:31.902114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1c5e9a7f3d20'
+down_revision = '0a7d4c93e6b5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for column, table in (('venue_id', 'venues'), ('artist_id', 'artists')):
+        op.drop_constraint(f'shows_{column}_fkey', 'shows', type_='foreignkey')
+        op.create_foreign_key(f'shows_{column}_fkey', 'shows', table,
+                              [column], ['id'], ondelete='CASCADE')
+
+
+def downgrade():
+    for column, table in (('venue_id', 'venues'), ('artist_id', 'artists')):
+        op.drop_constraint(f'shows_{column}_fkey', 'shows', type_='foreignkey')
+        op.create_foreign_key(f'shows_{column}_fkey', 'shows', table, [column], ['id'])
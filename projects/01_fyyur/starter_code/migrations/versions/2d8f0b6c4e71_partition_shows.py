@@ -0,0 +1,107 @@
+"""partition shows by month
+
+Revision ID: 2d8f0b6c4e71
+Revises: 1c5e9a7f3d20
+Create Date: 2026-10-18 16:20:44.187305
+
+"""
+from datetime import datetime
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2d8f0b6c4e71'
+down_revision = '1c5e9a7f3d20'
+branch_labels = None
+depends_on = None
+
+# months of partitions created after the current one
+PARTITIONS_AHEAD = 3
+
+COLUMNS = 'id, start_date, end_date, venue_id, artist_id'
+
+BOOKING_CONSTRAINT = '''
+    ALTER TABLE {table} ADD CONSTRAINT {name} EXCLUDE USING gist (
+      int4range({key}, {key}, '[]') WITH =,
+      tsrange(start_date, end_date) WITH &&
+    )
+'''
+
+
+def add_months(month, count):
+    years, month_index = divmod(month.month - 1 + count, 12)
+    return datetime(month.year + years, month_index + 1, 1)
+
+
+def booking_constraints(table, names):
+    for key, name in (('venue_id', 'venue_booking'), ('artist_id', 'artist_booking')):
+        op.execute(BOOKING_CONSTRAINT.format(table=table, key=key, name=names.format(
+            table=table, name=name)))
+
+
+def shows_constraints():
+    op.create_foreign_key('shows_venue_id_fkey', 'shows', 'venues',
+                          ['venue_id'], ['id'], ondelete='CASCADE')
+    op.create_foreign_key('shows_artist_id_fkey', 'shows', 'artists',
+                          ['artist_id'], ['id'], ondelete='CASCADE')
+    op.create_index('ix_shows_start_date_id', 'shows', ['start_date', 'id'])
+    op.create_index('ix_shows_venue_id_start_date', 'shows', ['venue_id', 'start_date'])
+    op.create_index('ix_shows_artist_id_start_date', 'shows', ['artist_id', 'start_date'])
+
+
+def upgrade():
+    op.execute('''
+        CREATE TABLE shows_partitioned (
+          id integer NOT NULL DEFAULT nextval('shows_id_seq'),
+          start_date timestamp NOT NULL,
+          end_date timestamp NOT NULL,
+          venue_id integer NOT NULL,
+          artist_id integer NOT NULL
+        ) PARTITION BY RANGE (start_date)
+    ''')
+    op.execute('CREATE TABLE shows_default PARTITION OF shows_partitioned DEFAULT')
+
+    # a partition for every month with shows, and for the next few
+    connection = op.get_bind()
+    months = set(connection.execute(sa.text(
+        "SELECT DISTINCT date_trunc('month', start_date) FROM shows")).scalars())
+    current = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    months.update(add_months(current, count) for count in range(PARTITIONS_AHEAD + 1))
+    names = ['shows_default']
+    for month in sorted(months):
+        name = f'shows_y{month.year}m{month.month:02d}'
+        op.execute(f"CREATE TABLE {name} PARTITION OF shows_partitioned FOR VALUES "
+                   f"FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')")
+        names.append(name)
+
+    op.execute(f'INSERT INTO shows_partitioned ({COLUMNS}) SELECT {COLUMNS} FROM shows')
+    op.execute('ALTER SEQUENCE shows_id_seq OWNED BY shows_partitioned.id')
+    op.drop_table('shows')
+    op.rename_table('shows_partitioned', 'shows')
+
+    op.create_primary_key('shows_pkey', 'shows', ['id', 'start_date'])
+    shows_constraints()
+    # exclusion constraints can't be declared on the partitioned table
+    for name in names:
+        booking_constraints(name, 'ex_{table}_{name}')
+
+
+def downgrade():
+    op.execute('''
+        CREATE TABLE shows_plain (
+          id integer NOT NULL DEFAULT nextval('shows_id_seq'),
+          start_date timestamp NOT NULL,
+          end_date timestamp NOT NULL,
+          venue_id integer NOT NULL,
+          artist_id integer NOT NULL
+        )
+    ''')
+    op.execute(f'INSERT INTO shows_plain ({COLUMNS}) SELECT {COLUMNS} FROM shows')
+    op.execute('ALTER SEQUENCE shows_id_seq OWNED BY shows_plain.id')
+    op.drop_table('shows')
+    op.rename_table('shows_plain', 'shows')
+
+    op.create_primary_key('shows_pkey', 'shows', ['id'])
+    shows_constraints()
+    booking_constraints('shows', 'ex_shows_{name}')
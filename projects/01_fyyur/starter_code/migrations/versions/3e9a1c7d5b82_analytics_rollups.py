@@ -0,0 +1,113 @@
+"""analytics rollups with dirty month tracking
+
+Revision ID: 3e9a1c7d5b82
+Revises: 2d8f0b6c4e71
+Create Date: 2026-10-18 19:05:31.402918
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3e9a1c7d5b82'
+down_revision = '2d8f0b6c4e71'
+branch_labels = None
+depends_on = None
+
+SHOW_TRIGGERS = (('insert', 'INSERT', 'NEW'), ('delete', 'DELETE', 'OLD'),
+                 ('update_old', 'UPDATE', 'OLD'), ('update_new', 'UPDATE', 'NEW'))
+
+
+def upgrade():
+    op.create_table('rollup_area_months',
+        sa.Column('month', sa.DateTime(), nullable=False),
+        sa.Column('state', sa.String(length=120), nullable=False),
+        sa.Column('city', sa.String(length=120), nullable=False),
+        sa.Column('show_count', sa.Integer(), nullable=False),
+        sa.Column('venue_count', sa.Integer(), nullable=False),
+        sa.Column('booked_minutes', sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint('month', 'state', 'city')
+    )
+    op.create_table('rollup_genre_months',
+        sa.Column('month', sa.DateTime(), nullable=False),
+        sa.Column('state', sa.String(length=120), nullable=False),
+        sa.Column('city', sa.String(length=120), nullable=False),
+        sa.Column('genre', sa.String(length=120), nullable=False),
+        sa.Column('show_count', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('month', 'state', 'city', 'genre')
+    )
+    op.create_table('rollup_venue_months',
+        sa.Column('month', sa.DateTime(), nullable=False),
+        sa.Column('venue_id', sa.Integer(), nullable=False),
+        sa.Column('venue_name', sa.String(), nullable=False),
+        sa.Column('city', sa.String(length=120), nullable=False),
+        sa.Column('state', sa.String(length=120), nullable=False),
+        sa.Column('show_count', sa.Integer(), nullable=False),
+        sa.Column('booked_minutes', sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint('month', 'venue_id')
+    )
+    op.create_table('rollup_dirty_months',
+        sa.Column('month', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('month')
+    )
+
+    op.execute('''
+    CREATE OR REPLACE FUNCTION fyyur_mark_rollup_months() RETURNS trigger AS $$
+    BEGIN
+      INSERT INTO rollup_dirty_months (month)
+      SELECT DISTINCT date_trunc('month', start_date) FROM changed_rows
+      ON CONFLICT DO NOTHING;
+      RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    ''')
+    for name, operation, rows in SHOW_TRIGGERS:
+        op.execute(f'''
+        CREATE TRIGGER shows_rollup_{name} AFTER {operation} ON shows
+        REFERENCING {rows} TABLE AS changed_rows
+        FOR EACH STATEMENT EXECUTE PROCEDURE fyyur_mark_rollup_months()
+        ''')
+
+    op.execute('''
+    CREATE OR REPLACE FUNCTION fyyur_mark_entity_months() RETURNS trigger AS $$
+    BEGIN
+      EXECUTE
+        'INSERT INTO rollup_dirty_months (month) '
+        'SELECT DISTINCT date_trunc(''month'', start_date) FROM shows '
+        'WHERE ' || quote_ident(TG_ARGV[0]) || ' = $1 '
+        'ON CONFLICT DO NOTHING' USING NEW.id;
+      RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    ''')
+    op.execute('''
+    CREATE TRIGGER venues_rollup_update AFTER UPDATE OF name, city, state ON venues
+    FOR EACH ROW WHEN (OLD.name IS DISTINCT FROM NEW.name OR OLD.city IS DISTINCT FROM NEW.city
+                       OR OLD.state IS DISTINCT FROM NEW.state)
+    EXECUTE PROCEDURE fyyur_mark_entity_months('venue_id')
+    ''')
+    op.execute('''
+    CREATE TRIGGER artists_rollup_update AFTER UPDATE OF genres ON artists
+    FOR EACH ROW WHEN (OLD.genres IS DISTINCT FROM NEW.genres)
+    EXECUTE PROCEDURE fyyur_mark_entity_months('artist_id')
+    ''')
+
+    # the first `flask fyyur rollups` builds every month
+    op.execute('''
+    INSERT INTO rollup_dirty_months (month)
+    SELECT DISTINCT date_trunc('month', start_date) FROM shows
+    ''')
+
+
+def downgrade():
+    op.execute('DROP TRIGGER artists_rollup_update ON artists')
+    op.execute('DROP TRIGGER venues_rollup_update ON venues')
+    op.execute('DROP FUNCTION fyyur_mark_entity_months()')
+    for name, operation, rows in SHOW_TRIGGERS:
+        op.execute(f'DROP TRIGGER shows_rollup_{name} ON shows')
+    op.execute('DROP FUNCTION fyyur_mark_rollup_months()')
+    op.drop_table('rollup_dirty_months')
+    op.drop_table('rollup_venue_months')
+    op.drop_table('rollup_genre_months')
+    op.drop_table('rollup_area_months')
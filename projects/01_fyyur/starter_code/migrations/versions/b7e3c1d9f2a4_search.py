@@ -0,0 +1,62 @@
+"""full-text and trigram search for venues and artists
+
+Revision ID: b7e3c1d9f2a4
+Revises: a4cc710271e2
+Create Date: 2026-10-18 09:12:04.118302
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e3c1d9f2a4'
+down_revision = 'a4cc710271e2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.add_column('venues', sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True))
+    op.add_column('artists', sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True))
+
+    op.execute('''
+    CREATE OR REPLACE FUNCTION fyyur_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+      NEW.search_vector :=
+        setweight(to_tsvector('simple', coalesce(NEW.name, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(NEW.city, '') || ' ' || coalesce(NEW.state, '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce(array_to_string(NEW.genres, ' '), '')), 'C');
+      RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    ''')
+    for table in ('venues', 'artists'):
+        op.execute('''
+        CREATE TRIGGER {table}_search_vector_update
+        BEFORE INSERT OR UPDATE ON {table}
+        FOR EACH ROW EXECUTE PROCEDURE fyyur_search_vector_update()
+        '''.format(table=table))
+        # fire the trigger once to fill in existing rows
+        op.execute('UPDATE {table} SET name = name'.format(table=table))
+
+    op.create_index('ix_venues_search_vector', 'venues', ['search_vector'], postgresql_using='gin')
+    op.create_index('ix_artists_search_vector', 'artists', ['search_vector'], postgresql_using='gin')
+    op.create_index('ix_venues_name_trgm', 'venues', ['name'],
+                    postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+    op.create_index('ix_artists_name_trgm', 'artists', ['name'],
+                    postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+
+
+def downgrade():
+    op.drop_index('ix_artists_name_trgm', table_name='artists')
+    op.drop_index('ix_venues_name_trgm', table_name='venues')
+    op.drop_index('ix_artists_search_vector', table_name='artists')
+    op.drop_index('ix_venues_search_vector', table_name='venues')
+    for table in ('venues', 'artists'):
+        op.execute('DROP TRIGGER {table}_search_vector_update ON {table}'.format(table=table))
+    op.execute('DROP FUNCTION fyyur_search_vector_update()')
+    op.drop_column('artists', 'search_vector')
+    op.drop_column('venues', 'search_vector')
@@ -0,0 +1,37 @@
+"""upcoming and past show counters on venues and artists
+
+Revision ID: c2a8e5f0d317
+Revises: b7e3c1d9f2a4
+Create Date: 2026-10-18 10:03:47.552910
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c2a8e5f0d317'
+down_revision = 'b7e3c1d9f2a4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table, key in (('venues', 'venue_id'), ('artists', 'artist_id')):
+        op.add_column(table, sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False))
+        op.add_column(table, sa.Column('past_shows_count', sa.Integer(), server_default='0', nullable=False))
+        op.add_column(table, sa.Column('next_show_date', sa.DateTime(), nullable=True))
+        # fill in the counters of the existing rows
+        op.execute('''
+        UPDATE {table} SET
+          upcoming_shows_count = (SELECT count(*) FROM shows WHERE shows.{key} = {table}.id AND start_date > LOCALTIMESTAMP),
+          past_shows_count = (SELECT count(*) FROM shows WHERE shows.{key} = {table}.id AND start_date <= LOCALTIMESTAMP),
+          next_show_date = (SELECT min(start_date) FROM shows WHERE shows.{key} = {table}.id AND start_date > LOCALTIMESTAMP)
+        '''.format(table=table, key=key))
+
+
+def downgrade():
+    for table in ('venues', 'artists'):
+        op.drop_column(table, 'next_show_date')
+        op.drop_column(table, 'past_shows_count')
+        op.drop_column(table, 'upcoming_shows_count')
@@ -0,0 +1,28 @@
+"""composite indexes for keyset pagination
+
+Revision ID: d91f4b6a0c58
+Revises: c2a8e5f0d317
+Create Date: 2026-10-18 11:26:31.904417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd91f4b6a0c58'
+down_revision = 'c2a8e5f0d317'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_shows_start_date_id', 'shows', ['start_date', 'id'])
+    op.create_index('ix_artists_name_id', 'artists', ['name', 'id'])
+    op.create_index('ix_venues_area_name_id', 'venues', ['state', 'city', 'name', 'id'])
+
+
+def downgrade():
+    op.drop_index('ix_venues_area_name_id', table_name='venues')
+    op.drop_index('ix_artists_name_id', table_name='artists')
+    op.drop_index('ix_shows_start_date_id', table_name='shows')
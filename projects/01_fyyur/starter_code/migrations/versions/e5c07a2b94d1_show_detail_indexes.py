@@ -0,0 +1,26 @@
+"""composite indexes for venue and artist show lookups
+
+Revision ID: e5c07a2b94d1
+Revises: d91f4b6a0c58
+Create Date: 2026-10-18 12:08:15.263780
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5c07a2b94d1'
+down_revision = 'd91f4b6a0c58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_shows_venue_id_start_date', 'shows', ['venue_id', 'start_date'])
+    op.create_index('ix_shows_artist_id_start_date', 'shows', ['artist_id', 'start_date'])
+
+
+def downgrade():
+    op.drop_index('ix_shows_artist_id_start_date', table_name='shows')
+    op.drop_index('ix_shows_venue_id_start_date', table_name='shows')
@@ -0,0 +1,28 @@
+"""GIN indexes on genres for filtered browsing
+
+Revision ID: f3b6d8e1a920
+Revises: e5c07a2b94d1
+Create Date: 2026-10-18 14:41:52.730019
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3b6d8e1a920'
+down_revision = 'e5c07a2b94d1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_venues_genres', 'venues', ['genres'], postgresql_using='gin')
+    op.create_index('ix_artists_genres', 'artists', ['genres'], postgresql_using='gin')
+    op.create_index('ix_artists_state_city', 'artists', ['state', 'city'])
+
+
+def downgrade():
+    op.drop_index('ix_artists_state_city', table_name='artists')
+    op.drop_index('ix_artists_genres', table_name='artists')
+    op.drop_index('ix_venues_genres', table_name='venues')
@@ -0,0 +1,87 @@
+#----------------------------------------------------------------------------#
+# Keyset (cursor) pagination.
+#----------------------------------------------------------------------------#
+
+# Pages are addressed by the sort key of their first or last row instead of
+# an OFFSET, so every page is an index range scan no matter how deep it is.
+# Cursors are opaque url-safe tokens holding the key values.
+
+import json
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from datetime import datetime
+from sqlalchemy import tuple_
+
+ITEMS_PER_PAGE = 50
+
+'''
+encode_cursor(values)
+    packs the sort key values of a row into a cursor token
+'''
+def encode_cursor(values):
+  values = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+  return urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+'''
+decode_cursor(token, columns)
+    unpacks a cursor token into values typed after the key columns,
+    raises ValueError on malformed cursors
+'''
+def decode_cursor(token, columns):
+  try:
+    values = json.loads(urlsafe_b64decode(token.encode()))
+  except Exception:
+    raise ValueError('invalid cursor')
+  if not isinstance(values, list) or len(values) != len(columns):
+    raise ValueError('invalid cursor')
+  try:
+    return [cursor_value(column, value) for column, value in zip(columns, values)]
+  except (TypeError, ValueError):
+    raise ValueError('invalid cursor')
+
+def cursor_value(column, value):
+  # a value of the wrong type would only fail once the query binds it
+  try:
+    expected = column.type.python_type
+  except NotImplementedError:
+    expected = None
+  if expected is datetime:
+    if not isinstance(value, str):
+      raise TypeError(f'{column.key} expects a date')
+    return datetime.fromisoformat(value)
+  allowed = expected if expected in (int, str) else (int, str)
+  if isinstance(value, bool) or not isinstance(value, allowed):
+    raise TypeError(f'{column.key} expects a scalar of type {allowed}')
+  return value
+
+'''
+keyset_page(query, columns, after, before, per_page)
+    returns one page of `query` ordered by `columns` along with the cursors
+    of the previous and next pages (None when there is no such page); the
+    query must select every key column under its own name
+'''
+def keyset_page(query, columns, after=None, before=None, per_page=ITEMS_PER_PAGE):
+  key = tuple_(*columns)
+  if before:
+    query = query.filter(key < tuple_(*decode_cursor(before, columns))).order_by(
+        *(column.desc() for column in columns))
+  else:
+    if after:
+      query = query.filter(key > tuple_(*decode_cursor(after, columns)))
+    query = query.order_by(*columns)
+
+  # fetch one extra row to know whether there is a page beyond this one
+  rows = query.limit(per_page + 1).all()
+  more = len(rows) > per_page
+  rows = rows[:per_page]
+  if before:
+    rows.reverse()
+    has_prev, has_next = more, True
+  else:
+    has_prev, has_next = bool(after), more
+
+  def cursor(row):
+    return encode_cursor([getattr(row, column.key) for column in columns])
+
+  prev_cursor = cursor(rows[0]) if rows and has_prev else None
+  next_cursor = cursor(rows[-1]) if rows and has_next else None
+  return rows, prev_cursor, next_cursor
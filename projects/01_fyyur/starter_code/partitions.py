@@ -0,0 +1,121 @@
+#----------------------------------------------------------------------------#
+# Monthly partitions of the shows table.
+#----------------------------------------------------------------------------#
+
+# `shows` is range partitioned on start_date, one partition per month
+# (shows_y2026m10) plus shows_default for anything without one. A query
+# with a start_date bound, like the upcoming counters, only scans the
+# partitions that can match. The maintenance command keeps partitions
+# created ahead of time, splitting rows out of the default partition, and
+# detaches old months into the archive schema so history stops weighing
+# on daily traffic.
+
+from datetime import datetime
+from sqlalchemy import text
+
+from booking import booking_constraints
+
+DEFAULT_PARTITION = 'shows_default'
+ARCHIVE_SCHEMA = 'archive'
+
+# months of partitions kept ahead of the current one
+PARTITIONS_AHEAD = 3
+
+DEFAULT_PARTITION_DDL = f'CREATE TABLE {DEFAULT_PARTITION} PARTITION OF shows DEFAULT'
+
+def month_start(date):
+  return datetime(date.year, date.month, 1)
+
+def add_months(month, count):
+  years, month_index = divmod(month.month - 1 + count, 12)
+  return datetime(month.year + years, month_index + 1, 1)
+
+def partition_name(month):
+  return f'shows_y{month.year}m{month.month:02d}'
+
+def partition_month(name):
+  try:
+    return datetime.strptime(name, 'shows_y%Ym%m')
+  except ValueError:
+    return None
+
+'''
+partitions(session)
+    the months that have a partition attached to shows, oldest first
+'''
+def partitions(session):
+  names = session.execute(text('''
+    SELECT child.relname FROM pg_inherits
+    JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+    WHERE pg_inherits.inhparent = 'shows'::regclass
+  ''')).scalars()
+  return sorted(month for month in map(partition_month, names) if month)
+
+'''
+create_partition(session, month)
+    creates the partition of `month`, moving its rows out of the default
+    partition, and gives it the booking constraints
+'''
+def create_partition(session, month):
+  name = partition_name(month)
+  bounds = {'lower': month, 'upper': add_months(month, 1)}
+  session.execute(text(f'CREATE TABLE {name} (LIKE shows INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'))
+  session.execute(text(f'''
+    WITH moved AS (
+      DELETE FROM {DEFAULT_PARTITION}
+      WHERE start_date >= :lower AND start_date < :upper
+      RETURNING *
+    )
+    INSERT INTO {name} SELECT * FROM moved
+  '''), bounds)
+  for ddl in booking_constraints(name):
+    session.execute(text(ddl))
+  session.execute(text(
+      f"ALTER TABLE shows ATTACH PARTITION {name} "
+      f"FOR VALUES FROM ('{bounds['lower'].isoformat()}') TO ('{bounds['upper'].isoformat()}')"))
+  return name
+
+'''
+ensure_partitions(session, now, ahead)
+    creates the partitions of the months from the current one to `ahead`
+    months later, and of older months that have rows in the default
+    partition; returns the names of the new partitions
+'''
+def ensure_partitions(session, now, ahead=PARTITIONS_AHEAD):
+  current = month_start(now)
+  months = {add_months(current, count) for count in range(ahead + 1)}
+  months.update(session.execute(text(
+      f"SELECT DISTINCT date_trunc('month', start_date) FROM {DEFAULT_PARTITION}")).scalars())
+  existing = set(partitions(session))
+
+  created = []
+  for month in sorted(months - existing):
+    created.append(create_partition(session, month))
+    session.commit()
+  return created
+
+'''
+archive_partitions(session, before, drop=False, after_detach=None)
+    detaches the partitions of months ending before `before` and moves them
+    to the archive schema, or drops them; `after_detach` gets the venue and
+    artist ids of the detached shows and runs in the same transaction
+'''
+def archive_partitions(session, before, drop=False, after_detach=None):
+  archived = []
+  for month in partitions(session):
+    if add_months(month, 1) > before:
+      break
+    name = partition_name(month)
+    venue_ids = session.execute(text(f'SELECT DISTINCT venue_id FROM {name}')).scalars().all()
+    artist_ids = session.execute(text(f'SELECT DISTINCT artist_id FROM {name}')).scalars().all()
+    session.execute(text(f'ALTER TABLE shows DETACH PARTITION {name}'))
+    if drop:
+      session.execute(text(f'DROP TABLE {name}'))
+    else:
+      session.execute(text(f'CREATE SCHEMA IF NOT EXISTS {ARCHIVE_SCHEMA}'))
+      session.execute(text(f'ALTER TABLE {name} SET SCHEMA {ARCHIVE_SCHEMA}'))
+    if after_detach:
+      after_detach(session, venue_ids, artist_ids)
+    session.commit()
+    archived.append(name)
+  return archived
@@ -0,0 +1,125 @@
+#----------------------------------------------------------------------------#
+# Column types and SQL constructs shared by Postgres and SQLite.
+#----------------------------------------------------------------------------#
+
+# Production runs on Postgres; the test suite also runs against an
+# in-memory SQLite database. Genres are a varchar[] on Postgres, served by
+# the GIN indexes, and a JSON array elsewhere, matched through json_each.
+# Everything that only exists on Postgres (partitions, triggers, exclusion
+# constraints, NOTIFY) stays there and is skipped on the other dialects.
+
+import re
+import sqlite3
+from sqlalchemy import event, cast, literal, func, String, JSON
+from sqlalchemy.engine import Engine
+from sqlalchemy.types import TypeDecorator, Boolean
+from sqlalchemy.schema import PrimaryKeyConstraint, CreateColumn
+from sqlalchemy.sql.functions import FunctionElement, ReturnTypeFromArgs
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.dialects.postgresql import ARRAY
+
+def dialect_name(session):
+  return session.get_bind().dialect.name
+
+class array_has_all(FunctionElement):
+  """True when an array column holds every value of an array"""
+  type = Boolean()
+  inherit_cache = True
+
+class array_has_any(FunctionElement):
+  """True when an array column holds at least one value of an array"""
+  type = Boolean()
+  inherit_cache = True
+
+class StringArray(TypeDecorator):
+  """Array of strings: varchar[] on Postgres, a JSON array elsewhere"""
+
+  impl = JSON
+  cache_ok = True
+
+  def __init__(self, length=None):
+    super().__init__()
+    self.length = length
+
+  def load_dialect_impl(self, dialect):
+    if dialect.name == 'postgresql':
+      return dialect.type_descriptor(ARRAY(String(self.length)))
+    return dialect.type_descriptor(JSON())
+
+  class comparator_factory(TypeDecorator.Comparator):
+
+    def has_all(self, values):
+      return array_has_all(self.expr, literal(list(values), self.type))
+
+    def has_any(self, values):
+      return array_has_any(self.expr, literal(list(values), self.type))
+
+@compiles(array_has_all, 'postgresql')
+def postgresql_has_all(element, compiler, **kw):
+  column, values = element.clauses
+  return compiler.process(column.op('@>')(cast(values, column.type)), **kw)
+
+@compiles(array_has_any, 'postgresql')
+def postgresql_has_any(element, compiler, **kw):
+  column, values = element.clauses
+  return compiler.process(column.op('&&')(cast(values, column.type)), **kw)
+
+@compiles(array_has_all)
+def json_has_all(element, compiler, **kw):
+  column, values = (compiler.process(clause, **kw) for clause in element.clauses)
+  return (f'NOT EXISTS (SELECT 1 FROM json_each({values}) AS wanted WHERE wanted.value '
+          f'NOT IN (SELECT value FROM json_each({column})))')
+
+@compiles(array_has_any)
+def json_has_any(element, compiler, **kw):
+  column, values = (compiler.process(clause, **kw) for clause in element.clauses)
+  return (f'EXISTS (SELECT 1 FROM json_each({column}) AS held WHERE held.value '
+          f'IN (SELECT value FROM json_each({values})))')
+
+'''
+array_elements(session, column)
+    table valued function of the elements of an array column, one row per
+    element under the name `value`
+'''
+def array_elements(session, column):
+  if dialect_name(session) == 'postgresql':
+    return func.unnest(column).table_valued('value').render_derived()
+  return func.json_each(column).table_valued('value')
+
+class least(ReturnTypeFromArgs):
+  """least(a, b), spelled min(a, b) on SQLite"""
+  inherit_cache = True
+
+@compiles(least, 'sqlite')
+def sqlite_least(element, compiler, **kw):
+  return f'min({compiler.process(element.clauses, **kw)})'
+
+# the partition key has to be part of the primary key of a partitioned
+# table; elsewhere the key is the id alone, which SQLite then numbers
+
+def partition_keys(table):
+  partition_by = table.dialect_options['postgresql'].get('partition_by') or ''
+  return re.findall(r'\w+', partition_by)[1:]
+
+@compiles(PrimaryKeyConstraint, 'sqlite')
+def sqlite_primary_key(constraint, compiler, **kw):
+  keys = partition_keys(constraint.table)
+  columns = [column for column in constraint.columns if column.name not in keys]
+  if not keys or not columns:
+    return compiler.visit_primary_key_constraint(constraint, **kw)
+  return 'PRIMARY KEY (%s)' % ', '.join(compiler.preparer.quote(column.name) for column in columns)
+
+@compiles(CreateColumn, 'sqlite')
+def sqlite_column(create, compiler, **kw):
+  column = create.element
+  if column.primary_key and column.autoincrement is True and partition_keys(column.table):
+    return '%s INTEGER NOT NULL' % compiler.preparer.quote(column.name)
+  return compiler.visit_create_column(create, **kw)
+
+# SQLite only enforces foreign keys, and their cascades, when asked to
+@event.listens_for(Engine, 'connect')
+def enable_foreign_keys(dbapi_connection, connection_record):
+  if isinstance(dbapi_connection, sqlite3.Connection):
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA foreign_keys=ON')
+    cursor.close()
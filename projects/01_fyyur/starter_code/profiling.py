@@ -0,0 +1,106 @@
+#----------------------------------------------------------------------------#
+# Per-request profiling.
+#----------------------------------------------------------------------------#
+
+# Every request is timed along with the SQL statements it runs, counted and
+# timed through the engine cursor events. The summary is logged once the
+# response is done (streamed responses included), and requests that are
+# slow or run more statements than the budget are flagged as warnings.
+
+import atexit
+from queue import Queue
+from time import perf_counter
+from logging.handlers import QueueHandler, QueueListener
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+'''
+setup_queue_logging(logger, *handlers)
+    sends the records of `logger` through a queue to `handlers`, which are
+    run on a background thread so requests never wait on disk writes
+'''
+def setup_queue_logging(logger, *handlers):
+  queue = Queue(-1)
+  logger.addHandler(QueueHandler(queue))
+  listener = QueueListener(queue, *handlers, respect_handler_level=True)
+  listener.start()
+  atexit.register(listener.stop)
+  return listener
+
+class RequestProfiler(object):
+  """Records wall time, SQL statement count and SQL time per request"""
+
+  def __init__(self, app=None, engine=None):
+    if app is not None:
+      self.init_app(app, engine)
+
+  def init_app(self, app, engine=None):
+    self.logger = app.logger
+    self.slow_request_ms = app.config.get('PROFILE_SLOW_REQUEST_MS', 500)
+    self.slow_statement_ms = app.config.get('PROFILE_SLOW_STATEMENT_MS', 100)
+    self.statement_budget = app.config.get('PROFILE_STATEMENT_BUDGET', 10)
+
+    app.before_request(self.start)
+    app.after_request(self.status)
+    app.teardown_request(self.finish)
+    # without an engine every engine is profiled; the listeners are shared
+    # by every app the profiler is set up on
+    engine = engine or Engine
+    if not event.contains(engine, 'before_cursor_execute', self.before_cursor_execute):
+      event.listen(engine, 'before_cursor_execute', self.before_cursor_execute)
+      event.listen(engine, 'after_cursor_execute', self.after_cursor_execute)
+
+  def start(self):
+    g.profile = {
+      'started': perf_counter(),
+      'statements': 0,
+      'sql_time': 0.0,
+      'slowest_time': 0.0,
+      'slowest': None
+    }
+
+  def status(self, response):
+    if 'profile' in g:
+      g.profile['status'] = response.status_code
+    return response
+
+  def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('profile_started', []).append(perf_counter())
+
+  def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+    elapsed = perf_counter() - conn.info['profile_started'].pop()
+    if not has_request_context() or 'profile' not in g:
+      return
+    profile = g.profile
+    profile['statements'] += 1
+    profile['sql_time'] += elapsed
+    if elapsed > profile['slowest_time']:
+      profile['slowest_time'] = elapsed
+      profile['slowest'] = statement
+
+  def finish(self, exc=None):
+    profile = g.pop('profile', None)
+    if profile is None:
+      return
+    wall_ms = (perf_counter() - profile['started']) * 1000
+    sql_ms = profile['sql_time'] * 1000
+    slowest_ms = profile['slowest_time'] * 1000
+
+    flags = []
+    if wall_ms > self.slow_request_ms:
+      flags.append('slow request')
+    if profile['statements'] > self.statement_budget:
+      flags.append('over statement budget')
+    if slowest_ms > self.slow_statement_ms:
+      flags.append('slow statement')
+
+    message = '%s %s %s %.1fms sql=%d (%.1fms)' % (
+        request.method, request.full_path.rstrip('?'), profile.get('status', 500),
+        wall_ms, profile['statements'], sql_ms)
+    if profile['slowest']:
+      message += ' slowest=%.1fms %s' % (slowest_ms, ' '.join(profile['slowest'].split()))
+    if flags:
+      self.logger.warning('%s [%s]', message, ', '.join(flags))
+    else:
+      self.logger.info(message)
@@ -0,0 +1,216 @@
+#----------------------------------------------------------------------------#
+# Artist and venue recommendations.
+#----------------------------------------------------------------------------#
+
+# Venues and artists are held in memory as NumPy arrays: a genre incidence
+# matrix (one row per entity, one column per genre) plus city, state,
+# seeking flag and recent show counts. Scoring a venue against every artist
+# (or the reverse) is then a single matrix-vector product and a few vector
+# comparisons, and the best k are picked with argpartition. The arrays are
+# loaded in one query per side and afterwards only the rows of edited
+# entities are reloaded; a full rebuild happens every `ttl` seconds to pick
+# up changes made by other processes.
+
+import threading
+import time
+from datetime import datetime, timedelta
+import numpy as np
+from sqlalchemy import func
+
+# shows played in this many days count towards the history score
+RECENT_DAYS = 365
+
+RECOMMENDATIONS = 10
+
+WEIGHTS = {
+  'genres': 0.5,
+  'city': 0.2,
+  'state': 0.1,
+  'history': 0.1,
+  'seeking': 0.1
+}
+
+class EntityMatrix(object):
+  """Genre incidence matrix and attributes of the venues or the artists"""
+
+  def __init__(self, genres=0):
+    self.ids = np.zeros(0, dtype=np.int64)
+    self.genres = np.zeros((0, genres), dtype=np.float32)
+    self.genre_counts = np.zeros(0, dtype=np.float32)
+    self.cities = np.zeros(0, dtype=np.int32)
+    self.states = np.zeros(0, dtype=np.int32)
+    self.seeking = np.zeros(0, dtype=bool)
+    self.recent = np.zeros(0, dtype=np.float32)
+    self.names = []
+    self.rows = {}
+
+  def add_genres(self, count):
+    self.genres = np.pad(self.genres, ((0, 0), (0, count)))
+
+  def upsert(self, entities):
+    new = [entity for entity in entities if entity['id'] not in self.rows]
+    if new:
+      self.ids = np.concatenate([self.ids, np.zeros(len(new), dtype=np.int64)])
+      self.genres = np.concatenate([self.genres, np.zeros(
+          (len(new), self.genres.shape[1]), dtype=np.float32)])
+      self.genre_counts = np.concatenate([self.genre_counts, np.zeros(len(new), dtype=np.float32)])
+      self.cities = np.concatenate([self.cities, np.zeros(len(new), dtype=np.int32)])
+      self.states = np.concatenate([self.states, np.zeros(len(new), dtype=np.int32)])
+      self.seeking = np.concatenate([self.seeking, np.zeros(len(new), dtype=bool)])
+      self.recent = np.concatenate([self.recent, np.zeros(len(new), dtype=np.float32)])
+      for entity in new:
+        self.rows[entity['id']] = len(self.names)
+        self.names.append(None)
+
+    for entity in entities:
+      row = self.rows[entity['id']]
+      self.ids[row] = entity['id']
+      self.genres[row] = 0
+      self.genres[row, entity['genres']] = 1
+      self.genre_counts[row] = len(entity['genres'])
+      self.cities[row] = entity['city']
+      self.states[row] = entity['state']
+      self.seeking[row] = entity['seeking']
+      self.recent[row] = entity['recent']
+      self.names[row] = entity['name']
+
+  def remove(self, ids):
+    for entity_id in ids:
+      row = self.rows.pop(entity_id, None)
+      if row is None:
+        continue
+      # move the last row into the hole
+      last = len(self.names) - 1
+      if row != last:
+        for array in (self.ids, self.genres, self.genre_counts, self.cities,
+                      self.states, self.seeking, self.recent):
+          array[row] = array[last]
+        self.names[row] = self.names[last]
+        self.rows[int(self.ids[row])] = row
+      self.names.pop()
+      self.ids = self.ids[:last]
+      self.genres = self.genres[:last]
+      self.genre_counts = self.genre_counts[:last]
+      self.cities = self.cities[:last]
+      self.states = self.states[:last]
+      self.seeking = self.seeking[:last]
+      self.recent = self.recent[:last]
+
+class Recommender(object):
+  """Recommends artists for a venue and venues for an artist"""
+
+  def __init__(self, venue_model, artist_model, show_model, ttl=3600):
+    self.models = {
+      'venue': (venue_model, venue_model.seeking_talent, show_model.venue_id),
+      'artist': (artist_model, artist_model.seeking_venue, show_model.artist_id)
+    }
+    self.show_model = show_model
+    self.ttl = ttl
+    self.lock = threading.Lock()
+    self.clear()
+
+  def init_app(self, app):
+    self.ttl = app.config.get('RECOMMENDATIONS_TTL', 3600)
+
+  def clear(self):
+    self.built = None
+    self.pending = {'venue': set(), 'artist': set()}
+    self.genre_columns = {}
+    self.city_codes = {}
+    self.state_codes = {}
+    self.matrices = {'venue': EntityMatrix(), 'artist': EntityMatrix()}
+
+  def refresh(self, kind, *ids):
+    with self.lock:
+      self.pending[kind].update(int(entity_id) for entity_id in ids)
+
+  def expire(self):
+    # rebuilt from scratch on the next recommendation
+    with self.lock:
+      self.built = None
+
+  def code(self, codes, value):
+    return codes.setdefault(value, len(codes))
+
+  def load(self, session, kind, ids=None):
+    model, seeking, show_key = self.models[kind]
+    recent = session.query(func.count(self.show_model.id)).filter(
+        show_key == model.id,
+        self.show_model.start_date >= datetime.now() - timedelta(days=RECENT_DAYS)
+    ).scalar_subquery()
+    query = session.query(model.id, model.name, model.city, model.state, model.genres,
+                          seeking.label('seeking'), recent.label('recent'))
+    if ids is not None:
+      query = query.filter(model.id.in_(ids))
+
+    entities = []
+    new_genres = 0
+    for row in query:
+      genres = []
+      for genre in set(row.genres or []):
+        if genre not in self.genre_columns:
+          self.genre_columns[genre] = len(self.genre_columns)
+          new_genres += 1
+        genres.append(self.genre_columns[genre])
+      entities.append({
+        'id': row.id,
+        'name': row.name,
+        'genres': genres,
+        'city': self.code(self.city_codes, (row.city.strip().lower(), row.state)),
+        'state': self.code(self.state_codes, row.state),
+        'seeking': row.seeking,
+        'recent': row.recent
+      })
+    if new_genres:
+      for matrix in self.matrices.values():
+        matrix.add_genres(new_genres)
+
+    matrix = self.matrices[kind]
+    if ids is not None:
+      matrix.remove(set(ids) - {entity['id'] for entity in entities})
+    matrix.upsert(entities)
+
+  def update(self, session):
+    if self.built is None or time.monotonic() - self.built > self.ttl:
+      self.clear()
+      self.load(session, 'venue')
+      self.load(session, 'artist')
+      self.built = time.monotonic()
+      return
+    for kind, ids in self.pending.items():
+      if ids:
+        self.load(session, kind, ids)
+        ids.clear()
+
+  '''
+  recommend(session, kind, entity_id, k)
+      the k best matches of the other kind for a venue or an artist, as
+      (id, name, score) tuples, or None when the entity doesn't exist
+  '''
+  def recommend(self, session, kind, entity_id, k=RECOMMENDATIONS):
+    with self.lock:
+      self.update(session)
+      source = self.matrices[kind]
+      target = self.matrices['artist' if kind == 'venue' else 'venue']
+      row = source.rows.get(entity_id)
+      if row is None:
+        return None
+      if not len(target.ids) or k <= 0:
+        return []
+
+      overlap = target.genres @ source.genres[row]
+      union = target.genre_counts + source.genre_counts[row] - overlap
+      scores = (
+        WEIGHTS['genres'] * np.divide(overlap, union, out=np.zeros_like(overlap), where=union > 0) +
+        WEIGHTS['city'] * (target.cities == source.cities[row]) +
+        WEIGHTS['state'] * (target.states == source.states[row]) +
+        WEIGHTS['history'] * np.log1p(target.recent) / np.log1p(max(target.recent.max(), 1)) +
+        WEIGHTS['seeking'] * target.seeking
+      )
+
+      if k < len(scores):
+        best = np.argpartition(-scores, k - 1)[:k]
+      else:
+        best = np.arange(len(scores))
+      best = best[np.lexsort((target.ids[best], -scores[best]))]
+      return [(int(target.ids[i]), target.names[i], round(float(scores[i]), 4)) for i in best]
@@ -0,0 +1,80 @@
+#----------------------------------------------------------------------------#
+# Read replica routing.
+#----------------------------------------------------------------------------#
+
+# Controllers decorated with @replica_reads run their queries on one of the
+# replica binds (SQLALCHEMY_BINDS keys starting with `replica_`), picked
+# once per request. Everything else stays on the primary: flushes, INSERT/
+# UPDATE/DELETE statements, SELECT ... FOR UPDATE, reads after a write in
+# the same request, and every request of a visitor who wrote something in
+# the last READ_YOUR_WRITES_SECONDS, so nobody misses their own change to
+# replication lag.
+
+import random
+from time import time
+from functools import wraps
+from flask import g, session, current_app, has_request_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy.sql.dml import UpdateBase
+
+REPLICA_PREFIX = 'replica_'
+
+def replica_reads(view):
+  @wraps(view)
+  def wrapper(*args, **kwargs):
+    g.replica_reads = True
+    return view(*args, **kwargs)
+  return wrapper
+
+'''
+primary_reads()
+    sends the rest of the request's queries to the primary, for results
+    that outlive the request and must not carry a replica's lag
+'''
+def primary_reads():
+  g.pop('replica_reads', None)
+
+def is_write(clause):
+  return isinstance(clause, UpdateBase) or getattr(clause, '_for_update_arg', None) is not None
+
+'''
+init_routing(app)
+    clears the routing state at the start of every request and sends the
+    visitor's reads to the primary for a while once they wrote something
+'''
+def init_routing(app):
+  @app.before_request
+  def reset_routing():
+    for key in ('replica_reads', 'replica', 'wrote'):
+      g.pop(key, None)
+
+  @app.after_request
+  def remember_writes(response):
+    if g.get('wrote'):
+      session['primary_until'] = time() + current_app.config.get('READ_YOUR_WRITES_SECONDS', 10)
+    return response
+
+class RoutingSession(Session):
+  """Session sending the queries of read-only requests to a replica"""
+
+  def replica(self):
+    if not has_request_context() or not g.get('replica_reads') or g.get('wrote'):
+      return None
+    if session.get('primary_until', 0) > time():
+      return None
+    if 'replica' not in g:
+      replicas = [engine for key, engine in self._db.engines.items()
+                  if key and key.startswith(REPLICA_PREFIX)]
+      g.replica = random.choice(replicas) if replicas else None
+    return g.replica
+
+  def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+    if bind is None:
+      if self._flushing or is_write(clause):
+        if has_request_context():
+          g.wrote = True
+      else:
+        replica = self.replica()
+        if replica is not None:
+          return replica
+    return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
@@ -0,0 +1,95 @@
+#----------------------------------------------------------------------------#
+# Full-text search for venues and artists.
+#----------------------------------------------------------------------------#
+
+import re
+from sqlalchemy import func, or_
+
+from portable import dialect_name
+
+SEARCH_RESULTS_PER_PAGE = 10
+
+# keeps the `search_vector` column of venues and artists in sync with the
+# searchable fields, name ranks above location which ranks above genres
+SEARCH_VECTOR_FUNCTION = '''
+CREATE OR REPLACE FUNCTION fyyur_search_vector_update() RETURNS trigger AS $$
+BEGIN
+  NEW.search_vector :=
+    setweight(to_tsvector('simple', coalesce(NEW.name, '')), 'A') ||
+    setweight(to_tsvector('simple', coalesce(NEW.city, '') || ' ' || coalesce(NEW.state, '')), 'B') ||
+    setweight(to_tsvector('simple', coalesce(array_to_string(NEW.genres, ' '), '')), 'C');
+  RETURN NEW;
+END
+$$ LANGUAGE plpgsql
+'''
+
+SEARCH_VECTOR_TRIGGER = '''
+CREATE TRIGGER {table}_search_vector_update
+BEFORE INSERT OR UPDATE ON {table}
+FOR EACH ROW EXECUTE PROCEDURE fyyur_search_vector_update()
+'''
+
+'''
+prefix_tsquery(term)
+    turns a search term into a tsquery where every word is matched as a
+    prefix, so "san fr" matches "San Francisco"
+'''
+def prefix_tsquery(term):
+  words = re.findall(r'\w+', term)
+  return ' & '.join(word + ':*' for word in words)
+
+'''
+like_pattern(term)
+    LIKE pattern matching the term anywhere, its own wildcards and escape
+    character escaped with a backslash
+'''
+def like_pattern(term):
+  return '%' + re.sub(r'([\\%_])', r'\\\1', term) + '%'
+
+'''
+search(session, model, term, page)
+    ranked, paginated search over a venue or artist model; the total match
+    count comes from the same query, or from a count of its own past the
+    last page
+'''
+def search(session, model, term, page=1, per_page=SEARCH_RESULTS_PER_PAGE):
+  page = max(page, 1)
+  query = session.query(
+      model.id, model.name,
+      model.upcoming_shows_count.label('num_upcoming_shows'),
+      func.count().over().label('total'))
+
+  words = prefix_tsquery(term)
+  if words and dialect_name(session) == 'postgresql':
+    # word prefixes hit the tsvector, the infix match on name is served
+    # by the trigram index
+    tsquery = func.to_tsquery('simple', words)
+    query = query.filter(or_(
+        model.search_vector.op('@@')(tsquery),
+        model.name.ilike(like_pattern(term), escape='\\'))).order_by(
+        func.ts_rank(model.search_vector, tsquery).desc())
+  elif term.strip():
+    # search vectors are only kept on postgres, elsewhere names are
+    # matched alone
+    query = query.filter(model.name.ilike(like_pattern(term), escape='\\'))
+
+  rows = query.order_by(model.name, model.id).limit(
+      per_page).offset((page - 1) * per_page).all()
+
+  if rows:
+    total = rows[0].total
+  elif page > 1:
+    # past the last page there is no row to carry the total
+    total = query.with_entities(func.count()).order_by(None).scalar()
+  else:
+    total = 0
+  return {
+    'count': total,
+    'page': page,
+    'pages': (total + per_page - 1) // per_page,
+    'data': [{
+      'id': row.id,
+      'name': row.name,
+      'num_upcoming_shows': row.num_upcoming_shows
+    } for row in rows]
+  }
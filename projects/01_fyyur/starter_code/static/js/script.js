@@ -2,3 +2,27 @@ window.parseISOString = function parseISOString(s) {
   var b = s.split(/\D+/);
   return new Date(Date.UTC(b[0], --b[1], b[2], b[3], b[4], b[5], b[6]));
 };
+
+// typeahead for the search bars, suggestions come from /autocomplete
+document.addEventListener('input', function (event) {
+  var input = event.target;
+  var kind = input.getAttribute('data-autocomplete');
+  if (!kind) {
+    return;
+  }
+  fetch('/autocomplete?q=' + encodeURIComponent(input.value), {
+    headers: {'Accept': 'application/json'}
+  }).then(function (response) {
+    return response.json();
+  }).then(function (data) {
+    // answers to earlier keystrokes may arrive late
+    if (input.value === data.q) {
+      input.list.innerHTML = '';
+      data[kind].forEach(function (item) {
+        var option = document.createElement('option');
+        option.value = item.name;
+        input.list.appendChild(option);
+      });
+    }
+  });
+});
@@ -0,0 +1,1132 @@
+import os
+import gzip
+import json
+import tempfile
+import queue
+import unittest
+import brotli
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from flask import Flask
+import config
+from app import (create_app, db, Venue, Artist, Show, venue_areas, fragment_cache, profiler,
+                 recommender, static_assets, change_feed, name_index, compression,
+                 change_versions, AreaRollup, GenreRollup, VenueRollup)
+from analytics import analytics_report
+from search import search
+from counters import roll_over, verify_counters
+from pagination import keyset_page, encode_cursor
+from cache import FragmentCache, LRUCache, SharedCache, LocalClient
+from formatting import format_datetime
+from benchmarks.synthetic import generate
+from partitions import partitions, partition_name, month_start, add_months
+from assets import build_assets, DIST_FOLDER
+from listings import ical_line
+from changes import ChangeFeed, PostgresChannel, LocalChannel
+from recommendations import Recommender
+from benchmarks.routes import route_cases, benchmark_ids, send
+
+# the suite runs against an in-memory SQLite database; point
+# TEST_DATABASE_URL at a Postgres database to also run the tests of the
+# Postgres only features (partitions, triggers, full-text search, NOTIFY)
+TEST_DATABASE_URL = os.getenv('TEST_DATABASE_URL', 'sqlite://')
+POSTGRES = TEST_DATABASE_URL.startswith('postgresql')
+
+app = create_app({
+  'TESTING': True,
+  'SQLALCHEMY_DATABASE_URI': TEST_DATABASE_URL,
+  # the test database stands in as a read replica
+  'SQLALCHEMY_BINDS': {'replica_1': TEST_DATABASE_URL} if POSTGRES else {},
+  # in-memory SQLite keeps a single connection
+  'SQLALCHEMY_ENGINE_OPTIONS': config.SQLALCHEMY_ENGINE_OPTIONS if POSTGRES else {},
+  # changes go through the in-process stand-in of the NOTIFY channel
+  'CHANGE_FEED': 'local'
+})
+postgres_only = unittest.skipUnless(POSTGRES, 'needs TEST_DATABASE_URL on Postgres')
+
+class QueryCounter(object):
+  """Counts the SQL statements executed on an engine, or on all of them"""
+
+  def __init__(self, engine=Engine):
+    self.engine = engine
+    self.count = 0
+
+  def callback(self, *args):
+    self.count += 1
+
+  def __enter__(self):
+    event.listen(self.engine, 'before_cursor_execute', self.callback)
+    return self
+
+  def __exit__(self, *args):
+    event.remove(self.engine, 'before_cursor_execute', self.callback)
+
+# most SQL statements a request of every route may run; the test data has
+# more rows than any budget, so a query per row goes over
+STATEMENT_BUDGETS = {
+  'index': 0, 'venues': 2, 'search_venues': 1, 'show_venue': 1, 'create_venue_form': 0,
+  'create_venue_submission': 1, 'edit_venue': 1, 'edit_venue_submission': 3,
+  'delete_venue': 4, 'delete_venues': 3, 'venue_recommendations': 2,
+  'artists': 2, 'search_artists': 1, 'show_artist': 1, 'create_artist_form': 0,
+  'create_artist_submission': 1, 'edit_artist': 1, 'edit_artist_submission': 3,
+  'delete_artist': 4, 'delete_artists': 3, 'artist_recommendations': 2,
+  'shows': 1, 'create_shows': 0, 'create_show_submission': 4, 'shows_availability': 1,
+  'calendar': 1, 'venue_calendar': 2, 'artist_calendar': 2, 'autocomplete': 2,
+  'analytics': 4, 'cache_stats': 0, 'compression_stats': 0, 'dist': 0
+}
+
+class FyyurTestCase(unittest.TestCase):
+  """This class represents the fyyur test case"""
+
+  def setUp(self):
+    """Define test variables and create the tables."""
+    self.client = app.test_client
+    self.ctx = app.app_context()
+    self.ctx.push()
+    db.drop_all()
+    db.create_all()
+    fragment_cache.clear()
+    recommender.clear()
+    name_index.clear()
+
+  def tearDown(self):
+    """Executed after reach test"""
+    db.session.remove()
+    db.drop_all()
+    self.ctx.pop()
+
+  # helper to insert venues spread over the given areas, each with one
+  # upcoming and one past show; the artist's shows are three hours apart
+  # so none of them overlap. The tables are published as changed, like the
+  # write handlers do
+  def add_venues(self, areas, per_area):
+    artist = Artist(name='artist', city='San Francisco', state='CA', genres=['Jazz'])
+    db.session.add(artist)
+    now = datetime.now().replace(microsecond=0)
+    slot = 0
+    for city, state in areas:
+      for i in range(per_area):
+        venue = Venue(name=f'{city} venue {i}', city=city, state=state, genres=['Jazz'])
+        venue.shows = [
+          Show(artist=artist, start_date=now + timedelta(days=1, hours=3 * slot)),
+          Show(artist=artist, start_date=now - timedelta(days=1, hours=3 * slot))
+        ]
+        db.session.add(venue)
+        slot += 1
+    change_feed.publish(db.session, ['venues', 'artists', 'shows'])
+    db.session.commit()
+    self.rebuild_counters()
+
+  # helper to recount the show counters of every venue and artist
+  def rebuild_counters(self, now=None):
+    now = now or datetime.now()
+    verify_counters(db.session, Venue, Show, Show.venue_id, now)
+    verify_counters(db.session, Artist, Show, Show.artist_id, now)
+    db.session.commit()
+
+  # test Every route stays within its SQL statement budget
+  def test_statement_budgets(self):
+    self.add_venues([('San Francisco', 'CA'), ('New York', 'NY'), ('Austin', 'TX')], 4)
+    ids = benchmark_ids(db, (Venue, Artist, Show), 1)
+    ids['asset'] = '/static/css/main.css'
+    cases = route_cases(ids, 1)
+    endpoints = {rule.endpoint.rpartition('.')[2] for rule in app.url_map.iter_rules()}
+    counts = {}
+    for name, (method, url, body) in cases.items():
+      with QueryCounter() as counter:
+        status = send(self.client(), method, url, body)
+      counts[name] = (status, counter.count)
+
+    # test results
+    self.assertEqual(endpoints - {'static'}, set(cases))
+    self.assertEqual(set(cases), set(STATEMENT_BUDGETS))
+    for name, (status, count) in counts.items():
+      self.assertLess(status, 400, name)
+      self.assertLessEqual(count, STATEMENT_BUDGETS[name], name)
+
+  # test Venues list grouped by area
+  def test_venue_areas(self):
+    self.add_venues([('San Francisco', 'CA'), ('New York', 'NY')], 2)
+    areas, prev_cursor, next_cursor, facets = venue_areas()
+
+    # test results
+    self.assertEqual([(area['city'], area['state']) for area in areas],
+                     [('San Francisco', 'CA'), ('New York', 'NY')])
+    self.assertIsNone(prev_cursor)
+    self.assertIsNone(next_cursor)
+    for area in areas:
+      self.assertEqual(len(area['venues']), 2)
+      for venue in area['venues']:
+        self.assertEqual(venue['num_upcoming_shows'], 1)
+
+  # test Venues list runs the same number of queries at any size
+  def test_venues_query_count(self):
+    self.add_venues([('San Francisco', 'CA')], 1)
+    with QueryCounter() as small:
+      request = self.client().get('/venues')
+    self.assertEqual(request.status_code, 200)
+
+    self.add_venues([('New York', 'NY'), ('Austin', 'TX')], 10)
+    with QueryCounter() as large:
+      request = self.client().get('/venues')
+    # the genre facets are counted once per filter set, however it is spelled
+    with QueryCounter() as again:
+      self.client().get('/venues?match=any')
+
+    # test results
+    self.assertEqual(request.status_code, 200)
+    self.assertIn(b'Austin venue 9', request.data)
+    self.assertEqual(small.count, large.count)
+    self.assertEqual(large.count, 2)
+    self.assertEqual(again.count, 1)
+
+  # test Venue and Artist pages load their shows in a single query
+  def test_detail_pages_query_count(self):
+    self.add_venues([('San Francisco', 'CA')], 3)
+    venue_id = Venue.query.first().id
+    artist_id = Artist.query.first().id
+    with QueryCounter() as venue_page:
+      venue_request = self.client().get(f'/venues/{venue_id}')
+    with QueryCounter() as artist_page:
+      artist_request = self.client().get(f'/artists/{artist_id}')
+
+    # test results
+    self.assertIn(b'1 Upcoming Show', venue_request.data)
+    self.assertIn(b'1 Past Show', venue_request.data)
+    self.assertIn(b'3 Upcoming Shows', artist_request.data)
+    self.assertIn(b'3 Past Shows', artist_request.data)
+    self.assertEqual(venue_page.count, 1)
+    self.assertEqual(artist_page.count, 1)
+
+  # test LRU cache evicts the least recently used entries and expires them
+  def test_lru_cache(self):
+    cache = LRUCache(maxsize=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+
+    # test results
+    self.assertEqual(cache.get('a'), 1)
+    self.assertIsNone(cache.get('b'))
+    cache.ttl = -1
+    cache.set('d', 4)
+    self.assertIsNone(cache.get('d'))
+
+  # test Extensions are set up from the config of the app they are built for
+  def test_app_config(self):
+    other = Flask(__name__)
+    other.config.update(FRAGMENT_CACHE='local', CHANGE_FEED='postgres', RECOMMENDATIONS_TTL=5,
+                        SQLALCHEMY_DATABASE_URI='postgresql://fyyur@db.example/other')
+    cache = FragmentCache()
+    cache.init_app(other)
+    feed = ChangeFeed(None, lambda *change: None)
+    feed.init_app(other)
+    recommendations = Recommender(Venue, Artist, Show)
+    recommendations.init_app(other)
+
+    # test results
+    self.assertIsInstance(change_feed.channel, LocalChannel)
+    self.assertIsInstance(fragment_cache.backend, LRUCache)
+    self.assertIsInstance(cache.backend, SharedCache)
+    self.assertEqual(feed.channel.url, 'postgresql://fyyur@db.example/other')
+    self.assertEqual(recommendations.ttl, 5)
+    # closed feeds leave no listener behind on the sessions
+    local = ChangeFeed(None, lambda *change: None)
+    local.init_app(app)
+    channel = local.channel
+    local.close()
+    feed.close()
+    self.assertFalse(event.contains(Session, 'after_commit', channel.deliver))
+    self.assertFalse(event.contains(Session, 'after_commit', local.committed))
+
+  # test Fragment cache invalidation on every backend
+  def test_fragment_cache(self):
+    for backend in (LRUCache(), SharedCache(LocalClient())):
+      cache = FragmentCache(backend)
+      self.assertIsNone(cache.get('venue', 1))
+      cache.set('venue', 1, 'page', cache.version('venue', 1))
+      cache.set('venue', 2, 'other page', cache.version('venue', 2))
+      self.assertEqual(cache.get('venue', 1), 'page')
+      cache.invalidate('venue', 1)
+      # rendered from rows read before an invalidation that landed meanwhile
+      version = cache.version('venue', 2)
+      cache.invalidate('venue', 2)
+      cache.set('venue', 2, 'stale page', version)
+
+      # test results
+      self.assertIsNone(cache.get('venue', 1))
+      self.assertIsNone(cache.get('venue', 2))
+      self.assertEqual(cache.stats(), {'hits': 1, 'misses': 3, 'hit_ratio': 0.25})
+      cache.set('venue', 1, 'page', cache.version('venue', 1))
+      version = cache.version('venue', 1)
+      cache.clear()
+      self.assertIsNone(cache.get('venue', 1))
+      self.assertNotEqual(cache.version('venue', 1), version)
+      self.assertEqual(cache.version('venue', 1), cache.version('venue', 1))
+
+  # test Fragment versions outlive the fragments the LRU evicts
+  def test_fragment_cache_eviction(self):
+    cache = FragmentCache(LRUCache(maxsize=2))
+    cache.invalidate('venue', 1)
+    version = cache.version('venue', 1)
+    for venue_id in range(2, 6):
+      cache.set('venue', venue_id, 'page', cache.version('venue', venue_id))
+
+    # test results
+    self.assertEqual(cache.version('venue', 1), version)
+    self.assertEqual(len(cache.backend.data), 2)
+
+  # test Venue page is cached until the venue is edited
+  def test_venue_page_cache(self):
+    self.add_venues([('San Francisco', 'CA')], 1)
+    venue_id = Venue.query.first().id
+    self.client().get(f'/venues/{venue_id}')
+    with QueryCounter() as cached:
+      request = self.client().get(f'/venues/{venue_id}')
+    self.assertEqual(cached.count, 0)
+    self.assertIn(b'San Francisco venue 0', request.data)
+
+    self.client().post(f'/venues/{venue_id}/edit', data={
+      'name': 'Renamed venue', 'city': 'San Francisco', 'state': 'CA', 'genres': ['Jazz']
+    })
+    request = self.client().get(f'/venues/{venue_id}')
+
+    # test results
+    self.assertIn(b'Renamed venue', request.data)
+    self.assertEqual(fragment_cache.stats()['hits'], 1)
+
+  # test Import command loads venues and shows in batches
+  def test_import(self):
+    runner = app.test_cli_runner()
+    directory = tempfile.mkdtemp()
+    venues_path = os.path.join(directory, 'venues.csv')
+    with open(venues_path, 'w') as f:
+      f.write('name,city,state,address,genres,website\n')
+      f.write('The Hall,Austin,TX,1 Main St,Jazz;Blues,https://hall.example\n')
+      f.write('No State,Austin,,1 Main St,Jazz,\n')
+      f.write('The Barn,Austin,TX,2 Main St,Folk,not a url\n')
+      f.write('The Cellar,Austin,TX,3 Main St,Rock n Roll,\n')
+    result = runner.invoke(args=['fyyur', 'import', 'venues', venues_path, '--batch-size', '2'])
+    self.assertIn('Imported 2 venues, rejected 2.', result.output)
+    self.assertEqual(sorted(venue.name for venue in Venue.query), ['The Cellar', 'The Hall'])
+    self.assertEqual(Venue.query.filter_by(name='The Hall').one().genres, ['Jazz', 'Blues'])
+
+    self.add_venues([], 0)
+    shows_path = os.path.join(directory, 'shows.ndjson')
+    with open(shows_path, 'w') as f:
+      for day, venue_name in enumerate(('The Hall', 'The Hall', 'Unknown', 'The Cellar')):
+        f.write(json.dumps({'venue_name': venue_name, 'artist_name': 'artist',
+                            'start_date': f'2100-01-0{day + 1} 20:00:00'}) + '\n')
+      f.write(json.dumps({'venue_name': 'The Cellar', 'artist_name': 'artist',
+                          'start_date': '2100-01-05 20:00:00', 'duration': 45}) + '\n')
+      f.write(json.dumps({'venue_name': 'The Cellar', 'artist_name': 'artist',
+                          'start_date': '2100-01-06 20:00:00',
+                          'end_date': '2100-01-06 23:30:00'}) + '\n')
+      for invalid in ({'duration': 0}, {'duration': -30}, {'end_date': '2100-01-07 19:00:00'}):
+        f.write(json.dumps(dict(invalid, venue_name='The Cellar', artist_name='artist',
+                                start_date='2100-01-07 20:00:00')) + '\n')
+      # overlapping an earlier show of the batch, then a stored show
+      f.write(json.dumps({'venue_name': 'The Hall', 'artist_name': 'other artist',
+                          'start_date': '2100-01-02 21:00:00'}) + '\n')
+      f.write(json.dumps({'venue_name': 'The Cellar', 'artist_name': 'artist',
+                          'start_date': '2100-01-09 21:00:00'}) + '\n')
+    # pretend a previous run stopped after the first record
+    with open(shows_path + '.checkpoint', 'w') as f:
+      json.dump({'records': 1}, f)
+    other = Artist(name='other artist', city='Austin', state='TX', genres=['Jazz'])
+    db.session.add(Show(venue=Venue.query.filter_by(name='The Cellar').one(), artist=other,
+                        start_date=datetime(2100, 1, 9, 20)))
+    db.session.commit()
+    result = runner.invoke(args=['fyyur', 'import', 'shows', shows_path])
+
+    # test results
+    self.assertIn('Imported 4 shows, rejected 6.', result.output)
+    self.assertIn('record 10 rejected: the venue has another show of the batch', result.output)
+    self.assertIn('record 11 rejected: the venue is already booked', result.output)
+    self.assertFalse(os.path.exists(shows_path + '.checkpoint'))
+    self.assertEqual(Venue.query.filter_by(name='The Hall').one().upcoming_shows_count, 1)
+    self.assertEqual(Artist.query.filter_by(name='artist').one().upcoming_shows_count, 4)
+    lengths = [(show.end_date - show.start_date).total_seconds() / 60
+               for show in Show.query.order_by(Show.start_date)]
+    self.assertEqual(lengths, [120, 120, 45, 210, 120])
+
+  # test Shows list streams every show in streaming mode
+  def test_shows_stream(self):
+    self.add_venues([('San Francisco', 'CA')], 30)
+    request = self.client().get('/shows?all=1')
+    self.assertTrue(request.is_streamed)
+    chunks = list(request.response)
+
+    # test results
+    self.assertIn(b'<head>', chunks[0])
+    # the head is sent before any row is rendered
+    self.assertIn(b'</head>', chunks[0])
+    self.assertNotIn(b'tile-show', chunks[0])
+    self.assertEqual(b''.join(chunks).count(b'tile-show'), 60)
+    self.assertNotIn(b'class="pager"', b''.join(chunks))
+
+  # test JSON variants are negotiated and unchanged pages answer 304 without a query
+  def test_conditional_get(self):
+    self.add_venues([('San Francisco', 'CA')], 2)
+    venue_id = Venue.query.first().id
+    json_headers = {'Accept': 'application/json'}
+    listing = self.client().get('/venues', headers=json_headers)
+    detail = self.client().get(f'/venues/{venue_id}', headers=json_headers)
+    html = self.client().get('/venues')
+    etag = listing.headers['ETag']
+    with QueryCounter() as revalidation:
+      not_modified = self.client().get('/venues', headers=dict(json_headers, **{'If-None-Match': etag}))
+    missing = self.client().get('/venues/0', headers=json_headers)
+    self.client().post('/venues/create', data={'name': 'new venue', 'city': 'Oakland',
+                                               'state': 'CA', 'genres': ['Jazz']})
+    changed = self.client().get('/venues', headers=dict(json_headers, **{'If-None-Match': etag}))
+
+    # test results
+    self.assertTrue(listing.is_json)
+    self.assertEqual([venue['name'] for venue in listing.json['areas'][0]['venues']],
+                     ['San Francisco venue 0', 'San Francisco venue 1'])
+    self.assertEqual(listing.json['facets'], [{'genre': 'Jazz', 'count': 2}])
+    self.assertEqual(detail.json['venue']['upcoming_shows_count'], 1)
+    self.assertTrue(etag.startswith('W/'))
+    self.assertIn('text/html', html.content_type)
+    self.assertNotEqual(html.headers['ETag'], etag)
+    self.assertEqual(not_modified.status_code, 304)
+    self.assertEqual(not_modified.headers['ETag'], etag)
+    self.assertEqual(revalidation.count, 0)
+    self.assertEqual(missing.status_code, 404)
+    self.assertFalse(missing.json['success'])
+    self.assertEqual(changed.status_code, 200)
+    self.assertEqual(len(changed.json['areas']), 2)
+
+  # test JSON list streams every show
+  def test_shows_json_stream(self):
+    self.add_venues([('San Francisco', 'CA')], 3)
+    request = self.client().get('/shows?all=1', headers={'Accept': 'application/json'})
+
+    # test results
+    self.assertTrue(request.is_streamed)
+    self.assertEqual(len(json.loads(request.get_data())['shows']), 6)
+
+  # test Edits reach the other workers once committed, rollbacks never do
+  def test_change_feed(self):
+    self.add_venues([('San Francisco', 'CA')], 1)
+    venue_id = Venue.query.first().id
+    artist_id = Artist.query.first().id
+    received = queue.Queue()
+    # another worker listening on the same channel
+    worker = ChangeFeed(change_feed.channel, lambda *change: received.put(change))
+    worker.start()
+    worker.subscribed.wait(5)
+    try:
+      change_feed.publish(db.session, ['shows'], [venue_id])
+      db.session.rollback()
+      self.client().post(f'/venues/{venue_id}/edit', data={
+          'name': 'renamed', 'city': 'San Francisco', 'state': 'CA', 'genres': ['Jazz']})
+      change = received.get(timeout=5)
+    finally:
+      worker.close()
+
+    # test results
+    self.assertEqual(change, (['venues'], [venue_id], [artist_id], True))
+    self.assertTrue(received.empty())
+
+  # test Changes go through Postgres NOTIFY, oversized ones without their ids
+  @postgres_only
+  def test_postgres_change_feed(self):
+    url = app.config['SQLALCHEMY_DATABASE_URI']
+    received = queue.Queue()
+    worker = ChangeFeed(PostgresChannel(url), lambda *change: received.put(change))
+    publisher = ChangeFeed(PostgresChannel(url), lambda *change: None)
+    worker.start()
+    worker.subscribed.wait(5)
+    try:
+      publisher.publish(db.session, ['shows'], [1, 2], [3])
+      db.session.commit()
+      small = received.get(timeout=5)
+      publisher.publish(db.session, ['venues'], range(2000))
+      db.session.commit()
+      large = received.get(timeout=5)
+    finally:
+      worker.close()
+      publisher.close()
+
+    # test results
+    self.assertEqual(small, (['shows'], [1, 2], [3], True))
+    self.assertEqual(large, (['venues'], None, [], True))
+
+  # test Autocomplete suggests names by prefix from memory and follows writes
+  def test_autocomplete(self):
+    self.add_venues([('San Francisco', 'CA')], 2)
+    db.session.add(Artist(name='Café Tacvba', city='Mexico', state='CA', genres=['Rock']))
+    db.session.commit()
+    first = self.client().get('/autocomplete?q=san&limit=2')
+    with QueryCounter() as lookup:
+      word = self.client().get('/autocomplete?q=VENUE 1')
+      accent = self.client().get('/autocomplete?q=cafe')
+    self.client().post('/venues/create', data={'name': 'Sanctuary', 'city': 'Oakland',
+                                               'state': 'CA', 'genres': ['Jazz']})
+    created = self.client().get('/autocomplete?q=sanc')
+    self.client().post(f'/venues/{Venue.query.filter_by(name="Sanctuary").one().id}/delete')
+    deleted = self.client().get('/autocomplete?q=sanc')
+    bad_limit = self.client().get('/autocomplete?q=san&limit=0')
+
+    # test results
+    self.assertEqual([venue['name'] for venue in first.json['venues']],
+                     ['San Francisco venue 0', 'San Francisco venue 1'])
+    self.assertEqual([venue['name'] for venue in word.json['venues']], ['San Francisco venue 1'])
+    self.assertEqual([artist['name'] for artist in accent.json['artists']], ['Café Tacvba'])
+    self.assertEqual(lookup.count, 0)
+    self.assertEqual([venue['name'] for venue in created.json['venues']], ['Sanctuary'])
+    self.assertEqual(deleted.json['venues'], [])
+    self.assertEqual(bad_limit.status_code, 400)
+
+  # test Calendar filters a date range by area and genre and groups shows by day
+  def test_calendar(self):
+    self.add_venues([('San Francisco', 'CA'), ('New York', 'NY')], 2)
+    db.session.add(Artist(name='rock band', city='New York', state='NY', genres=['Rock']))
+    db.session.commit()
+    today = datetime.now().date()
+    week = f'start={today.isoformat()}&end={(today + timedelta(days=3)).isoformat()}'
+    # streamed responses are read before the next request
+    area = self.client().get(f'/calendar?{week}&city=New York&state=ny').json
+    ndjson = self.client().get(f'/calendar?{week}', headers={'Accept': 'application/x-ndjson'})
+    mimetype = ndjson.mimetype
+    days = [json.loads(line) for line in ndjson.get_data(as_text=True).splitlines()]
+    genre = self.client().get(f'/calendar?{week}&genre=Rock').json
+    past = self.client().get(
+        f'/calendar?start={(today - timedelta(days=3)).isoformat()}&end={today.isoformat()}').json
+    too_long = self.client().get(
+        f'/calendar?start={today.isoformat()}&end={(today + timedelta(days=400)).isoformat()}')
+
+    # test results
+    shows = [show for day in area['days'] for show in day['shows']]
+    self.assertEqual({show['city'] for show in shows}, {'New York'})
+    self.assertEqual(len(shows), 2)
+    self.assertEqual(mimetype, 'application/x-ndjson')
+    self.assertEqual(sum(len(day['shows']) for day in days), 4)
+    self.assertEqual([day['date'] for day in days], sorted({day['date'] for day in days}))
+    for day in days:
+      self.assertTrue(all(show['start_date'].startswith(day['date']) for show in day['shows']))
+    self.assertEqual(genre['days'], [])
+    self.assertEqual(sum(len(day['shows']) for day in past['days']), 4)
+    self.assertEqual(too_long.status_code, 400)
+
+  # test iCalendar feeds hold the upcoming shows of a venue or an artist
+  def test_ical_feed(self):
+    self.add_venues([('San Francisco', 'CA')], 2)
+    venue = Venue.query.first()
+    venue.address = '1 Main St, Suite 2'
+    db.session.commit()
+    venue_feed = self.client().get(f'/venues/{venue.id}/calendar.ics')
+    text = venue_feed.get_data(as_text=True)
+    artist_feed = self.client().get(f'/artists/{Artist.query.first().id}/calendar.ics')
+    artist_text = artist_feed.get_data(as_text=True)
+    missing = self.client().get('/venues/0/calendar.ics')
+
+    # test results
+    self.assertEqual(venue_feed.mimetype, 'text/calendar')
+    self.assertTrue(text.startswith('BEGIN:VCALENDAR\r\n') and text.endswith('END:VCALENDAR\r\n'))
+    self.assertEqual(text.count('BEGIN:VEVENT'), 1)
+    self.assertIn('LOCATION:San Francisco venue 0\\, 1 Main St\\, Suite 2', text)
+    self.assertEqual(artist_text.count('BEGIN:VEVENT'), 2)
+    self.assertEqual(missing.status_code, 404)
+    folded = ical_line('SUMMARY:' + 'é' * 80)
+    self.assertTrue(all(len(line.encode()) <= 75 for line in folded.split('\r\n')))
+    self.assertEqual(folded.replace('\r\n ', ''), 'SUMMARY:' + 'é' * 80 + '\r\n')
+
+  # test ETags of date dependent views follow the date and the negotiated variant
+  def test_daily_etags(self):
+    self.add_venues([('San Francisco', 'CA')], 1)
+    feed_url = f'/venues/{Venue.query.first().id}/calendar.ics'
+    calendar = self.client().get('/calendar', headers={'Accept': 'application/json'})
+    calendar.get_data()
+    browser = self.client().get('/calendar', headers={
+      'Accept': 'application/json, text/plain;q=0.5', 'If-None-Match': calendar.headers['ETag']})
+    ndjson = self.client().get('/calendar', headers={'Accept': 'application/x-ndjson'})
+    ndjson.get_data()
+    feed = self.client().get(feed_url)
+    feed.get_data()
+    today = change_versions.today
+    # two days on, the show of tomorrow is out of the window
+    change_versions.today = lambda: today() + timedelta(days=2)
+    try:
+      next_day = self.client().get('/calendar', headers={
+        'Accept': 'application/json', 'If-None-Match': calendar.headers['ETag']})
+      days = next_day.json['days']
+      next_feed = self.client().get(feed_url, headers={'If-None-Match': feed.headers['ETag']})
+      next_feed.get_data()
+    finally:
+      change_versions.today = today
+
+    # test results
+    self.assertEqual(browser.status_code, 304)
+    self.assertNotEqual(ndjson.headers['ETag'], calendar.headers['ETag'])
+    self.assertEqual(next_day.status_code, 200)
+    self.assertEqual(days, [])
+    self.assertEqual(next_feed.status_code, 200)
+
+  # test Profiler logs the statements of a request and flags budget overruns
+  def test_profiler(self):
+    self.add_venues([('San Francisco', 'CA')], 1)
+    budget = app.config['PROFILE_STATEMENT_BUDGET']
+    with self.assertLogs(app.logger, 'INFO') as logs:
+      self.client().get('/venues')
+    self.assertIn('GET /venues 200', logs.output[0])
+    # the page and its genre facets
+    self.assertIn('sql=2', logs.output[0])
+    self.assertIn('slowest=', logs.output[0])
+
+    profiler.statement_budget = 0
+    try:
+      with self.assertLogs(app.logger, 'WARNING') as logs:
+        self.client().get('/venues')
+    finally:
+      profiler.statement_budget = budget
+
+    # test results
+    self.assertIn('over statement budget', logs.output[0])
+
+  # test Datetime filter accepts datetimes and date strings
+  def test_format_datetime(self):
+    value = datetime(2035, 4, 1, 20, 0)
+
+    # test results
+    self.assertEqual(format_datetime(value, 'full'), 'Sunday April, 1, 2035 at 8:00PM')
+    self.assertEqual(format_datetime('2035-04-01 20:00:00', 'full'), 'Sunday April, 1, 2035 at 8:00PM')
+    self.assertEqual(format_datetime('April 1 2035 8pm', 'medium'), 'Sun 04, 01, 2035 8:00PM')
+
+  # test Keyset pagination walks forward and back over the shows
+  def test_keyset_page(self):
+    self.add_venues([('San Francisco', 'CA')], 5)
+    query = db.session.query(Show.id, Show.start_date)
+    columns = [Show.start_date, Show.id]
+    ordered = [show.id for show in query.order_by(Show.start_date, Show.id)]
+
+    # test results
+    first, prev_cursor, next_cursor = keyset_page(query, columns, per_page=4)
+    self.assertEqual([show.id for show in first], ordered[:4])
+    self.assertIsNone(prev_cursor)
+    second, prev_cursor, next_cursor = keyset_page(query, columns, after=next_cursor, per_page=4)
+    self.assertEqual([show.id for show in second], ordered[4:8])
+    last, _, end_cursor = keyset_page(query, columns, after=next_cursor, per_page=4)
+    self.assertEqual([show.id for show in last], ordered[8:])
+    self.assertIsNone(end_cursor)
+    back, prev_cursor, _ = keyset_page(query, columns, before=prev_cursor, per_page=4)
+    self.assertEqual([show.id for show in back], ordered[:4])
+    self.assertIsNone(prev_cursor)
+
+  # test Shows list rejects a malformed cursor
+  def test_shows_bad_cursor(self):
+    request = self.client().get('/shows?after=garbage')
+    # well-formed cursors holding values of the wrong types
+    wrong_types = [self.client().get(f'/shows?after={encode_cursor(values)}').status_code
+                   for values in ([5, 1], ['2030-01-01T00:00:00', '1'],
+                                  ['2030-01-01T00:00:00', [1]], ['2030-01-01T00:00:00', True])]
+    venues = self.client().get(f'/venues?before={encode_cursor(["CA", "SF", {}, 1])}')
+
+    # test results
+    self.assertEqual(request.status_code, 400)
+    self.assertEqual(wrong_types, [400, 400, 400, 400])
+    self.assertEqual(venues.status_code, 400)
+
+  # test Venues list filters by genre and location with facet counts
+  def test_venues_filters(self):
+    self.add_venues([('San Francisco', 'CA')], 1)
+    db.session.add_all([
+      Venue(name='Jazz and Blues', city='Austin', state='TX', genres=['Jazz', 'Blues']),
+      Venue(name='Blues only', city='Austin', state='TX', genres=['Blues'])
+    ])
+    db.session.commit()
+    names = lambda request: [name for name in ('San Francisco venue 0', 'Jazz and Blues', 'Blues only')
+                             if name.encode() in request.data]
+
+    # test results
+    request = self.client().get('/venues?genre=Jazz&genre=Blues')
+    self.assertEqual(names(request), ['San Francisco venue 0', 'Jazz and Blues', 'Blues only'])
+    self.assertIn(b'Blues (2)', request.data)
+    self.assertIn(b'Jazz (2)', request.data)
+    request = self.client().get('/venues?genre=Jazz&genre=Blues&match=all')
+    self.assertEqual(names(request), ['Jazz and Blues'])
+    request = self.client().get('/venues?genre=Blues&state=tx&city=Austin')
+    self.assertEqual(names(request), ['Jazz and Blues', 'Blues only'])
+    self.assertIn(b'Jazz (1)', request.data)
+    request = self.client().get('/artists?genre=Folk')
+    self.assertNotIn(b'/artists/1"', request.data)
+    self.assertIn(b'Folk (0)', request.data)
+    # a page past the last one still has the facets of its filters
+    request = self.client().get(f'/venues?genre=Blues&after={encode_cursor(["ZZ", "", "", 0])}',
+                                headers={'Accept': 'application/json'})
+    self.assertEqual(request.json['areas'], [])
+    self.assertIn({'genre': 'Blues', 'count': 2}, request.json['facets'])
+
+  # test Search Venues ranks name matches and matches city and genres
+  @postgres_only
+  def test_search_venues(self):
+    self.add_venues([('San Francisco', 'CA'), ('New York', 'NY')], 3)
+    db.session.add(Venue(name='The Jazz Club', city='Austin', state='TX', genres=['Rock n Roll']))
+    db.session.commit()
+
+    # test results
+    results = search(db.session, Venue, 'jazz')
+    self.assertEqual(results['count'], 7)
+    self.assertEqual(results['data'][0]['name'], 'The Jazz Club')
+    self.assertEqual(results['data'][1]['num_upcoming_shows'], 1)
+    results = search(db.session, Venue, 'new yo', per_page=2, page=2)
+    self.assertEqual(results['count'], 3)
+    self.assertEqual(results['pages'], 2)
+    self.assertEqual([venue['name'] for venue in results['data']], ['New York venue 2'])
+    results = search(db.session, Venue, 'new yo', per_page=2, page=5)
+    self.assertEqual((results['count'], results['pages'], results['data']), (3, 2, []))
+    db.session.add(Venue(name='100% Jazz_Bar\\', city='Austin', state='TX', genres=['Jazz']))
+    db.session.commit()
+    for term in ('%', '_', '\\'):
+      results = search(db.session, Venue, term)
+      self.assertEqual([venue['name'] for venue in results['data']], ['100% Jazz_Bar\\'], term)
+
+  # test Search Artists through the search bar
+  def test_search_artists(self):
+    self.add_venues([('San Francisco', 'CA')], 1)
+    request = self.client().post('/artists/search', data={'search_term': 'ART'})
+
+    # test results
+    self.assertEqual(request.status_code, 200)
+    self.assertIn(b'"ART": 1', request.data)
+
+  # test Create Show updates the show counters
+  def test_create_show_counters(self):
+    self.add_venues([('San Francisco', 'CA')], 1)
+    venue_id = Venue.query.first().id
+    artist_id = Artist.query.first().id
+    start_date = datetime.now() + timedelta(hours=1)
+    self.client().post('/shows/create', data={
+      'venue_id': venue_id,
+      'artist_id': artist_id,
+      'start_date': start_date.strftime('%Y-%m-%d %H:%M:%S')
+    })
+
+    # test results
+    venue = Venue.query.get(venue_id)
+    self.assertEqual(venue.upcoming_shows_count, 2)
+    self.assertEqual(venue.past_shows_count, 1)
+    self.assertEqual(venue.next_show_date, start_date.replace(microsecond=0))
+    self.assertEqual(verify_counters(db.session, Venue, Show, Show.venue_id, datetime.now()), [])
+
+  # test Overlapping shows are rejected for the venue and the artist
+  def test_create_show_double_booking(self):
+    self.add_venues([('San Francisco', 'CA')], 1)
+    venue = Venue.query.first()
+    venue_id = venue.id
+    booked = venue.shows[0].start_date + timedelta(hours=1)
+    other = Venue(name='other venue', city='San Francisco', state='CA', genres=['Jazz'])
+    db.session.add(other)
+    db.session.commit()
+    other_id = other.id
+    artist_id = Artist.query.first().id
+
+    res = self.client().post('/shows/create', data={
+      'venue_id': venue_id,
+      'artist_id': artist_id,
+      'start_date': booked.strftime('%Y-%m-%d %H:%M:%S'),
+      'duration': 60
+    })
+    self.assertIn(b'already booked', res.data)
+    # the artist is booked elsewhere too
+    res = self.client().post('/shows/create', data={
+      'venue_id': other_id,
+      'artist_id': artist_id,
+      'start_date': booked.strftime('%Y-%m-%d %H:%M:%S')
+    })
+    self.assertIn(b'already booked', res.data)
+    # right after the booked show ends
+    res = self.client().post('/shows/create', data={
+      'venue_id': venue_id,
+      'artist_id': artist_id,
+      'start_date': (booked + timedelta(hours=1)).strftime('%Y-%m-%d %H:%M:%S'),
+      'duration': 60
+    })
+    self.assertIn(b'successfully listed', res.data)
+    self.assertEqual(Show.query.filter_by(venue_id=venue_id).count(), 3)
+
+  # test Availability of many probes is checked with one query
+  def test_shows_availability(self):
+    self.add_venues([('San Francisco', 'CA')], 2)
+    venue = Venue.query.order_by(Venue.id).first()
+    # the upcoming show, the artist's next one is three hours later
+    show = max(venue.shows, key=lambda show: show.start_date)
+    booked = show.start_date
+    probes = [
+      {'venue_id': venue.id, 'start_date': booked.isoformat(), 'duration': 30},
+      {'venue_id': venue.id, 'artist_id': show.artist_id,
+       'start_date': (booked + timedelta(hours=2)).isoformat(),
+       'end_date': (booked + timedelta(hours=3)).isoformat()},
+      {'artist_id': show.artist_id,
+       'start_date': (booked + timedelta(hours=3)).isoformat()}
+    ]
+    with QueryCounter() as counter:
+      res = self.client().post('/shows/availability', json={'probes': probes})
+    data = json.loads(res.data)
+
+    # test results
+    self.assertEqual(res.status_code, 200)
+    self.assertEqual(counter.count, 1)
+    self.assertEqual(data['availability'], [
+      {'venue_available': False, 'artist_available': True},
+      {'venue_available': True, 'artist_available': True},
+      {'venue_available': True, 'artist_available': False}
+    ])
+    res = self.client().post('/shows/availability', json={'probes': [{'venue_id': 1}]})
+    self.assertEqual(res.status_code, 400)
+
+  # test Shows that don't end after they start are rejected
+  def test_show_dates_validation(self):
+    self.add_venues([('San Francisco', 'CA')], 1)
+    venue_id = Venue.query.first().id
+    artist_id = Artist.query.first().id
+    start = datetime(2200, 1, 1, 20)
+    probes = [
+      {'venue_id': venue_id, 'start_date': start.isoformat(), 'duration': 0},
+      {'venue_id': venue_id, 'start_date': start.isoformat(), 'duration': -30},
+      {'venue_id': venue_id, 'start_date': start.isoformat(), 'end_date': start.isoformat()},
+      {'venue_id': venue_id, 'start_date': start.isoformat(),
+       'end_date': (start - timedelta(hours=1)).isoformat()}
+    ]
+    statuses = [self.client().post('/shows/availability', json={'probes': [probe]}).status_code
+                for probe in probes]
+    submissions = [self.client().post('/shows/create', data={
+      'venue_id': venue_id, 'artist_id': artist_id,
+      'start_date': start.strftime('%Y-%m-%d %H:%M:%S'), 'duration': duration
+    }) for duration in (0, -30)]
+
+    # test results
+    self.assertEqual(statuses, [400, 400, 400, 400])
+    self.assertEqual([res.status_code for res in submissions], [400, 400])
+    self.assertIn(b'positive duration', submissions[0].data)
+    self.assertEqual(Show.query.count(), 2)
+
+  # test Recommended artists rank genre and location matches first and
+  # follow edits without a rebuild
+  def test_recommendations(self):
+    venue = Venue(name='venue', city='San Francisco', state='CA', genres=['Jazz', 'Blues'])
+    near = Artist(name='near', city='San Francisco', state='CA', genres=['Jazz'])
+    far = Artist(name='far', city='New York', state='NY', genres=['Jazz', 'Blues'])
+    other = Artist(name='other', city='New York', state='NY', genres=['Rock n Roll'])
+    db.session.add_all([venue, near, far, other])
+    db.session.commit()
+    venue_id, other_id = venue.id, other.id
+
+    res = self.client().get(f'/venues/{venue_id}/recommendations')
+    data = json.loads(res.data)
+    self.assertEqual(res.status_code, 200)
+    self.assertEqual([artist['name'] for artist in data['artists']], ['near', 'far', 'other'])
+    res = self.client().get(f'/artists/{other_id}/recommendations?k=1')
+    self.assertEqual([venue['name'] for venue in json.loads(res.data)['venues']], ['venue'])
+
+    # other moves to San Francisco and plays jazz and blues
+    other = Artist.query.get(other_id)
+    other.city, other.state, other.genres = 'San Francisco', 'CA', ['Jazz', 'Blues']
+    db.session.commit()
+    recommender.refresh('artist', other_id)
+    with QueryCounter() as counter:
+      res = self.client().get(f'/venues/{venue_id}/recommendations?k=2')
+    self.assertEqual(counter.count, 1)
+    self.assertEqual([artist['name'] for artist in json.loads(res.data)['artists']], ['other', 'near'])
+
+    # deleted artists are dropped
+    db.session.delete(Artist.query.get(other_id))
+    db.session.commit()
+    recommender.refresh('artist', other_id)
+    res = self.client().get(f'/venues/{venue_id}/recommendations')
+    self.assertEqual([artist['name'] for artist in json.loads(res.data)['artists']], ['near', 'far'])
+    self.assertEqual(self.client().get(f'/artists/{other_id}/recommendations').status_code, 404)
+
+  # test Synthetic data is deterministic and fits the booking constraints
+  @postgres_only
+  def test_synthetic_data(self):
+    scale = {'venues': 5, 'artists': 8, 'shows': 40}
+    now = datetime(2030, 1, 1)
+    generate(db.session, (Venue, Artist, Show), scale, seed=3, now=now, report=lambda line: None)
+    first = [(show.venue.name, show.artist.name, show.start_date)
+             for show in Show.query.order_by(Show.id)]
+    self.assertEqual(len(first), 40)
+
+    db.session.remove()
+    db.drop_all()
+    db.create_all()
+    generate(db.session, (Venue, Artist, Show), scale, seed=3, now=now, report=lambda line: None)
+    self.assertEqual([(show.venue.name, show.artist.name, show.start_date)
+                      for show in Show.query.order_by(Show.id)], first)
+    self.assertEqual(verify_counters(db.session, Venue, Show, Show.venue_id, datetime.now()), [])
+
+  # test Read-only pages query the replica until the visitor writes
+  @postgres_only
+  def test_replica_routing(self):
+    self.add_venues([('San Francisco', 'CA')], 1)
+    venue = Venue.query.first()
+    venue_id, data = venue.id, {'name': 'renamed', 'city': venue.city, 'state': venue.state,
+                                'genres': venue.genres}
+    client = self.client()
+
+    with QueryCounter(db.engine) as primary, QueryCounter(db.engines['replica_1']) as replica:
+      client.get('/venues')
+      client.post('/venues/search', data={'search_term': 'venue'})
+    # the cached genre facets are counted on the primary
+    self.assertEqual((primary.count, replica.count), (1, 2))
+
+    with QueryCounter(db.engine) as primary, QueryCounter(db.engines['replica_1']) as replica:
+      client.post(f'/venues/{venue_id}/edit', data=data)
+    self.assertEqual(replica.count, 0)
+    # read your writes
+    with QueryCounter(db.engine) as primary, QueryCounter(db.engines['replica_1']) as replica:
+      res = client.get(f'/venues/{venue_id}')
+    self.assertIn(b'renamed', res.data)
+    self.assertEqual((primary.count, replica.count), (1, 0))
+    # other visitors read from the replica
+    with QueryCounter(db.engine) as primary, QueryCounter(db.engines['replica_1']) as replica:
+      self.client().get('/artists')
+    self.assertEqual((primary.count, replica.count), (1, 1))
+    # pages going into the fragment cache are rendered from the primary
+    fragment_cache.clear()
+    with QueryCounter(db.engine) as primary, QueryCounter(db.engines['replica_1']) as replica:
+      self.client().get(f'/venues/{venue_id}')
+    self.assertEqual(replica.count, 0)
+    with QueryCounter(db.engine) as primary, QueryCounter(db.engines['replica_1']) as replica:
+      self.client().get(f'/venues/{venue_id}', headers={'Accept': 'application/json'})
+    self.assertEqual(primary.count, 0)
+
+  # test Deleting a venue drops its shows server-side and recounts the artist
+  def test_delete_venue(self):
+    self.add_venues([('San Francisco', 'CA')], 2)
+    venue_id, other_id = [venue.id for venue in Venue.query.order_by(Venue.id)]
+    artist_id = Artist.query.first().id
+
+    with QueryCounter() as counter:
+      res = self.client().post(f'/venues/{venue_id}/delete')
+    self.assertIn(b'successfully deleted', res.data)
+    # name, artists of the shows, delete, artist recount
+    self.assertEqual(counter.count, 4)
+    self.assertIsNone(db.session.get(Venue, venue_id))
+    self.assertEqual(Show.query.count(), 2)
+    artist = db.session.get(Artist, artist_id)
+    self.assertEqual((artist.upcoming_shows_count, artist.past_shows_count), (1, 1))
+    self.assertEqual(verify_counters(db.session, Artist, Show, Show.artist_id, datetime.now()), [])
+
+  # test Bulk delete removes many artists with their shows
+  def test_delete_artists(self):
+    self.add_venues([('San Francisco', 'CA')], 2)
+    artist_id = Artist.query.first().id
+    res = self.client().post('/artists/delete', json={'ids': [artist_id, 999]})
+    data = json.loads(res.data)
+
+    # test results
+    self.assertEqual(res.status_code, 200)
+    self.assertEqual(data['deleted'], [artist_id])
+    self.assertEqual(Show.query.count(), 0)
+    self.assertEqual([venue.upcoming_shows_count for venue in Venue.query], [0, 0])
+    self.assertEqual(self.client().post('/artists/delete', json={'ids': ['x']}).status_code, 400)
+    # a failing delete is rolled back and logged
+    def fail(conn, cursor, statement, *args):
+      if statement.startswith('DELETE FROM artists'):
+        raise RuntimeError('database went away')
+    event.listen(Engine, 'before_cursor_execute', fail)
+    try:
+      with self.assertLogs(app.logger, 'ERROR') as logs:
+        failed = self.client().post('/artists/delete', json={'ids': [1]})
+    finally:
+      event.remove(Engine, 'before_cursor_execute', fail)
+    self.assertEqual(failed.status_code, 422)
+    self.assertIn('bulk delete of artists failed', logs.output[0])
+
+  # test Partitions are split out of the default one and old months archived
+  @postgres_only
+  def test_partitions(self):
+    self.add_venues([('San Francisco', 'CA')], 2)
+    venue = Venue.query.order_by(Venue.id).first()
+    venue_id = venue.id
+    old = datetime.now() - timedelta(days=400)
+    db.session.add(Show(venue=venue, artist=Artist.query.first(), start_date=old))
+    db.session.commit()
+    self.rebuild_counters()
+    runner = app.test_cli_runner()
+
+    result = runner.invoke(args=['fyyur', 'partitions', '--ahead', '2'])
+    current = month_start(datetime.now())
+    self.assertIn(f'Created {partition_name(current)}.', result.output)
+    self.assertIn(partition_name(month_start(old)), result.output)
+    self.assertTrue({current, add_months(current, 2), month_start(old)} <= set(partitions(db.session)))
+    self.assertEqual(db.session.execute(db.text('SELECT count(*) FROM shows_default')).scalar(), 0)
+    self.assertEqual(Show.query.count(), 5)
+    # upcoming shows only scan partitions from the current month on
+    plan = '\n'.join(db.session.execute(db.text(
+        f"EXPLAIN SELECT * FROM shows WHERE start_date > '{datetime.now().isoformat()}'")).scalars())
+    self.assertNotIn(partition_name(month_start(old)), plan)
+    db.session.commit()
+
+    result = runner.invoke(args=['fyyur', 'partitions', '--archive-after', '12'])
+    self.assertIn(f'Archived {partition_name(month_start(old))}.', result.output)
+    self.assertEqual(Show.query.count(), 4)
+    self.assertEqual(db.session.get(Venue, venue_id).past_shows_count, 1)
+    db.session.execute(db.text('DROP SCHEMA archive CASCADE'))
+    db.session.commit()
+
+  # test Rollups are refreshed for the changed months only and read alone
+  @postgres_only
+  def test_analytics_rollups(self):
+    artist = Artist(name='artist', city='San Francisco', state='CA', genres=['Jazz', 'Blues'])
+    sf = Venue(name='sf venue', city='San Francisco', state='CA', genres=['Jazz'])
+    ny = Venue(name='ny venue', city='New York', state='NY', genres=['Jazz'])
+    january, february = datetime(2025, 1, 1), datetime(2025, 2, 1)
+    for day, (venue, start) in enumerate(((sf, january), (ny, january), (sf, february))):
+      db.session.add(Show(venue=venue, artist=artist, start_date=start + timedelta(days=day),
+                          end_date=start + timedelta(days=day, hours=2)))
+    db.session.commit()
+    runner = app.test_cli_runner()
+    dirty = lambda: sorted(db.session.execute(db.text('SELECT month FROM rollup_dirty_months')).scalars())
+
+    self.assertEqual(dirty(), [january, february])
+    self.assertIn('Refreshed 2 months.', runner.invoke(args=['fyyur', 'rollups']).output)
+    self.assertIn('Refreshed 0 months.', runner.invoke(args=['fyyur', 'rollups']).output)
+    db.session.add(Show(venue=sf, artist=artist, start_date=february + timedelta(days=10),
+                        end_date=february + timedelta(days=10, hours=2)))
+    db.session.commit()
+    self.assertEqual(dirty(), [february])
+    runner.invoke(args=['fyyur', 'rollups'])
+    artist.genres = ['Jazz']
+    db.session.commit()
+    self.assertEqual(dirty(), [january, february])
+    runner.invoke(args=['fyyur', 'rollups'])
+    db.session.commit()
+
+    statements = []
+    capture = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(Engine, 'before_cursor_execute', capture)
+    try:
+      res = self.client().get('/analytics?from=2025-01&to=2025-02', headers={'Accept': 'application/json'})
+      page = self.client().get('/analytics?from=2025-01&to=2025-02&state=NY')
+    finally:
+      event.remove(Engine, 'before_cursor_execute', capture)
+    data = res.json
+
+    # test results
+    self.assertEqual(data['months'], [{'month': '2025-01', 'shows': 2, 'venues': 2},
+                                      {'month': '2025-02', 'shows': 2, 'venues': 1}])
+    self.assertEqual(data['genres'], [{'genre': 'Jazz', 'shows': 4}])
+    self.assertEqual(analytics_report(db.session, (AreaRollup, GenreRollup, VenueRollup),
+                                      january, february, {'state': '', 'city': ''}, top=0),
+                     {'months': data['months'], 'areas': [], 'genres': [], 'venues': []})
+    self.assertEqual(data['areas'][0], {'state': 'CA', 'city': 'San Francisco', 'shows': 3})
+    self.assertEqual(data['venues'][0]['name'], 'sf venue')
+    self.assertAlmostEqual(data['venues'][0]['utilization'], 6 * 60 / ((31 + 28) * 24 * 60), 4)
+    self.assertEqual(page.status_code, 200)
+    self.assertIn('ny venue', page.get_data(as_text=True))
+    self.assertNotIn('sf venue', page.get_data(as_text=True))
+    self.assertEqual(len(statements), 8)
+    self.assertTrue(all('FROM rollup_' in statement and 'JOIN' not in statement
+                        for statement in statements))
+    self.assertEqual(self.client().get('/analytics?from=2025-03&to=2025-01').status_code, 400)
+    self.assertEqual(self.client().get('/analytics?to=9999-12').status_code, 400)
+    self.assertEqual(self.client().get('/analytics?from=0001-01&to=9999-11').status_code, 400)
+    self.assertEqual(self.client().get('/analytics?to=0001-06').status_code, 400)
+
+  # test Built assets are fingerprinted, precompressed and cached for good
+  def test_static_assets(self):
+    with tempfile.TemporaryDirectory() as static:
+      os.makedirs(os.path.join(static, 'css'))
+      os.makedirs(os.path.join(static, 'fonts'))
+      with open(os.path.join(static, 'css', 'main.css'), 'w') as f:
+        f.write("/* theme */\nbody {\n  color: red;\n  src: url('../fonts/icons.ttf?v=1');\n}\n")
+      with open(os.path.join(static, 'fonts', 'icons.ttf'), 'wb') as f:
+        f.write(b'font' * 100)
+      manifest = build_assets(static, report=lambda message: None)
+      folder = static_assets.folder
+      static_assets.load(os.path.join(static, DIST_FOLDER))
+      try:
+        with app.test_request_context():
+          url = app.url_for('static', filename='css/main.css')
+        response = self.client().get(url, headers={'Accept-Encoding': 'gzip, br'})
+        manifest_response = self.client().get(f'/static/{DIST_FOLDER}/manifest.json')
+      finally:
+        static_assets.load(folder)
+
+    # test results
+    self.assertEqual(url, f'/static/{DIST_FOLDER}/{manifest["css/main.css"]}')
+    self.assertRegex(manifest['css/main.css'], r'^css/main\.[0-9a-f]{12}\.css$')
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(response.content_encoding, 'br')
+    self.assertIn('Accept-Encoding', response.vary)
+    self.assertTrue(response.cache_control.immutable)
+    self.assertEqual(response.cache_control.max_age, 365 * 24 * 60 * 60)
+    css = brotli.decompress(response.get_data()).decode()
+    self.assertEqual(css, f"body{{color:red;src:url('../{manifest['fonts/icons.ttf']}?v=1')}}")
+    self.assertEqual(manifest_response.status_code, 404)
+
+  # test Text responses are compressed whole or as they stream, small ones are not
+  def test_response_compression(self):
+    self.add_venues([('San Francisco', 'CA')], 30)
+    compression.clear()
+    plain = self.client().get('/venues')
+    page = self.client().get('/venues', headers={'Accept-Encoding': 'gzip'})
+    preferred = self.client().get('/venues', headers={'Accept-Encoding': 'gzip, br;q=0'})
+    stream = self.client().get('/shows?all=1', headers={'Accept-Encoding': 'br, gzip'})
+    chunks = list(stream.response)
+    stream.close()
+    small = self.client().get('/autocomplete?q=zz', headers={'Accept-Encoding': 'gzip'})
+    stats = compression.stats()
+
+    # test results
+    self.assertIsNone(plain.content_encoding)
+    self.assertIn('Accept-Encoding', plain.vary)
+    self.assertEqual(page.content_encoding, 'gzip')
+    self.assertEqual(gzip.decompress(page.get_data()), plain.get_data())
+    self.assertEqual(int(page.headers['Content-Length']), len(page.get_data()))
+    self.assertEqual(preferred.content_encoding, 'gzip')
+    self.assertTrue(stream.is_streamed)
+    self.assertEqual(stream.content_encoding, 'br')
+    self.assertNotIn('Content-Length', stream.headers)
+    # every chunk decompresses on its own as soon as it arrives
+    decompressor = brotli.Decompressor()
+    first = decompressor.process(chunks[0])
+    self.assertIn(b'<head>', first)
+    html = first + b''.join(decompressor.process(chunk) for chunk in chunks[1:])
+    self.assertEqual(html.count(b'tile-show'), 60)
+    self.assertIsNone(small.content_encoding)
+    self.assertEqual(stats['gzip']['responses'], 2)
+    self.assertEqual(stats['br']['responses'], 1)
+    self.assertGreater(stats['gzip']['ratio'], 2)
+    self.assertGreaterEqual(stats['br']['cpu_time'], 0)
+
+  # test Roll-over moves started shows to the past counters
+  def test_roll_over_counters(self):
+    self.add_venues([('San Francisco', 'CA'), ('New York', 'NY')], 2)
+    later = datetime.now() + timedelta(days=2)
+    self.assertEqual(roll_over(db.session, Venue, Show, Show.venue_id, later), 4)
+    self.assertEqual(roll_over(db.session, Artist, Show, Show.artist_id, later), 1)
+    db.session.commit()
+
+    # test results
+    for venue in Venue.query.all():
+      self.assertEqual((venue.upcoming_shows_count, venue.past_shows_count), (0, 2))
+      self.assertIsNone(venue.next_show_date)
+    self.assertEqual(Artist.query.first().past_shows_count, 8)
+    self.assertEqual(verify_counters(db.session, Venue, Show, Show.venue_id, later), [])
+
+  # test Verify counters reports and repairs drift
+  def test_verify_counters(self):
+    self.add_venues([('San Francisco', 'CA')], 1)
+    venue = Venue.query.first()
+    venue.upcoming_shows_count = 5
+    db.session.commit()
+    drift = verify_counters(db.session, Venue, Show, Show.venue_id, datetime.now())
+
+    # test results
+    self.assertEqual(len(drift), 1)
+    self.assertEqual(drift[0][0], venue.id)
+    self.assertEqual(drift[0][1][0], 5)
+    self.assertEqual(drift[0][2][0], 1)
+    self.assertEqual(Venue.query.get(venue.id).upcoming_shows_count, 1)
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+  unittest.main()